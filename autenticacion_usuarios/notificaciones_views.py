@@ -345,51 +345,64 @@ def crear_notificacion_automatica(usuario, titulo, mensaje, tipo='info', priorid
         return None
 
 
-def notificar_stock_bajo():
-    """Crear notificaciones para productos con stock bajo (solo para administradores)"""
-    try:
-        # Obtener productos con stock bajo (menos de 10 unidades)
-        productos_stock_bajo = Producto.objects.filter(
-            stock__cantidad__lt=10,
-            stock__cantidad__gt=0
-        ).select_related('stock')[:20]  # Limitar a 20 para no saturar
-        
-        if not productos_stock_bajo.exists():
-            return
-        
-        # Obtener administradores
-        try:
-            rol_admin = Rol.objects.filter(nombre__icontains='admin').first()
-            if rol_admin:
-                administradores = Usuario.objects.filter(id_rol=rol_admin)
-            else:
-                administradores = Usuario.objects.filter(id_rol__nombre__icontains='admin')
-        except:
-            return
-        
-        # Crear notificaciones para cada administrador
-        for admin in administradores:
-            productos_lista = []
-            for producto in productos_stock_bajo[:5]:  # Limitar a 5 productos por notificación
-                stock = producto.stock.first() if hasattr(producto, 'stock') else None
-                if stock:
-                    productos_lista.append(f"{producto.nombre} ({stock.cantidad} unidades)")
-            
-            if productos_lista:
-                mensaje = f"Productos con stock bajo: {', '.join(productos_lista)}"
-                if len(productos_stock_bajo) > 5:
-                    mensaje += f" y {len(productos_stock_bajo) - 5} más..."
-                
-                crear_notificacion_automatica(
-                    usuario=admin,
-                    titulo="⚠️ Stock Bajo",
-                    mensaje=mensaje,
-                    tipo='stock',
-                    prioridad='alta'
-                )
-        
-    except Exception as e:
-        logger.error(f"Error en notificar_stock_bajo: {str(e)}")
+def _administradores():
+    rol_admin = Rol.objects.filter(nombre__icontains='admin').first()
+    if rol_admin:
+        return Usuario.objects.filter(id_rol=rol_admin)
+    return Usuario.objects.filter(id_rol__nombre__icontains='admin')
+
+
+def notificar_stock_bajo(producto_ids):
+    """
+    Avisar a los administradores que los productos indicados bajaron de su
+    stock mínimo. La ejecuta la bandeja de salida
+    (productos.inventario.enviar_alerta_stock_bajo); si falla, lanza la
+    excepción para que el evento se reintente.
+    """
+    productos_stock_bajo = list(
+        Producto.objects.filter(id__in=producto_ids).select_related('stock').order_by('stock__cantidad')
+    )
+    if not productos_stock_bajo:
+        return
+
+    productos_lista = [
+        f"{producto.nombre} ({producto.stock.cantidad} unidades, mínimo {producto.stock.stock_minimo})"
+        for producto in productos_stock_bajo[:5]  # Limitar a 5 productos por notificación
+    ]
+    mensaje = f"Productos con stock bajo: {', '.join(productos_lista)}"
+    if len(productos_stock_bajo) > 5:
+        mensaje += f" y {len(productos_stock_bajo) - 5} más..."
+
+    # Una notificación por administrador, en un solo INSERT
+    Notificacion.objects.bulk_create([
+        Notificacion(
+            titulo="⚠️ Stock Bajo",
+            mensaje=mensaje,
+            tipo='stock',
+            prioridad='alta',
+            id_usuario=admin
+        )
+        for admin in _administradores()
+    ])
+
+
+def notificar_pago_sin_stock(venta_id, motivo):
+    """
+    Avisar a los administradores que un pago con Stripe se cobró sin stock
+    para la venta: queda pendiente hasta reponer el stock o reembolsar. La
+    ejecuta la bandeja de salida; si falla, lanza la excepción para que el
+    evento se reintente.
+    """
+    Notificacion.objects.bulk_create([
+        Notificacion(
+            titulo="🚨 Pago sin stock",
+            mensaje=f"Venta #{venta_id} pagada con Stripe sin stock suficiente ({motivo}). Reponer el stock o reembolsar el pago.",
+            tipo='venta',
+            prioridad='alta',
+            id_usuario=admin
+        )
+        for admin in _administradores()
+    ])
 
 
 def notificar_nueva_venta(venta):
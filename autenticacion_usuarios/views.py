@@ -13,9 +13,11 @@ from .models import Usuario, Rol, Bitacora, Cliente
 # Importar modelos de ventas si existen
 try:
     from ventas_carrito.models import Venta, DetalleVenta
+    from ventas_carrito.carrito import persistir_carrito_anonimo
 except ImportError:
     Venta = None
     DetalleVenta = None
+    persistir_carrito_anonimo = None
 
 logger = logging.getLogger(__name__)
 
@@ -121,7 +123,14 @@ class LoginView(View):
                     response_data['user']['direccion'] = cliente.direccion
                     response_data['user']['ciudad'] = cliente.ciudad
                 except:
-                    pass  # Si no tiene registro de cliente, no pasa nada
+                    cliente = None  # Si no tiene registro de cliente, no pasa nada
+                
+                # El carrito armado como visitante pasa a la BD
+                if cliente and persistir_carrito_anonimo:
+                    try:
+                        persistir_carrito_anonimo(request.session.session_key, cliente)
+                    except Exception as e:
+                        logger.warning(f"No se pudo guardar el carrito del visitante: {str(e)}")
             
             return JsonResponse(response_data, status=200)
             
@@ -420,6 +429,13 @@ class RegisterView(View):
             request.session['user_nombre'] = usuario.nombre
             request.session['user_rol'] = nombre_rol
             request.session['is_authenticated'] = True
+            
+            # El carrito armado como visitante pasa a la BD
+            if cliente and persistir_carrito_anonimo:
+                try:
+                    persistir_carrito_anonimo(request.session.session_key, cliente)
+                except Exception as e:
+                    logger.warning(f"No se pudo guardar el carrito del visitante: {str(e)}")
 
             # Respuesta exitosa
             return JsonResponse({
@@ -6,7 +6,7 @@ Configurado para Render + PostgreSQL.
 
 import os
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 import dj_database_url
 
 # -------------------------------
@@ -27,9 +27,16 @@ ALLOWED_HOSTS = ['*']  # luego puedes restringir a tu dominio o *.onrender.com
 # API KEYS EXTERNAS
 # -------------------------------
 API_KEY_IMGBB = config('API_KEY_IMGBB', default='')
+# Reemplazable por un servidor local en pruebas
+IMGBB_UPLOAD_URL = config('IMGBB_UPLOAD_URL', default='https://api.imgbb.com/1/upload')
+IMAGENES_WORKERS = config('IMAGENES_WORKERS', default=2, cast=int)
+# Hosts de los que se descargan originales para generar miniaturas (ImgBB)
+MINIATURAS_HOSTS = config('MINIATURAS_HOSTS', default='i.ibb.co', cast=Csv())
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
+# Reemplazable por un servidor local en pruebas (stripe-mock)
+STRIPE_API_BASE = config('STRIPE_API_BASE', default='https://api.stripe.com')
 
 # -------------------------------
 # APLICACIONES INSTALADAS
@@ -42,6 +49,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # búsqueda de texto completo y trigramas
 
     # Django REST Framework y CORS
     'rest_framework',
@@ -148,6 +156,64 @@ else:
     }
 
 
+# -------------------------------
+# CACHÉ
+# -------------------------------
+# Con varios workers de gunicorn se necesita una caché compartida (Redis)
+# para que la versión del catálogo sea la misma en todos los procesos.
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        # Carritos de visitantes (ventas_carrito.carrito.CarritoAnonimo)
+        'carritos': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'carritos',
+        },
+    }
+    # Sesiones leídas desde Redis (la BD queda como respaldo): junto con los
+    # carritos de visitantes en caché, navegar sin cuenta no consulta PostgreSQL
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'smart-cache',
+        },
+        # Solo por proceso y se pierde al reiniciar: por eso sin Redis los
+        # carritos de visitantes van a la BD (CARRITO_ANONIMO_EN_CACHE)
+        'carritos': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'smart-carritos',
+            'OPTIONS': {'MAX_ENTRIES': 100_000},
+        },
+    }
+
+# Segundos que se conserva una respuesta del catálogo (se invalida antes por versión)
+CATALOGO_CACHE_TIMEOUT = config('CATALOGO_CACHE_TIMEOUT', default=600, cast=int)
+
+# Horas durante las que no se repite la alerta de stock bajo de un producto
+ALERTA_STOCK_VENTANA_HORAS = config('ALERTA_STOCK_VENTANA_HORAS', default=24, cast=int)
+
+# Carritos de visitantes: con Redis se guardan en la caché `carritos` y solo
+# pasan a la BD al iniciar sesión o comprar. Sin Redis (o con False) se usa
+# la tabla carrito: la caché local no sobrevive a un reinicio.
+CARRITO_ANONIMO_EN_CACHE = config('CARRITO_ANONIMO_EN_CACHE', default=bool(REDIS_URL), cast=bool)
+# Segundos sin actividad tras los que se descarta un carrito de visitante
+CARRITO_ANONIMO_TIMEOUT = config('CARRITO_ANONIMO_TIMEOUT', default=60 * 60 * 24 * 7, cast=int)
+# Días sin actividad tras los que limpiar_carritos_abandonados elimina un carrito de visitante en la BD
+CARRITO_ABANDONADO_DIAS = config('CARRITO_ABANDONADO_DIAS', default=30, cast=int)
+
+# Hilos que ejecutan los eventos posteriores a la venta (notificación y
+# comprobante); con 0 solo los ejecuta el comando procesar_eventos
+EVENTOS_WORKERS = config('EVENTOS_WORKERS', default=2, cast=int)
+
+
 # -------------------------------
 # VALIDACIÓN DE CONTRASEÑAS
 # -------------------------------
@@ -0,0 +1,171 @@
+"""
+Trabajos en segundo plano compartidos por las subidas de imágenes
+(productos.imagenes) y la bandeja de salida (ventas_carrito.eventos).
+
+Cada cola es una tabla con `estado` (pendiente / procesando / completado /
+fallido), `intentos`, `error` y `fecha_actualizacion`. Los registros
+confirmados se envían a un pool de hilos (se crea al primer uso; 0 hilos =
+ninguno) y un comando de mantenimiento (`ComandoCola`) toma los pendientes,
+los fallidos y los que quedaron a medias. Un registro se reclama con un
+UPDATE condicional, así dos workers nunca procesan el mismo.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Un registro en 'procesando' más tiempo que esto se considera abandonado
+PROCESANDO_EXPIRA = timedelta(minutes=10)
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def cantidad_workers(ajuste):
+    """Hilos configurados en el ajuste `ajuste` (2 por defecto)"""
+    return getattr(settings, ajuste, 2)
+
+
+def obtener_pool(nombre, ajuste):
+    """Pool de hilos `nombre`, con tantos hilos como indique el ajuste `ajuste`"""
+    with _lock:
+        if nombre not in _pools:
+            _pools[nombre] = ThreadPoolExecutor(max_workers=cantidad_workers(ajuste), thread_name_prefix=nombre)
+    return _pools[nombre]
+
+
+def ejecutar_en_hilo(descripcion, funcion, *args):
+    """Ejecutar `funcion` en un hilo del pool con conexiones a la base limpias"""
+    close_old_connections()
+    try:
+        return funcion(*args)
+    except Exception as e:
+        logger.error(f"Error procesando {descripcion}: {str(e)}", exc_info=True)
+    finally:
+        close_old_connections()
+
+
+class ColaTrabajos:
+    """
+    Cola respaldada por `modelo`. `ejecutar(registro)` hace el trabajo y
+    lanza una de `errores` si falla (el registro queda en `fallido` para
+    reintentarlo; cualquier otra excepción también, pero se registra con su
+    traza); `al_completar(registro)` corre después de guardar el registro
+    completado.
+    """
+
+    def __init__(self, modelo, ejecutar, nombre, ajuste_workers, completado='completado', fallido='fallido',
+                 errores=(Exception,), campos=(), al_completar=None):
+        self.modelo = modelo
+        self.ejecutar = ejecutar
+        self.nombre = nombre
+        self.ajuste_workers = ajuste_workers
+        self.completado = completado
+        self.fallido = fallido
+        self.errores = errores
+        self.campos = list(campos)
+        self.al_completar = al_completar
+
+    @property
+    def pk(self):
+        return self.modelo._meta.pk.name
+
+    # ------------------------------------------------------
+    # Encolado
+    # ------------------------------------------------------
+
+    def encolar_al_confirmar(self, ids):
+        """Encolar `ids` cuando la transacción actual confirme (sin hilos, los toma el comando)"""
+        if cantidad_workers(self.ajuste_workers) > 0:
+            transaction.on_commit(lambda: self.encolar(ids))
+
+    def encolar(self, ids):
+        pool = obtener_pool(self.nombre, self.ajuste_workers)
+        for registro_id in ids:
+            pool.submit(ejecutar_en_hilo, f'{self.nombre} {registro_id}', self.procesar, registro_id)
+
+    # ------------------------------------------------------
+    # Procesamiento
+    # ------------------------------------------------------
+
+    def reintentables(self):
+        """Pendientes, fallidos o abandonados en 'procesando'"""
+        vencidos = timezone.now() - PROCESANDO_EXPIRA
+        return Q(estado__in=['pendiente', self.fallido]) | Q(estado='procesando', fecha_actualizacion__lt=vencidos)
+
+    def tomar(self, registro_id):
+        """Marcar el registro como 'procesando' solo si ningún otro worker lo tomó"""
+        return self.modelo.objects.filter(self.reintentables(), **{self.pk: registro_id}).update(
+            estado='procesando', fecha_actualizacion=timezone.now()
+        )
+
+    def procesar(self, registro_id):
+        """Ejecutar un registro pendiente; devuelve el registro actualizado"""
+        if not self.tomar(registro_id):
+            return self.modelo.objects.filter(**{self.pk: registro_id}).first()
+
+        registro = self.modelo.objects.get(**{self.pk: registro_id})
+        registro.intentos += 1
+        try:
+            self.ejecutar(registro)
+            registro.estado = self.completado
+            registro.error = None
+        except self.errores as e:
+            logger.warning(f"{self.nombre} {registro_id} fallido (intento {registro.intentos}): {str(e)}")
+            registro.estado = self.fallido
+            registro.error = str(e)
+        except Exception as e:
+            # Un error inesperado también cuenta como intento: si no, el registro quedaría
+            # en 'procesando' y --max-intentos nunca lo descartaría
+            logger.error(f"{self.nombre} {registro_id} falló inesperadamente: {str(e)}", exc_info=True)
+            registro.estado = self.fallido
+            registro.error = str(e)
+        registro.save(update_fields=['estado', 'intentos', 'error', 'fecha_actualizacion', *self.campos])
+
+        if registro.estado == self.completado and self.al_completar:
+            self.al_completar(registro)
+        return registro
+
+    def pendientes(self, max_intentos):
+        """Ids que el worker debe (re)intentar, en orden de llegada"""
+        return self.modelo.objects.filter(
+            self.reintentables(), intentos__lt=max_intentos
+        ).order_by('fecha_creacion', self.pk).values_list(self.pk, flat=True)
+
+
+class ComandoCola(BaseCommand):
+    """Comando de mantenimiento de una ColaTrabajos (úsese desde cron o en bucle con --intervalo)"""
+    cola = None
+    resumen = 'Completados: {completados} | Fallidos: {fallidos}'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-intentos', type=int, default=5, help='No reintentar registros con más intentos')
+        parser.add_argument('--intervalo', type=int, default=0, help='Segundos entre pasadas; 0 = una sola pasada')
+
+    def describir(self, registro):
+        return f'#{registro.pk}'
+
+    def handle(self, *args, **options):
+        while True:
+            completados = fallidos = 0
+            for registro_id in list(self.cola.pendientes(options['max_intentos'])):
+                registro = self.cola.procesar(registro_id)
+                if registro and registro.estado == self.cola.completado:
+                    completados += 1
+                elif registro and registro.estado == self.cola.fallido:
+                    fallidos += 1
+                    self.stdout.write(self.style.WARNING(f"{self.describir(registro)}: {registro.error}"))
+
+            self.stdout.write(self.style.SUCCESS(self.resumen.format(completados=completados, fallidos=fallidos)))
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ProductosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'productos'
+
+    def ready(self):
+        # Registrar señales de invalidación de la caché del catálogo
+        from . import signals  # noqa: F401
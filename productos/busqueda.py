@@ -0,0 +1,103 @@
+"""
+Búsqueda de productos (CU7).
+En PostgreSQL usa el tsvector `Producto.busqueda` (config 'spanish', índice GIN)
+con ranking por relevancia; en otros motores (SQLite en desarrollo) mantiene
+el filtro icontains sobre nombre y descripción.
+El autocompletado usa el índice de trigramas (pg_trgm) sobre producto.nombre.
+"""
+import re
+
+from django.db import connection
+from django.db.models import F, Q, Case, When, Value, IntegerField
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+
+from .models import Producto
+
+CONFIG_BUSQUEDA = 'spanish'
+AUTOCOMPLETADO_MIN_CARACTERES = 2
+AUTOCOMPLETADO_LIMITE_DEFAULT = 8
+AUTOCOMPLETADO_LIMITE_MAX = 20
+
+_pg_trgm_instalado = None
+
+
+def busqueda_texto_disponible():
+    """La búsqueda de texto completo solo existe en PostgreSQL"""
+    return connection.vendor == 'postgresql'
+
+
+def _terminos(query):
+    """Palabras del texto buscado sin caracteres especiales de tsquery"""
+    return re.findall(r'\w+', query.lower())
+
+
+def construir_tsquery(query):
+    """
+    Consulta por prefijo para cada palabra ('lapt hp' -> 'lapt:* & hp:*'),
+    de modo que la búsqueda funcione mientras el usuario escribe.
+    """
+    terminos = _terminos(query)
+    if not terminos:
+        return None
+    return SearchQuery(
+        ' & '.join(f'{t}:*' for t in terminos),
+        config=CONFIG_BUSQUEDA,
+        search_type='raw',
+    )
+
+
+def buscar_productos(productos, query):
+    """
+    Filtrar por texto. En PostgreSQL anota `relevancia` (ts_rank) para
+    poder ordenar por ella con ordenar_catalogo(..., 'relevancia').
+    """
+    if busqueda_texto_disponible():
+        tsquery = construir_tsquery(query)
+        if tsquery is None:
+            return productos.none()
+        return productos.filter(busqueda=tsquery).annotate(
+            relevancia=SearchRank(F('busqueda'), tsquery)
+        )
+
+    return productos.filter(Q(nombre__icontains=query) | Q(descripcion__icontains=query))
+
+
+def trigramas_disponibles():
+    """pg_trgm instalado en la BD (se consulta una vez por proceso)"""
+    global _pg_trgm_instalado
+    if not busqueda_texto_disponible():
+        return False
+    if _pg_trgm_instalado is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _pg_trgm_instalado = cursor.fetchone() is not None
+    return _pg_trgm_instalado
+
+
+def autocompletar_productos(texto, limite=AUTOCOMPLETADO_LIMITE_DEFAULT):
+    """
+    Nombres de productos más parecidos a `texto`, tolerando errores de tipeo.
+    Ambas condiciones (ILIKE y `<%`) usan el índice GIN producto_nombre_trgm.
+    """
+    texto = texto.strip()
+    if len(texto) < AUTOCOMPLETADO_MIN_CARACTERES:
+        return []
+
+    productos = Producto.objects.all()
+    if trigramas_disponibles():
+        productos = productos.filter(
+            Q(nombre__icontains=texto) | Q(nombre__trigram_word_similar=texto)
+        ).annotate(
+            similitud=TrigramWordSimilarity(texto, 'nombre')
+        ).order_by('-similitud', 'nombre')
+    else:
+        # Sin pg_trgm: coincidencias por prefijo primero, luego por contenido
+        productos = productos.filter(nombre__icontains=texto).annotate(
+            similitud=Case(
+                When(nombre__istartswith=texto, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        ).order_by('-similitud', 'nombre')
+
+    return list(productos.values('id', 'nombre', 'imagen')[:limite])
@@ -0,0 +1,74 @@
+"""
+Caché de respuestas del catálogo (productos y categorías).
+Las claves incluyen un número de versión del catálogo; cualquier escritura
+sobre productos, categorías, marcas, proveedores o stock incrementa la
+versión, de modo que las respuestas anteriores dejan de usarse sin tener
+que borrarlas una por una.
+"""
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+CLAVE_VERSION = 'catalogo:version'
+
+
+def _timeout():
+    return getattr(settings, 'CATALOGO_CACHE_TIMEOUT', 600)
+
+
+def version_catalogo():
+    """Versión actual del catálogo (se inicializa en 1)"""
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, 1, None)
+        version = cache.get(CLAVE_VERSION, 1)
+    return version
+
+
+def invalidar_catalogo():
+    """Incrementar la versión del catálogo tras una escritura"""
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        # La clave no existía (caché reiniciada): cualquier valor nuevo sirve
+        cache.add(CLAVE_VERSION, 2, None)
+
+
+def clave_catalogo(prefijo, params=None):
+    """Clave versionada a partir del query string normalizado (parámetros ordenados)"""
+    normalizado = ''
+    if params is not None:
+        # Los valores vacíos se conservan: ?cursor= activa otro modo de paginación
+        normalizado = urlencode(sorted(
+            (k, v) for k in params for v in params.getlist(k)
+        ))
+    resumen = hashlib.md5(normalizado.encode('utf-8')).hexdigest()
+    return f'catalogo:{version_catalogo()}:{prefijo}:{resumen}'
+
+
+def cache_catalogo(prefijo):
+    """
+    Decorador para métodos GET de vistas del catálogo. Guarda el cuerpo de
+    las respuestas 200 y lo sirve mientras la versión del catálogo no cambie.
+    """
+    def decorador(metodo):
+        @wraps(metodo)
+        def envoltura(self, request, *args, **kwargs):
+            clave = clave_catalogo(prefijo, request.GET)
+            contenido = cache.get(clave)
+            if contenido is not None:
+                response = HttpResponse(contenido, content_type='application/json')
+                response['X-Cache'] = 'HIT'
+                return response
+
+            response = metodo(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(clave, response.content, _timeout())
+                response['X-Cache'] = 'MISS'
+            return response
+        return envoltura
+    return decorador
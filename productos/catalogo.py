@@ -0,0 +1,313 @@
+"""
+Capa de consultas del catálogo de productos (CU6, CU7).
+Arma la página del catálogo en una sola consulta: stock, categoría, marca
+y proveedor se traen con JOIN.
+También ofrece paginación por cursor (keyset) para el listado público,
+conteos por facetas para los filtros del catálogo y conteos de productos
+por categoría para el menú.
+"""
+import base64
+import binascii
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.http import QueryDict
+from django.db.models import Q, F, Value, CharField, Count, Case, When
+from django.db.models.functions import Coalesce
+
+from .models import Producto, Categoria
+from .busqueda import buscar_productos
+from .cache_catalogo import clave_catalogo
+from .miniaturas import urls_miniaturas
+
+logger = logging.getLogger(__name__)
+
+ORDENAMIENTOS_VALIDOS = ['nombre', 'precio', '-precio']
+PAGE_SIZE_DEFAULT = 100
+
+
+def expresion_stock_actual():
+    """Cantidad en stock del producto (0 si no tiene registro), por LEFT JOIN"""
+    return Coalesce(F('stock__cantidad'), Value(0))
+
+
+def productos_con_stock(queryset=None):
+    """Queryset de productos con relaciones y stock anotado en `stock_cantidad`"""
+    if queryset is None:
+        queryset = Producto.objects.all()
+
+    # El tsvector de búsqueda solo se usa en el WHERE/ORDER BY: no traerlo con cada fila
+    return queryset.select_related('categoria', 'marca', 'proveedor').defer('busqueda').annotate(
+        stock_cantidad=expresion_stock_actual()
+    )
+
+
+def categorias_con_conteos():
+    """
+    Categorías con `productos_count` y `productos_en_stock` anotados.
+    Una sola consulta agrupada (JOIN con producto y stock).
+    """
+    return Categoria.objects.annotate(
+        productos_count=Count('producto'),
+        productos_en_stock=Count('producto', filter=Q(producto__stock__cantidad__gt=0)),
+    ).order_by('nombre')
+
+
+def filtrar_catalogo(productos, params, filtrar_precio=True):
+    """Aplicar los filtros CU7 (q, categoria, min, max) recibidos por GET"""
+    query = params.get('q')
+    categoria_nombre = params.get('categoria')
+
+    if query:
+        productos = buscar_productos(productos, query)
+
+    if categoria_nombre and categoria_nombre != 'Todos':
+        productos = productos.filter(categoria__nombre__iexact=categoria_nombre)
+
+    if filtrar_precio:
+        min_precio = params.get('min')
+        max_precio = params.get('max')
+
+        if min_precio:
+            try:
+                productos = productos.filter(precio__gte=float(min_precio))
+            except ValueError:
+                pass
+
+        if max_precio:
+            try:
+                productos = productos.filter(precio__lte=float(max_precio))
+            except ValueError:
+                pass
+
+    return productos
+
+
+def ordenar_catalogo(productos, order_by):
+    """Ordenar por uno de los criterios soportados (por defecto 'nombre')"""
+    if order_by == 'relevancia':
+        # Solo hay ranking si la búsqueda de texto completo anotó la relevancia
+        if 'relevancia' in productos.query.annotations:
+            return productos.order_by('-relevancia', 'nombre')
+        order_by = 'nombre'
+    if order_by not in ORDENAMIENTOS_VALIDOS:
+        order_by = 'nombre'
+    return productos.order_by(order_by)
+
+
+def obtener_paginacion(params):
+    """Leer page y page_size del request con los valores por defecto del catálogo"""
+    try:
+        page = int(params.get('page', 1))
+        page_size = int(params.get('page_size', PAGE_SIZE_DEFAULT))
+    except ValueError:
+        page = 1
+        page_size = PAGE_SIZE_DEFAULT
+    return page, page_size
+
+
+def serializar_producto(p):
+    """Convertir un producto de `productos_con_stock` al formato del catálogo"""
+    precio_valor = 0.0
+    try:
+        if p.precio is not None:
+            precio_valor = float(p.precio)
+    except (ValueError, TypeError):
+        logger.warning(f"Precio inválido para producto {p.id}: {p.precio}")
+
+    return {
+        'id': p.id,
+        'nombre': p.nombre or '',
+        'descripcion': p.descripcion or '',
+        'precio': precio_valor,
+        'stock': getattr(p, 'stock_cantidad', 0) or 0,
+        'imagen': p.imagen or '',
+        'miniaturas': urls_miniaturas(p),
+        'categoria': p.categoria.nombre if p.categoria_id and p.categoria else None,
+        'marca': p.marca.nombre if p.marca_id and p.marca else None,
+        'proveedor': p.proveedor.nombre if p.proveedor_id and p.proveedor else None,
+        'estado': True,
+    }
+
+
+def serializar_pagina(productos):
+    """Serializar una página ya evaluada, sin consultas adicionales por producto"""
+    data = []
+    for p in productos:
+        try:
+            data.append(serializar_producto(p))
+        except Exception as e:
+            # Si hay error con un producto, loguear pero continuar con los demás
+            logger.error(f"Error procesando producto {p.id} (nombre: {getattr(p, 'nombre', 'N/A')}): {str(e)}", exc_info=True)
+            data.append({
+                'id': p.id,
+                'nombre': getattr(p, 'nombre', 'Producto sin nombre') or 'Producto sin nombre',
+                'descripcion': getattr(p, 'descripcion', '') or '',
+                'precio': 0.0,
+                'stock': 0,
+                'imagen': getattr(p, 'imagen', '') or '',
+                'miniaturas': {},
+                'categoria': None,
+                'marca': None,
+                'proveedor': None,
+                'estado': True,
+            })
+    return data
+
+
+# ==========================================================
+# PAGINACIÓN POR CURSOR (KEYSET)
+# ==========================================================
+
+TOTAL_CACHE_TIMEOUT = 300  # respaldo; la versión del catálogo invalida antes
+
+
+class CursorInvalido(ValueError):
+    """El cursor recibido no corresponde a un cursor emitido por el catálogo"""
+
+
+def _campo_orden(order_by):
+    if order_by not in ORDENAMIENTOS_VALIDOS:
+        order_by = 'nombre'
+    return order_by.lstrip('-'), order_by.startswith('-')
+
+
+def codificar_cursor(producto, order_by):
+    """Cursor opaco con la clave de orden y el id del último producto de la página"""
+    campo, _ = _campo_orden(order_by)
+    valor = getattr(producto, campo)
+    payload = json.dumps([order_by, str(valor) if valor is not None else None, producto.id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor, order_by):
+    """Devuelve (valor, id) del cursor o lanza CursorInvalido"""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        orden, valor, ultimo_id = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        ultimo_id = int(ultimo_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise CursorInvalido('Cursor inválido')
+    if valor is not None and not isinstance(valor, str):
+        raise CursorInvalido('Cursor inválido')
+
+    if orden != order_by:
+        raise CursorInvalido('El cursor no corresponde al ordenamiento solicitado')
+
+    campo, _ = _campo_orden(order_by)
+    if campo == 'precio' and valor is not None:
+        try:
+            valor = Decimal(valor)
+        except InvalidOperation:
+            raise CursorInvalido('Cursor inválido')
+        if not valor.is_finite():
+            raise CursorInvalido('Cursor inválido')
+    return valor, ultimo_id
+
+
+def paginar_por_cursor(productos, order_by, cursor, page_size):
+    """
+    Página siguiente a `cursor` usando la clave (campo de orden, id).
+    Devuelve (lista de productos, next_cursor o None).
+    """
+    campo, descendente = _campo_orden(order_by)
+    orden_id = '-id' if descendente else 'id'
+    productos = productos.order_by(f'-{campo}' if descendente else campo, orden_id)
+
+    if cursor:
+        valor, ultimo_id = decodificar_cursor(cursor, order_by)
+        operador = 'lt' if descendente else 'gt'
+        productos = productos.filter(
+            Q(**{f'{campo}__{operador}': valor}) |
+            Q(**{campo: valor, f'id__{operador}': ultimo_id})
+        )
+
+    # Un registro extra indica si existe una página siguiente
+    pagina = list(productos[:page_size + 1])
+    next_cursor = None
+    if len(pagina) > page_size:
+        pagina = pagina[:page_size]
+        next_cursor = codificar_cursor(pagina[-1], order_by)
+    return pagina, next_cursor
+
+
+def total_cacheado(productos, params):
+    """Total de productos para un filtro, reutilizado mientras no cambie el catálogo"""
+    filtros = QueryDict(mutable=True)
+    for k in ('q', 'categoria', 'min', 'max'):
+        filtros[k] = params.get(k, '')
+    clave = clave_catalogo('total', filtros)
+
+    total = cache.get(clave)
+    if total is None:
+        total = productos.count()
+        cache.set(clave, total, TOTAL_CACHE_TIMEOUT)
+    return total
+
+
+# ==========================================================
+# FACETAS (conteos por categoría, marca y rango de precio)
+# ==========================================================
+
+# (etiqueta, mínimo incluido, máximo excluido); None = sin límite
+RANGOS_PRECIO = [
+    ('0-100', None, 100),
+    ('100-500', 100, 500),
+    ('500-1000', 500, 1000),
+    ('1000-5000', 1000, 5000),
+    ('5000+', 5000, None),
+]
+
+
+def _rango_precio_expr():
+    condiciones = []
+    for etiqueta, minimo, maximo in RANGOS_PRECIO:
+        filtro = {}
+        if minimo is not None:
+            filtro['precio__gte'] = minimo
+        if maximo is not None:
+            filtro['precio__lt'] = maximo
+        condiciones.append(When(then=Value(etiqueta), **filtro))
+    return Case(*condiciones, default=Value(None), output_field=CharField())
+
+
+def facetas_catalogo(params):
+    """
+    Conteos de productos por categoría, marca y rango de precio para los
+    filtros CU7 recibidos. Una sola consulta agrupada por las tres
+    dimensiones; los totales de cada faceta se suman en Python.
+    """
+    productos = filtrar_catalogo(Producto.objects.all(), params)
+    filas = productos.annotate(rango_precio=_rango_precio_expr()).values(
+        'categoria__nombre', 'marca__nombre', 'rango_precio'
+    ).annotate(total=Count('id')).order_by()
+
+    categorias, marcas, precios = {}, {}, {}
+    total = 0
+    for fila in filas:
+        total += fila['total']
+        for conteos, clave in ((categorias, fila['categoria__nombre']),
+                               (marcas, fila['marca__nombre']),
+                               (precios, fila['rango_precio'])):
+            conteos[clave] = conteos.get(clave, 0) + fila['total']
+
+    def _lista(conteos):
+        # Más productos primero; los productos sin valor ("None") al final
+        return [
+            {'nombre': nombre, 'total': cantidad}
+            for nombre, cantidad in sorted(
+                conteos.items(), key=lambda x: (x[0] is None, -x[1], x[0] or '')
+            )
+        ]
+
+    return {
+        'total': total,
+        'categorias': _lista(categorias),
+        'marcas': _lista(marcas),
+        'precios': [
+            {'rango': etiqueta, 'min': minimo, 'max': maximo, 'total': precios.get(etiqueta, 0)}
+            for etiqueta, minimo, maximo in RANGOS_PRECIO
+        ],
+    }
@@ -0,0 +1,76 @@
+"""
+Exportación del catálogo completo en streaming (NDJSON o CSV).
+Recorre los productos con `.iterator()` (cursor del servidor en PostgreSQL)
+y va entregando el texto por bloques, así la memoria no crece con el tamaño
+del catálogo y el primer byte sale de inmediato.
+
+Columnas: id, nombre, descripcion, precio, imagen, categoria, marca,
+proveedor, stock (compatibles con la importación masiva).
+"""
+import csv
+import json
+import logging
+
+from .models import Producto
+from .catalogo import filtrar_catalogo, expresion_stock_actual
+
+logger = logging.getLogger(__name__)
+
+FORMATOS_EXPORTACION = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+COLUMNAS_EXPORTACION = ['id', 'nombre', 'descripcion', 'precio', 'imagen', 'categoria', 'marca', 'proveedor', 'stock']
+TAMANO_CHUNK = 2000
+# Líneas que se juntan antes de entregar un bloque al servidor
+LINEAS_POR_BLOQUE = 500
+
+
+def productos_para_exportar(params=None):
+    """Tuplas en el orden de COLUMNAS_EXPORTACION, con los filtros CU7 opcionales"""
+    productos = Producto.objects.all()
+    if params is not None:
+        productos = filtrar_catalogo(productos, params)
+    return productos.annotate(
+        stock_cantidad=expresion_stock_actual()
+    ).order_by('id').values_list(
+        'id', 'nombre', 'descripcion', 'precio', 'imagen',
+        'categoria__nombre', 'marca__nombre', 'proveedor__nombre', 'stock_cantidad',
+    ).iterator(chunk_size=TAMANO_CHUNK)
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve la línea en lugar de guardarla"""
+    def write(self, valor):
+        return valor
+
+
+def _lineas_ndjson(filas):
+    for fila in filas:
+        registro = dict(zip(COLUMNAS_EXPORTACION, fila))
+        registro['precio'] = float(registro['precio']) if registro['precio'] is not None else None
+        yield json.dumps(registro, ensure_ascii=False) + '\n'
+
+
+def _lineas_csv(filas):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(COLUMNAS_EXPORTACION)
+    for fila in filas:
+        yield escritor.writerow(['' if v is None else v for v in fila])
+
+
+def exportar_catalogo(formato, params=None):
+    """Generador de bloques de texto para StreamingHttpResponse"""
+    lineas = _lineas_csv if formato == 'csv' else _lineas_ndjson
+    bloque = []
+    try:
+        for linea in lineas(productos_para_exportar(params)):
+            bloque.append(linea)
+            if len(bloque) >= LINEAS_POR_BLOQUE:
+                yield ''.join(bloque)
+                bloque = []
+        yield ''.join(bloque)
+    except Exception as e:
+        # La respuesta ya empezó: solo queda registrar el error y cortar
+        logger.error(f"Error exportando catálogo ({formato}): {str(e)}", exc_info=True)
+        raise
@@ -0,0 +1,145 @@
+"""
+Subida de imágenes de productos en segundo plano.
+La vista guarda el archivo en el storage local y responde de inmediato; un
+pool de hilos lo envía al hosting (ImgBB) con una sesión HTTP compartida y
+reintentos (cola `SUBIDAS` de backend_smart.trabajos). El comando
+`procesar_subidas_imagenes` retoma las subidas que quedaron pendientes (por
+ejemplo, tras reiniciar el servidor).
+"""
+import base64
+import logging
+import threading
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from backend_smart.trabajos import ColaTrabajos
+from .models import SubidaImagen
+
+logger = logging.getLogger(__name__)
+
+TIPOS_PERMITIDOS = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
+TAMANO_MAXIMO = 32 * 1024 * 1024  # 32MB máximo para ImgBB gratuito
+EXTENSIONES = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif', 'image/webp': 'webp'}
+
+_session = None
+_lock = threading.Lock()
+
+
+class ErrorSubida(Exception):
+    """El hosting rechazó la imagen o no respondió correctamente"""
+
+
+def _config(nombre, default):
+    return getattr(settings, nombre, default)
+
+
+def obtener_session():
+    """Sesión HTTP compartida: conexiones reutilizadas y reintentos con backoff"""
+    global _session
+    with _lock:
+        if _session is None:
+            reintentos = Retry(
+                total=_config('IMAGENES_REINTENTOS_HTTP', 3),
+                backoff_factor=1,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=['POST'],
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=reintentos)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+# ==========================================================
+# RECEPCIÓN
+# ==========================================================
+
+def validar_imagen(archivo):
+    """Devuelve un mensaje de error o None si la imagen es válida"""
+    if archivo.content_type not in TIPOS_PERMITIDOS:
+        return 'Tipo de archivo no válido. Solo se permiten: JPEG, PNG, GIF, WebP'
+    if archivo.size > TAMANO_MAXIMO:
+        return 'Archivo demasiado grande. Máximo 32MB'
+    return None
+
+
+def recibir_imagen(archivo):
+    """Guardar la imagen en el storage local y registrar la subida pendiente"""
+    extension = EXTENSIONES.get(archivo.content_type, 'bin')
+    ruta = default_storage.save(f'subidas/{uuid.uuid4().hex}.{extension}', archivo)
+    subida = SubidaImagen.objects.create(
+        archivo=ruta,
+        nombre_original=(archivo.name or '')[:255],
+        content_type=archivo.content_type,
+    )
+    # Sin hilos (IMAGENES_WORKERS=0) la sube el comando procesar_subidas_imagenes
+    SUBIDAS.encolar_al_confirmar([subida.id_subida])
+    return subida
+
+
+# ==========================================================
+# PROCESAMIENTO
+# ==========================================================
+
+def subir_a_hosting(contenido):
+    """Enviar la imagen a ImgBB (o al servidor configurado) y devolver la URL"""
+    respuesta = obtener_session().post(
+        _config('IMGBB_UPLOAD_URL', 'https://api.imgbb.com/1/upload'),
+        data={
+            'key': settings.API_KEY_IMGBB,
+            'image': base64.b64encode(contenido).decode('utf-8'),
+        },
+        timeout=(5, 30),
+    )
+    try:
+        resultado = respuesta.json()
+    except ValueError:
+        raise ErrorSubida(f'Respuesta inválida del hosting (HTTP {respuesta.status_code})')
+
+    if not resultado.get('success'):
+        error = resultado.get('error')
+        mensaje = error.get('message') if isinstance(error, dict) else None
+        raise ErrorSubida(mensaje or f'Error al subir imagen a ImgBB (HTTP {respuesta.status_code})')
+    return resultado['data']['url']
+
+
+def _subir(subida):
+    with default_storage.open(subida.archivo, 'rb') as f:
+        contenido = f.read()
+    subida.url = subir_a_hosting(contenido)
+
+
+def _eliminar_archivo_local(subida):
+    # El archivo local ya no hace falta
+    try:
+        default_storage.delete(subida.archivo)
+    except OSError as e:
+        logger.warning(f"No se pudo eliminar {subida.archivo}: {str(e)}")
+
+
+SUBIDAS = ColaTrabajos(
+    SubidaImagen, _subir,
+    nombre='subida-imagen',
+    ajuste_workers='IMAGENES_WORKERS',
+    completado='completada',
+    fallido='fallida',
+    errores=(ErrorSubida, requests.exceptions.RequestException, OSError),
+    campos=['url'],
+    al_completar=_eliminar_archivo_local,
+)
+
+
+def url_local(subida):
+    """URL del archivo local mientras la subida no termina"""
+    if subida.estado == 'completada':
+        return None
+    return default_storage.url(subida.archivo) if subida.archivo else None
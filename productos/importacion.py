@@ -0,0 +1,382 @@
+"""
+Importación masiva de productos (CSV, JSON o NDJSON).
+Lee las filas en streaming, resuelve categoría, marca y proveedor con mapas
+en memoria y hace upsert de productos y stock por lotes con
+bulk_create/bulk_update. Los errores se reportan por fila sin detener la carga.
+
+Columnas: id (opcional), nombre, precio, descripcion, precio_compra, imagen,
+categoria, marca, proveedor, stock. Sin `id`, el producto se identifica por
+nombre exacto. `precio` solo es obligatorio para crear productos: una fila
+que actualiza uno existente puede traer, por ejemplo, solo nombre y stock.
+"""
+import csv
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Producto, Categoria, Marca, Proveedor, Stock, MovimientoStock
+from .cache_catalogo import invalidar_catalogo
+from .inventario import alertar_stock_bajo
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE_DEFAULT = 1000
+# bulk_update arma un CASE WHEN por fila; lotes más grandes se vuelven lentos
+TAMANO_LOTE_UPDATE = 250
+MAX_ERRORES_REPORTADOS = 1000
+FORMATOS = ['csv', 'json', 'ndjson']
+CAMPOS_PRODUCTO = ['nombre', 'descripcion', 'precio', 'precio_compra', 'imagen', 'categoria', 'marca', 'proveedor']
+
+
+class ErrorFila(ValueError):
+    """Fila con datos inválidos; se reporta y se continúa con la siguiente"""
+
+
+# ==========================================================
+# LECTURA
+# ==========================================================
+
+def detectar_formato(nombre_archivo, formato=None):
+    """Formato explícito o inferido de la extensión del archivo"""
+    if formato:
+        formato = formato.lower()
+    elif nombre_archivo and '.' in nombre_archivo:
+        formato = nombre_archivo.rsplit('.', 1)[-1].lower()
+        if formato == 'jsonl':
+            formato = 'ndjson'
+    if formato not in FORMATOS:
+        raise ValueError(f'Formato no soportado: {formato}. Use csv, json o ndjson')
+    return formato
+
+
+def leer_filas(stream, formato):
+    """Generador de diccionarios a partir de un stream de texto"""
+    if formato == 'csv':
+        for fila in csv.DictReader(stream):
+            yield {k.strip(): v for k, v in fila.items() if k}
+    elif formato == 'ndjson':
+        for linea in stream:
+            linea = linea.strip()
+            if linea:
+                try:
+                    yield json.loads(linea)
+                except json.JSONDecodeError as e:
+                    # Se reporta como error de esa fila
+                    yield ErrorFila(f'JSON inválido: {e.msg}')
+    else:
+        datos = json.load(stream)
+        if isinstance(datos, dict):
+            datos = datos.get('productos', [])
+        yield from datos
+
+
+# ==========================================================
+# NORMALIZACIÓN DE FILAS
+# ==========================================================
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    return str(valor).strip()
+
+
+def _decimal(valor, campo, obligatorio=False):
+    valor = _texto(valor)
+    if not valor:
+        if obligatorio:
+            raise ErrorFila(f'El campo {campo} es obligatorio')
+        return None
+    try:
+        numero = Decimal(valor.replace(',', '.'))
+    except InvalidOperation:
+        raise ErrorFila(f'{campo} inválido: {valor}')
+    if numero < 0:
+        raise ErrorFila(f'{campo} no puede ser negativo')
+    return numero.quantize(Decimal('0.01'))
+
+
+def normalizar_fila(fila):
+    """Validar y convertir una fila cruda al formato interno"""
+    if isinstance(fila, ErrorFila):
+        raise fila
+    if not isinstance(fila, dict):
+        raise ErrorFila('La fila debe ser un objeto')
+
+    nombre = _texto(fila.get('nombre'))
+    if not nombre:
+        raise ErrorFila('El nombre es obligatorio')
+    if len(nombre) > 200:
+        raise ErrorFila('El nombre supera los 200 caracteres')
+
+    producto_id = _texto(fila.get('id'))
+    stock = _texto(fila.get('stock'))
+    try:
+        producto_id = int(producto_id) if producto_id else None
+        stock = int(Decimal(stock)) if stock else None
+    except (ValueError, InvalidOperation):
+        raise ErrorFila('id o stock no son números enteros')
+    if stock is not None and stock < 0:
+        raise ErrorFila('stock no puede ser negativo')
+
+    # Obligatorio solo al crear (se valida en el importador)
+    precio = _decimal(fila.get('precio'), 'precio')
+
+    return {
+        'id': producto_id,
+        'nombre': nombre,
+        'descripcion': _texto(fila.get('descripcion')),
+        'precio': precio,
+        'precio_compra': _decimal(fila.get('precio_compra'), 'precio_compra'),
+        'imagen': _texto(fila.get('imagen')),
+        'categoria': _texto(fila.get('categoria')),
+        'marca': _texto(fila.get('marca')),
+        'proveedor': _texto(fila.get('proveedor')),
+        'stock': stock,
+        # Columnas presentes en la fila: solo esas se actualizan (un precio vacío no cambia el actual)
+        'campos': [c for c in CAMPOS_PRODUCTO if c in fila and not (c == 'precio' and precio is None)],
+    }
+
+
+# ==========================================================
+# ESCRITURA
+# ==========================================================
+
+def actualizar_en_bloque(modelo, objetos, campos, tamano_lote=TAMANO_LOTE_DEFAULT):
+    """
+    Equivalente a bulk_update. En PostgreSQL usa UPDATE ... FROM (VALUES ...),
+    que evita el costo de armar un CASE WHEN por fila en Python.
+    """
+    if not objetos or not campos:
+        return
+    if connection.vendor != 'postgresql':
+        modelo.objects.bulk_update(objetos, campos, batch_size=TAMANO_LOTE_UPDATE)
+        return
+
+    qn = connection.ops.quote_name
+    pk = modelo._meta.pk
+    fields = [pk] + [modelo._meta.get_field(c) for c in campos]
+    columnas = ', '.join(qn(f.column) for f in fields)
+    asignaciones = ', '.join(f'{qn(f.column)} = v.{qn(f.column)}' for f in fields[1:])
+    fila_sql = '(' + ', '.join(f'%s::{f.db_type(connection)}' for f in fields) + ')'
+
+    with connection.cursor() as cursor:
+        for i in range(0, len(objetos), tamano_lote):
+            bloque = objetos[i:i + tamano_lote]
+            params = [
+                f.get_db_prep_save(getattr(obj, f.attname), connection)
+                for obj in bloque for f in fields
+            ]
+            cursor.execute(
+                f'UPDATE {qn(modelo._meta.db_table)} AS t SET {asignaciones} '
+                f'FROM (VALUES {", ".join([fila_sql] * len(bloque))}) AS v({columnas}) '
+                f'WHERE t.{qn(pk.column)} = v.{qn(pk.column)}',
+                params,
+            )
+
+
+# ==========================================================
+# IMPORTADOR
+# ==========================================================
+
+class ImportadorProductos:
+    """Upsert por lotes con caché de tablas de referencia"""
+
+    def __init__(self, tamano_lote=TAMANO_LOTE_DEFAULT):
+        self.tamano_lote = tamano_lote
+        self.creados = 0
+        self.actualizados = 0
+        self.procesadas = 0
+        self.errores = []
+        self.total_errores = 0
+        # Filas ya reportadas: un lote revertido no las vuelve a contar
+        self._filas_con_error = set()
+        self._cargar_referencias()
+
+    def _cargar_referencias(self):
+        # nombre -> id de las tablas de referencia, cargados una sola vez
+        self.categorias = dict(Categoria.objects.values_list('nombre', 'id_categoria'))
+        self.marcas = dict(Marca.objects.values_list('nombre', 'id_marca'))
+        self.proveedores = {}
+        for nombre, pk in Proveedor.objects.order_by('-id_proveedor').values_list('nombre', 'id_proveedor'):
+            self.proveedores[nombre] = pk  # el de menor id prevalece
+
+    def importar(self, filas):
+        lote = []
+        for numero, fila in enumerate(filas, start=1):
+            self.procesadas += 1
+            try:
+                lote.append((numero, normalizar_fila(fila)))
+            except ErrorFila as e:
+                self._registrar_error(numero, str(e))
+                continue
+            if len(lote) >= self.tamano_lote:
+                self._procesar_lote_seguro(lote)
+                lote = []
+        if lote:
+            self._procesar_lote_seguro(lote)
+
+        # bulk_create/bulk_update no emiten señales
+        invalidar_catalogo()
+        return self.resumen()
+
+    def resumen(self):
+        return {
+            'procesadas': self.procesadas,
+            'creados': self.creados,
+            'actualizados': self.actualizados,
+            'total_errores': self.total_errores,
+            'errores': self.errores,
+        }
+
+    def _registrar_error(self, numero, mensaje):
+        if numero in self._filas_con_error:
+            return
+        self._filas_con_error.add(numero)
+        self.total_errores += 1
+        if len(self.errores) < MAX_ERRORES_REPORTADOS:
+            self.errores.append({'fila': numero, 'error': mensaje})
+
+    def _procesar_lote_seguro(self, lote):
+        """Un lote fallido se reporta fila por fila y la carga continúa"""
+        try:
+            self._procesar_lote(lote)
+        except Exception as e:
+            logger.error(f"Error importando lote de productos: {str(e)}", exc_info=True)
+            for numero, _ in lote:
+                self._registrar_error(numero, f'Error en el lote: {str(e)}')
+            # El rollback pudo descartar referencias creadas en este lote
+            self._cargar_referencias()
+
+    def _resolver_referencias(self, lote):
+        """Crear en bloque las categorías, marcas y proveedores que falten"""
+        for modelo, mapa, campo, pk in (
+            (Categoria, self.categorias, 'categoria', 'id_categoria'),
+            (Marca, self.marcas, 'marca', 'id_marca'),
+            (Proveedor, self.proveedores, 'proveedor', 'id_proveedor'),
+        ):
+            faltantes = {fila[campo] for _, fila in lote if fila[campo] and fila[campo] not in mapa}
+            if not faltantes:
+                continue
+            if modelo is Proveedor:
+                creados = Proveedor.objects.bulk_create([Proveedor(nombre=n) for n in faltantes])
+                mapa.update({p.nombre: p.id_proveedor for p in creados})
+            else:
+                # nombre es único: ignore_conflicts tolera cargas concurrentes
+                modelo.objects.bulk_create([modelo(nombre=n) for n in faltantes], ignore_conflicts=True)
+                mapa.update(modelo.objects.filter(nombre__in=faltantes).values_list('nombre', pk))
+
+    def _existentes(self, lote):
+        """Mapa de productos existentes por id y por nombre para el lote"""
+        ids = {fila['id'] for _, fila in lote if fila['id']}
+        nombres = {fila['nombre'] for _, fila in lote if not fila['id']}
+        por_id = Producto.objects.in_bulk(ids) if ids else {}
+        por_nombre = {}
+        if nombres:
+            for p in Producto.objects.filter(nombre__in=nombres).order_by('-id'):
+                por_nombre[p.nombre] = p  # el de menor id prevalece
+        return por_id, por_nombre
+
+    def _procesar_lote(self, lote):
+        with transaction.atomic():
+            self._resolver_referencias(lote)
+            por_id, por_nombre = self._existentes(lote)
+
+            nuevos, actualizar, campos_actualizar = [], {}, set()
+            stock_por_producto = []  # (producto, cantidad)
+
+            for numero, fila in lote:
+                if fila['id']:
+                    producto = por_id.get(fila['id'])
+                    if producto is None:
+                        self._registrar_error(numero, f"Producto {fila['id']} no encontrado")
+                        continue
+                else:
+                    producto = por_nombre.get(fila['nombre'])
+
+                if producto is None:
+                    if fila['precio'] is None:
+                        self._registrar_error(numero, 'El campo precio es obligatorio para productos nuevos')
+                        continue
+                    producto = Producto(
+                        nombre=fila['nombre'],
+                        descripcion=fila['descripcion'],
+                        precio=fila['precio'],
+                        precio_compra=fila['precio_compra'] or Decimal('0.00'),
+                        imagen=fila['imagen'],
+                        categoria_id=self.categorias.get(fila['categoria']),
+                        marca_id=self.marcas.get(fila['marca']),
+                        proveedor_id=self.proveedores.get(fila['proveedor']),
+                    )
+                    nuevos.append(producto)
+                    # Un nombre repetido en el mismo lote actualiza el recién creado
+                    por_nombre[fila['nombre']] = producto
+                elif producto.pk is None:
+                    # Repetido dentro del lote y aún sin insertar
+                    self._aplicar_fila(producto, fila)
+                else:
+                    campos_actualizar.update(self._aplicar_fila(producto, fila))
+                    actualizar[producto.pk] = producto
+
+                if fila['stock'] is not None:
+                    stock_por_producto.append((producto, fila['stock']))
+
+            Producto.objects.bulk_create(nuevos, batch_size=self.tamano_lote)
+            actualizar_en_bloque(Producto, list(actualizar.values()), sorted(campos_actualizar), self.tamano_lote)
+            self._upsert_stock(stock_por_producto)
+
+        self.creados += len(nuevos)
+        self.actualizados += len(actualizar)
+
+    def _aplicar_fila(self, producto, fila):
+        """Copiar al producto las columnas presentes en la fila"""
+        mapas = {'categoria': self.categorias, 'marca': self.marcas, 'proveedor': self.proveedores}
+        for campo in fila['campos']:
+            if campo in mapas:
+                setattr(producto, f'{campo}_id', mapas[campo].get(fila[campo]) if fila[campo] else None)
+            elif campo == 'precio_compra':
+                producto.precio_compra = fila['precio_compra'] or Decimal('0.00')
+            else:
+                setattr(producto, campo, fila[campo])
+        return fila['campos']
+
+    def _upsert_stock(self, stock_por_producto):
+        if not stock_por_producto:
+            return
+        cantidades = {producto.pk: cantidad for producto, cantidad in stock_por_producto}
+        # Bloquear las filas hasta el fin del lote (en el mismo orden que reservar_stock): una
+        # venta simultánea no puede cambiar la cantidad entre la lectura y la escritura, así
+        # la diferencia que va al libro es la real
+        existentes = {
+            stock.producto_id: stock
+            for stock in Stock.objects.select_for_update().filter(producto_id__in=cantidades).order_by('producto_id')
+        }
+
+        ahora = timezone.now()
+        actualizar, nuevos, movimientos = [], [], []
+        descontados = {}
+        for producto_id, cantidad in cantidades.items():
+            stock = existentes.get(producto_id)
+            anterior = stock.cantidad if stock else 0
+            if stock:
+                stock.cantidad = cantidad
+                stock.fecha_actualizacion = ahora
+                actualizar.append(stock)
+                if cantidad < anterior:
+                    descontados[producto_id] = anterior - cantidad
+            else:
+                nuevos.append(Stock(producto_id=producto_id, cantidad=cantidad))
+            if cantidad != anterior:
+                # El libro de movimientos registra la diferencia
+                movimientos.append(MovimientoStock(
+                    producto_id=producto_id, tipo='importacion', cantidad=cantidad - anterior
+                ))
+
+        Stock.objects.bulk_create(nuevos, batch_size=self.tamano_lote)
+        # La actualización masiva no aplica auto_now, por eso se envía fecha_actualizacion
+        actualizar_en_bloque(Stock, actualizar, ['cantidad', 'fecha_actualizacion'], self.tamano_lote)
+        MovimientoStock.objects.bulk_create(movimientos, batch_size=self.tamano_lote)
+        # Igual que una venta o un ajuste: avisar de los que bajaron del mínimo
+        alertar_stock_bajo(descontados, ahora)
@@ -0,0 +1,286 @@
+"""
+Servicio de stock (CU4, CU10, CU11).
+Toda variación de stock pasa por aquí: se actualiza la proyección
+`Stock.cantidad` y, en la misma transacción, se agrega la fila
+correspondiente al libro `MovimientoStock`.
+
+Las reservas del checkout usan UPDATE condicionales
+(`cantidad = cantidad - n WHERE cantidad >= n`): el control y el descuento
+son una sola operación en la BD, así dos compradores simultáneos no pueden
+vender la misma unidad. En PostgreSQL todas las líneas van en un solo
+UPDATE, así la reserva cuesta lo mismo con 1 o con 100 productos.
+
+Las alertas de stock bajo salen del mismo descuento: solo se avisa cuando
+un producto cruza su `stock_minimo`, y no más de una vez por ventana
+(ALERTA_STOCK_VENTANA_HORAS). El aviso se registra en la bandeja de salida
+(evento 'stock_bajo') y la ventana se marca recién cuando se entrega.
+"""
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum, Max
+from django.utils import timezone
+
+from .models import Producto, Stock, MovimientoStock
+from .cache_catalogo import invalidar_catalogo
+from .catalogo import expresion_stock_actual
+
+logger = logging.getLogger(__name__)
+
+
+class StockInsuficiente(Exception):
+    """Una o más líneas no tienen stock suficiente; `faltantes` indica cuáles"""
+
+    def __init__(self, faltantes):
+        self.faltantes = faltantes
+        super().__init__(mensaje_stock_insuficiente(faltantes))
+
+
+def mensaje_stock_insuficiente(faltantes):
+    mensaje = 'Stock insuficiente para los siguientes productos: '
+    mensaje += ', '.join([f"{p['producto']} (solicitado: {p['solicitado']}, disponible: {p['disponible']})"
+                          for p in faltantes])
+    return mensaje
+
+
+def _agrupar(lineas):
+    """Sumar cantidades por producto y ordenar por id (orden fijo de bloqueo entre transacciones)"""
+    cantidades = {}
+    for producto_id, cantidad in lineas:
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+    return OrderedDict(sorted(cantidades.items()))
+
+
+def _registrar_movimientos(cantidades, tipo, referencia=None):
+    """Agregar al libro un movimiento por producto ({producto_id: cantidad con signo})"""
+    MovimientoStock.objects.bulk_create([
+        MovimientoStock(producto_id=producto_id, tipo=tipo, cantidad=cantidad, referencia=referencia)
+        for producto_id, cantidad in cantidades.items() if cantidad
+    ])
+
+
+def _faltantes(solicitado):
+    """Detalle de las líneas sin stock, en una sola consulta"""
+    productos = Producto.objects.filter(id__in=solicitado.keys()).annotate(
+        stock_cantidad=expresion_stock_actual()
+    ).values_list('id', 'nombre', 'stock_cantidad')
+    datos = {pid: (nombre, stock) for pid, nombre, stock in productos}
+    return [
+        {
+            'producto_id': producto_id,
+            'producto': datos.get(producto_id, (f'Producto {producto_id}', 0))[0],
+            'solicitado': cantidad,
+            'disponible': datos.get(producto_id, (None, 0))[1],
+        }
+        for producto_id, cantidad in solicitado.items()
+    ]
+
+
+def _sin_alerta_reciente(ahora):
+    ventana = timedelta(hours=getattr(settings, 'ALERTA_STOCK_VENTANA_HORAS', 24))
+    return Q(alerta_stock_bajo__isnull=True) | Q(alerta_stock_bajo__lt=ahora - ventana)
+
+
+def alertar_stock_bajo(descontados, ahora):
+    """
+    Registrar la alerta de los productos de `descontados` ({producto_id:
+    unidades descontadas}) que acaban de bajar de su stock mínimo y no
+    tuvieron alerta en la ventana (ventas, ajustes e importaciones). Se
+    llama dentro de la transacción del descuento (las filas ya están
+    bloqueadas), así que dos ventas simultáneas no cruzan el umbral las
+    dos; si la venta se revierte, el evento también.
+    """
+    if not descontados:
+        return
+    candidatos = Stock.objects.filter(
+        producto_id__in=descontados, cantidad__lt=F('stock_minimo')
+    ).filter(_sin_alerta_reciente(ahora)).values_list('producto_id', 'cantidad', 'stock_minimo')
+    # Solo los que estaban en o por encima del mínimo antes del descuento
+    cruzaron = [pid for pid, cantidad, minimo in candidatos if cantidad + descontados[pid] >= minimo]
+    if not cruzaron:
+        return
+
+    from ventas_carrito.eventos import registrar_evento
+    registrar_evento('stock_bajo', producto_ids=cruzaron)
+
+
+def enviar_alerta_stock_bajo(producto_ids):
+    """
+    Entregar una alerta registrada por alertar_stock_bajo (la ejecuta la
+    bandeja de salida). Avisa solo de los productos que siguen bajo el
+    mínimo y sin alerta en la ventana; `alerta_stock_bajo` se marca en la
+    misma transacción que la notificación, así un fallo no silencia la
+    alerta: el evento se reintenta.
+    """
+    from autenticacion_usuarios.notificaciones_views import notificar_stock_bajo
+    with transaction.atomic():
+        ahora = timezone.now()
+        pendientes = list(Stock.objects.select_for_update().filter(
+            producto_id__in=producto_ids, cantidad__lt=F('stock_minimo')
+        ).filter(_sin_alerta_reciente(ahora)).values_list('producto_id', flat=True))
+        if not pendientes:
+            return
+        notificar_stock_bajo(pendientes)
+        Stock.objects.filter(producto_id__in=pendientes).update(alerta_stock_bajo=ahora)
+
+
+def productos_stock_bajo():
+    """Registros de stock por debajo de su mínimo (usa el índice parcial stock_bajo_idx)"""
+    return Stock.objects.filter(cantidad__lt=F('stock_minimo')).select_related('producto').order_by('cantidad')
+
+
+def stock_disponible(producto):
+    """Stock de un producto traído con select_related('stock'); 0 si no tiene registro"""
+    try:
+        return producto.stock.cantidad
+    except ObjectDoesNotExist:
+        return 0
+
+
+def verificar_stock(lineas):
+    """
+    Control previo sin descontar (por ejemplo, antes de cobrar con Stripe).
+    Devuelve la lista de faltantes; vacía si todo alcanza.
+    """
+    solicitado = _agrupar(lineas)
+    return [f for f in _faltantes(solicitado) if f['disponible'] < f['solicitado']]
+
+
+def _descontar_en_bloque(solicitado, ahora):
+    """
+    PostgreSQL: descontar todas las líneas con un UPDATE ... FROM (VALUES ...)
+    condicional, después de bloquear las filas en orden de producto (mismo
+    orden que el descuento línea por línea). Devuelve los ids descontados.
+    """
+    list(Stock.objects.select_for_update().filter(
+        producto_id__in=list(solicitado)
+    ).order_by('producto_id').values_list('producto_id', flat=True))
+
+    valores = ', '.join(['(%s::integer, %s::integer)'] * len(solicitado))
+    params = [ahora]
+    for producto_id, cantidad in solicitado.items():
+        params += [producto_id, cantidad]
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE stock SET cantidad = stock.cantidad - pedido.cantidad, fecha_actualizacion = %s
+            FROM (VALUES {valores}) AS pedido (id_producto, cantidad)
+            WHERE stock.id_producto = pedido.id_producto AND stock.cantidad >= pedido.cantidad
+            RETURNING stock.id_producto
+        """, params)
+        return {fila[0] for fila in cursor.fetchall()}
+
+
+def reservar_stock(lineas, referencia=None):
+    """
+    Descontar el stock de todas las líneas [(producto_id, cantidad)] o de ninguna.
+    Lanza StockInsuficiente con las líneas que no alcanzaron.
+    Si se llama dentro de otra transacción, el descuento se confirma o
+    se revierte junto con ella.
+    En PostgreSQL es un solo UPDATE; en otros motores (SQLite en desarrollo)
+    es un UPDATE por producto, así que el costo del checkout crece con las
+    líneas del carrito.
+    """
+    solicitado = _agrupar(lineas)
+    if not solicitado:
+        return
+
+    with transaction.atomic():
+        ahora = timezone.now()
+        if connection.vendor == 'postgresql':
+            descontados = _descontar_en_bloque(solicitado, ahora)
+            sin_stock = OrderedDict((pid, c) for pid, c in solicitado.items() if pid not in descontados)
+        else:
+            sin_stock = OrderedDict()
+            for producto_id, cantidad in solicitado.items():
+                actualizados = Stock.objects.filter(
+                    producto_id=producto_id, cantidad__gte=cantidad
+                ).update(cantidad=F('cantidad') - cantidad, fecha_actualizacion=ahora)
+                if not actualizados:
+                    sin_stock[producto_id] = cantidad
+
+        if sin_stock:
+            # Al salir con la excepción se revierten también las líneas que sí alcanzaron
+            raise StockInsuficiente(_faltantes(sin_stock))
+
+        _registrar_movimientos({pid: -cantidad for pid, cantidad in solicitado.items()}, 'venta', referencia)
+        alertar_stock_bajo(solicitado, ahora)
+        # update() no dispara señales: invalidar el catálogo al confirmar
+        transaction.on_commit(invalidar_catalogo)
+
+
+def ajustar_stock(producto_id, cantidad, tipo='ajuste', referencia=None, stock_minimo=None):
+    """
+    Fijar el stock de un producto en `cantidad` (gestión administrativa) y,
+    opcionalmente, su stock mínimo.
+    El libro registra la diferencia respecto del valor anterior.
+    """
+    with transaction.atomic():
+        stock = Stock.objects.select_for_update().filter(producto_id=producto_id).first()
+        anterior = stock.cantidad if stock else 0
+        if stock:
+            stock.cantidad = cantidad
+            campos = ['cantidad', 'fecha_actualizacion']
+            if stock_minimo is not None:
+                stock.stock_minimo = stock_minimo
+                campos.append('stock_minimo')
+            stock.save(update_fields=campos)
+        else:
+            datos = {} if stock_minimo is None else {'stock_minimo': stock_minimo}
+            stock = Stock.objects.create(producto_id=producto_id, cantidad=cantidad, **datos)
+        _registrar_movimientos({producto_id: cantidad - anterior}, tipo, referencia)
+        if cantidad < anterior:
+            alertar_stock_bajo({producto_id: anterior - cantidad}, timezone.now())
+    return stock
+
+
+# ==========================================================
+# HISTORIAL Y COMPACTACIÓN DEL LIBRO
+# ==========================================================
+
+def historial_stock(producto_id, limite=50):
+    """Últimos movimientos de un producto (índice producto + fecha)"""
+    return MovimientoStock.objects.filter(producto_id=producto_id).order_by('-fecha', '-id_movimiento').values(
+        'id_movimiento', 'tipo', 'cantidad', 'referencia', 'fecha'
+    )[:limite]
+
+
+def compactar_movimientos(antes_de):
+    """
+    Reemplazar los movimientos anteriores a `antes_de` por un único saldo
+    ('compactacion') por producto. La suma del libro no cambia; el historial
+    reciente se conserva completo. Devuelve (movimientos eliminados, saldos creados).
+    """
+    with transaction.atomic():
+        antiguos = MovimientoStock.objects.filter(fecha__lt=antes_de)
+        # Fijar el conjunto por id: lo que se suma es exactamente lo que se borra
+        ultimo_id = antiguos.aggregate(m=Max('id_movimiento'))['m']
+        if ultimo_id is None:
+            return 0, 0
+        antiguos = antiguos.filter(id_movimiento__lte=ultimo_id)
+
+        saldos = list(antiguos.values('producto_id').annotate(total=Sum('cantidad')).order_by('producto_id'))
+        eliminados, _ = antiguos.delete()
+        MovimientoStock.objects.bulk_create([
+            MovimientoStock(producto_id=s['producto_id'], tipo='compactacion', cantidad=s['total'],
+                            referencia=f'hasta:{antes_de.date().isoformat()}')
+            for s in saldos if s['total']
+        ])
+        # auto_now_add pone la fecha actual: el saldo debe quedar antes del corte
+        MovimientoStock.objects.filter(tipo='compactacion', fecha__gte=antes_de, id_movimiento__gt=ultimo_id).update(fecha=antes_de)
+    return eliminados, len([s for s in saldos if s['total']])
+
+
+def conciliar_stock():
+    """Productos cuyo Stock.cantidad no coincide con la suma del libro: [(id, stock, libro)]"""
+    libro = dict(MovimientoStock.objects.values('producto_id').annotate(total=Sum('cantidad')).values_list('producto_id', 'total'))
+    diferencias = []
+    productos = Producto.objects.annotate(stock_cantidad=expresion_stock_actual()).values_list('id', 'stock_cantidad')
+    for producto_id, stock in productos.iterator(chunk_size=2000):
+        total = libro.get(producto_id, 0)
+        if stock != total:
+            diferencias.append((producto_id, stock, total))
+    return diferencias
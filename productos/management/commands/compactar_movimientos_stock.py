@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from productos.inventario import compactar_movimientos, conciliar_stock
+
+
+class Command(BaseCommand):
+    help = (
+        'Compacta el libro de movimientos de stock anterior a N días en un saldo por producto (úsese desde cron). '
+        'Con --conciliar solo verifica el libro, sin modificarlo (agregar --compactar para hacer ambas cosas)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=90, help='Conservar el detalle de los últimos N días')
+        parser.add_argument('--conciliar', action='store_true',
+                            help='Verificar que Stock.cantidad coincida con la suma del libro (solo lectura)')
+        parser.add_argument('--compactar', action='store_true',
+                            help='Con --conciliar, compactar también antes de verificar')
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1:
+            raise CommandError('--dias debe ser mayor a 0')
+
+        if options['compactar'] or not options['conciliar']:
+            corte = timezone.now() - timedelta(days=options['dias'])
+            eliminados, saldos = compactar_movimientos(corte)
+            self.stdout.write(self.style.SUCCESS(
+                f'Movimientos compactados: {eliminados} | Saldos por producto: {saldos} | Corte: {corte:%Y-%m-%d %H:%M}'
+            ))
+
+        if options['conciliar']:
+            diferencias = conciliar_stock()
+            for producto_id, stock, libro in diferencias:
+                self.stdout.write(self.style.WARNING(
+                    f'Producto {producto_id}: stock {stock} / libro {libro}'
+                ))
+            self.stdout.write(self.style.SUCCESS(f'Productos con diferencias: {len(diferencias)}'))
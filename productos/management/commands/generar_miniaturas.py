@@ -0,0 +1,35 @@
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand, CommandError
+
+from productos.models import Producto
+from productos.miniaturas import (
+    PIL_AVAILABLE, TAMANOS_MINIATURA, ErrorMiniatura, generar_miniatura, miniatura_guardada, origen_permitido,
+)
+
+
+class Command(BaseCommand):
+    help = 'Genera las miniaturas que falten (necesario con IMAGENES_WORKERS=0; úsese desde cron)'
+
+    def handle(self, *args, **options):
+        if not PIL_AVAILABLE:
+            raise CommandError('Pillow no está instalado')
+
+        generadas = fallidas = 0
+        for producto in Producto.objects.exclude(imagen__isnull=True).exclude(imagen='').only('id', 'imagen').iterator():
+            try:
+                if not origen_permitido(producto.imagen):
+                    continue
+            except SuspiciousFileOperation:
+                # Ruta local fuera de MEDIA_ROOT
+                continue
+            for tamano in TAMANOS_MINIATURA:
+                if miniatura_guardada(producto, tamano) is not None:
+                    continue
+                try:
+                    generar_miniatura(producto, tamano)
+                    generadas += 1
+                except ErrorMiniatura as e:
+                    fallidas += 1
+                    self.stdout.write(self.style.WARNING(f'Producto #{producto.id} ({tamano}px): {str(e)}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Miniaturas generadas: {generadas} | Fallidas: {fallidas}'))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from productos.importacion import (
+    ImportadorProductos, detectar_formato, leer_filas, TAMANO_LOTE_DEFAULT,
+)
+
+
+class Command(BaseCommand):
+    help = 'Importa productos y stock desde un archivo CSV, JSON o NDJSON (upsert por lotes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo a importar')
+        parser.add_argument('--formato', choices=['csv', 'json', 'ndjson'], help='Por defecto se infiere de la extensión')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE_DEFAULT, help='Filas por lote')
+
+    def handle(self, *args, **options):
+        try:
+            formato = detectar_formato(options['archivo'], options['formato'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        inicio = time.monotonic()
+        importador = ImportadorProductos(tamano_lote=options['lote'])
+        try:
+            with open(options['archivo'], encoding='utf-8-sig', newline='') as stream:
+                resumen = importador.importar(leer_filas(stream, formato))
+        except OSError as e:
+            raise CommandError(f'No se pudo leer el archivo: {e}')
+        except ValueError as e:
+            raise CommandError(f'Archivo inválido: {e}')
+        duracion = time.monotonic() - inicio
+
+        for error in resumen['errores']:
+            self.stdout.write(self.style.WARNING(f"Fila {error['fila']}: {error['error']}"))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Procesadas: {resumen['procesadas']} | Creados: {resumen['creados']} | "
+            f"Actualizados: {resumen['actualizados']} | Errores: {resumen['total_errores']} | "
+            f"Tiempo: {duracion:.1f}s"
+        ))
@@ -0,0 +1,11 @@
+from backend_smart.trabajos import ComandoCola
+from productos.imagenes import SUBIDAS
+
+
+class Command(ComandoCola):
+    help = 'Sube a ImgBB las imágenes pendientes o fallidas (úsese desde cron o en bucle con --intervalo)'
+    cola = SUBIDAS
+    resumen = 'Subidas completadas: {completados} | Fallidas: {fallidos}'
+
+    def describir(self, subida):
+        return f'Subida #{subida.id_subida}'
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from productos.models import Categoria, Producto, Marca, Proveedor, Stock
+from productos.inventario import ajustar_stock
 
 
 class Command(BaseCommand):
@@ -114,12 +115,9 @@ class Command(BaseCommand):
                 defaults=data
             )
             
-            # Crear stock para el producto
+            # Crear stock para el producto (con su movimiento inicial en el libro)
             if created or not Stock.objects.filter(producto=obj).exists():
-                Stock.objects.create(
-                    producto=obj,
-                    cantidad=stock_cantidad
-                )
+                ajustar_stock(obj.id, stock_cantidad, tipo='inicial', referencia='seed')
             
             self.stdout.write(self.style.SUCCESS(f"{'Creado' if created else 'Existente'}: {obj.nombre}"))
 
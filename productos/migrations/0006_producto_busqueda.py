@@ -0,0 +1,65 @@
+# Búsqueda de texto completo para productos (PostgreSQL)
+# El tsvector se mantiene con un trigger para que también lo actualicen
+# las escrituras masivas (bulk_create/bulk_update) y los scripts SQL.
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def crear_busqueda_postgres(apps, schema_editor):
+    """Trigger, backfill e índice GIN solo en PostgreSQL"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION producto_busqueda_trigger() RETURNS trigger AS $$
+            BEGIN
+                NEW.busqueda :=
+                    setweight(to_tsvector('spanish', coalesce(NEW.nombre, '')), 'A') ||
+                    setweight(to_tsvector('spanish', coalesce(NEW.descripcion, '')), 'B');
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute("DROP TRIGGER IF EXISTS producto_busqueda_update ON producto")
+        cursor.execute("""
+            CREATE TRIGGER producto_busqueda_update
+            BEFORE INSERT OR UPDATE OF nombre, descripcion ON producto
+            FOR EACH ROW EXECUTE FUNCTION producto_busqueda_trigger()
+        """)
+        # Poblar los productos existentes
+        cursor.execute("""
+            UPDATE producto SET busqueda =
+                setweight(to_tsvector('spanish', coalesce(nombre, '')), 'A') ||
+                setweight(to_tsvector('spanish', coalesce(descripcion, '')), 'B')
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS producto_busqueda_gin
+            ON producto USING GIN (busqueda)
+        """)
+
+
+def eliminar_busqueda_postgres(apps, schema_editor):
+    """Revertir: eliminar índice, trigger y función"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP INDEX IF EXISTS producto_busqueda_gin")
+        cursor.execute("DROP TRIGGER IF EXISTS producto_busqueda_update ON producto")
+        cursor.execute("DROP FUNCTION IF EXISTS producto_busqueda_trigger()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0005_cupondescuento_oferta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='busqueda',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(crear_busqueda_postgres, eliminar_busqueda_postgres),
+    ]
@@ -0,0 +1,46 @@
+# Índice de trigramas sobre producto.nombre para el autocompletado
+# Si la extensión pg_trgm no puede instalarse (permisos), el autocompletado
+# sigue funcionando con el filtro por prefijo/icontains.
+
+import logging
+
+from django.db import migrations, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def crear_indice_trigramas(apps, schema_editor):
+    """Instalar pg_trgm y crear el índice GIN solo en PostgreSQL"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        # Savepoint para no abortar la migración si faltan permisos
+        with transaction.atomic(using=schema_editor.connection.alias):
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                # La segunda expresión cubre el icontains de Django: UPPER(nombre::text) LIKE ...
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS producto_nombre_trgm
+                    ON producto USING GIN (nombre gin_trgm_ops, (UPPER(nombre::text)) gin_trgm_ops)
+                """)
+    except Exception as e:
+        logger.warning(f"No se pudo crear el índice pg_trgm: {str(e)}")
+
+
+def eliminar_indice_trigramas(apps, schema_editor):
+    """Revertir: eliminar el índice (la extensión se conserva)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP INDEX IF EXISTS producto_nombre_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0006_producto_busqueda'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice_trigramas, eliminar_indice_trigramas),
+    ]
@@ -0,0 +1,35 @@
+# Subidas de imágenes procesadas en segundo plano
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0007_producto_nombre_trgm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubidaImagen',
+            fields=[
+                ('id_subida', models.AutoField(primary_key=True, serialize=False)),
+                ('archivo', models.CharField(max_length=500)),
+                ('nombre_original', models.CharField(blank=True, max_length=255, null=True)),
+                ('content_type', models.CharField(max_length=50)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completada', 'Completada'), ('fallida', 'Fallida')], default='pendiente', max_length=20)),
+                ('intentos', models.IntegerField(default=0)),
+                ('url', models.URLField(blank=True, max_length=500, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Subida de Imagen',
+                'verbose_name_plural': 'Subidas de Imágenes',
+                'db_table': 'subida_imagen',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['estado', 'fecha_actualizacion'], name='subida_imagen_estado_idx')],
+            },
+        ),
+    ]
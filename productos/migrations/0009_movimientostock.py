@@ -0,0 +1,46 @@
+# Libro de movimientos de stock. Cada stock existente se registra como
+# movimiento 'inicial' para que la suma del libro coincida con Stock.cantidad.
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def registrar_stock_inicial(apps, schema_editor):
+    """Un movimiento 'inicial' por producto con el registro de stock que lee el catálogo"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO movimiento_stock (id_producto, tipo, cantidad, referencia, fecha)
+            SELECT s.id_producto, 'inicial', s.cantidad, NULL, CURRENT_TIMESTAMP
+            FROM stock s
+            WHERE s.cantidad <> 0
+              AND s.id_stock = (SELECT MIN(s2.id_stock) FROM stock s2 WHERE s2.id_producto = s.id_producto)
+        """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0008_subidaimagen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id_movimiento', models.BigAutoField(primary_key=True, serialize=False)),
+                ('tipo', models.CharField(choices=[('inicial', 'Stock inicial'), ('venta', 'Venta'), ('cancelacion', 'Cancelación'), ('reposicion', 'Reposición'), ('ajuste', 'Ajuste'), ('importacion', 'Importación'), ('compactacion', 'Saldo compactado')], max_length=20)),
+                ('cantidad', models.IntegerField()),
+                ('referencia', models.CharField(blank=True, max_length=100, null=True)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('producto', models.ForeignKey(db_column='id_producto', on_delete=django.db.models.deletion.CASCADE, related_name='movimientos_stock', to='productos.producto')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Stock',
+                'verbose_name_plural': 'Movimientos de Stock',
+                'db_table': 'movimiento_stock',
+                'ordering': ['-fecha'],
+                'indexes': [models.Index(fields=['producto', 'fecha'], name='mov_stock_producto_fecha_idx'), models.Index(fields=['fecha'], name='mov_stock_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(registrar_stock_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Un solo registro de stock por producto.
+# Se conserva el registro que leían el catálogo y el checkout (el de menor
+# id_stock) y se eliminan los duplicados; luego la relación pasa a ser 1 a 1.
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def deduplicar_stock(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            DELETE FROM stock
+            WHERE id_stock NOT IN (SELECT MIN(id_stock) FROM stock GROUP BY id_producto)
+        """)
+        if cursor.rowcount:
+            print(f"Registros de stock duplicados eliminados: {cursor.rowcount}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0009_movimientostock'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicar_stock, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='stock',
+            name='producto',
+            field=models.OneToOneField(db_column='id_producto', on_delete=django.db.models.deletion.CASCADE, related_name='stock', to='productos.producto'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Stock mínimo por producto y fecha de la última alerta de stock bajo.
+# El índice parcial solo incluye las filas con stock bajo.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0010_stock_producto_unico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='alerta_stock_bajo',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='stock_minimo',
+            field=models.PositiveIntegerField(default=10),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(condition=models.Q(('cantidad__lt', models.F('stock_minimo'))), fields=['cantidad'], name='stock_bajo_idx'),
+        ),
+    ]
@@ -0,0 +1,206 @@
+"""
+Miniaturas de imágenes de productos para el catálogo (CU6).
+Cada variante (200px y 400px, WebP) se genera en el pool de hilos de las
+imágenes la primera vez que se pide (mientras tanto la vista redirige a la
+original) y queda guardada en el storage en
+`miniaturas/<producto>/<tamaño>-<versión>.webp`. El comando
+`generar_miniaturas` las genera cuando no hay hilos (IMAGENES_WORKERS=0).
+La versión se deriva de la URL de la imagen original: si la imagen cambia,
+cambia la URL de la miniatura, así que se puede servir con caché de larga
+duración (immutable) sin riesgo de mostrar una imagen vieja.
+Los originales solo se leen del storage local o de MINIATURAS_HOSTS.
+"""
+import hashlib
+import io
+import logging
+import posixpath
+import threading
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.utils import validate_file_name
+from django.urls import reverse
+
+from backend_smart.trabajos import cantidad_workers, ejecutar_en_hilo, obtener_pool
+from .imagenes import obtener_session, TAMANO_MAXIMO
+from .models import Producto
+
+# Import opcional de Pillow
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    Image = ImageOps = None
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+TAMANOS_MINIATURA = (200, 400)
+CALIDAD_WEBP = 80
+MINIATURA_MAX_AGE = 60 * 60 * 24 * 365  # 1 año; la URL cambia con la imagen
+# Tras un error, no reintentar la misma imagen durante este tiempo
+MINIATURA_ERROR_TIMEOUT = 60 * 60
+
+_en_curso = set()
+_lock = threading.Lock()
+
+
+class ErrorMiniatura(Exception):
+    """No se pudo obtener o procesar la imagen original"""
+
+
+def version_imagen(url):
+    """Identificador corto de la imagen original (cambia si cambia la URL)"""
+    return hashlib.md5(url.encode('utf-8')).hexdigest()[:12]
+
+
+def urls_miniaturas(producto):
+    """{'200': url, '400': url} para el payload del catálogo; vacío si no hay imagen"""
+    if not producto.imagen:
+        return {}
+    version = version_imagen(producto.imagen)
+    return {
+        str(tamano): reverse('productos:miniatura_producto', args=[producto.id, tamano]) + f'?v={version}'
+        for tamano in TAMANOS_MINIATURA
+    }
+
+
+def _ruta_miniatura(producto_id, tamano, version):
+    return f'miniaturas/{producto_id}/{tamano}-{version}.webp'
+
+
+def _clave_error(producto_id, tamano, version):
+    return f'miniatura-error:{producto_id}:{tamano}:{version}'
+
+
+def origen_permitido(url):
+    """
+    True si la original se puede leer para generar la miniatura: un archivo
+    bajo MEDIA_URL o una URL de un host de MINIATURAS_HOSTS. Una ruta local
+    que sale de MEDIA_ROOT (`/media/../`) lanza SuspiciousFileOperation.
+    """
+    if url.startswith(settings.MEDIA_URL):
+        validate_file_name(url[len(settings.MEDIA_URL):], allow_relative_path=True)
+        return True
+    partes = urlsplit(url)
+    return partes.scheme in ('http', 'https') and partes.hostname in getattr(settings, 'MINIATURAS_HOSTS', [])
+
+
+def _leer_original(url):
+    """Bytes de la imagen original: del storage local (MEDIA_URL) o por HTTP"""
+    if not origen_permitido(url):
+        raise ErrorMiniatura(f'Origen no permitido: {url}')
+    if url.startswith(settings.MEDIA_URL):
+        ruta = url[len(settings.MEDIA_URL):]
+        try:
+            with default_storage.open(ruta, 'rb') as f:
+                return f.read()
+        except OSError as e:
+            raise ErrorMiniatura(f'No se pudo leer {ruta}: {str(e)}')
+
+    try:
+        # Sin seguir redirecciones: el host permitido no puede desviar la descarga
+        respuesta = obtener_session().get(url, timeout=(5, 15), stream=True, allow_redirects=False)
+        respuesta.raise_for_status()
+        contenido = respuesta.raw.read(TAMANO_MAXIMO + 1, decode_content=True)
+    except Exception as e:
+        raise ErrorMiniatura(f'No se pudo descargar {url}: {str(e)}')
+    if len(contenido) > TAMANO_MAXIMO:
+        raise ErrorMiniatura(f'Imagen original demasiado grande: {url}')
+    return contenido
+
+
+def generar_webp(contenido, tamano):
+    """Redimensionar (manteniendo la proporción) y codificar en WebP"""
+    try:
+        with Image.open(io.BytesIO(contenido)) as imagen:
+            imagen = ImageOps.exif_transpose(imagen)
+            if imagen.mode not in ('RGB', 'RGBA'):
+                imagen = imagen.convert('RGBA' if 'A' in imagen.getbands() else 'RGB')
+            imagen.thumbnail((tamano, tamano), Image.LANCZOS)
+            salida = io.BytesIO()
+            imagen.save(salida, format='WEBP', quality=CALIDAD_WEBP, method=4)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ErrorMiniatura(f'Imagen inválida: {str(e)}')
+    return salida.getvalue()
+
+
+def _eliminar_versiones_anteriores(producto_id, tamano, vigente):
+    """Borrar miniaturas de imágenes que el producto ya no usa"""
+    directorio = f'miniaturas/{producto_id}'
+    try:
+        _, archivos = default_storage.listdir(directorio)
+    except (OSError, NotImplementedError):
+        return
+    for nombre in archivos:
+        if nombre.startswith(f'{tamano}-') and nombre != vigente:
+            try:
+                default_storage.delete(posixpath.join(directorio, nombre))
+            except OSError as e:
+                logger.warning(f"No se pudo eliminar miniatura {nombre}: {str(e)}")
+
+
+def miniatura_guardada(producto, tamano):
+    """Bytes WebP de la miniatura vigente de `producto`, o None si todavía no se generó"""
+    ruta = _ruta_miniatura(producto.id, tamano, version_imagen(producto.imagen))
+    try:
+        with default_storage.open(ruta, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def generar_miniatura(producto, tamano):
+    """
+    Generar y guardar la miniatura de `producto` en `tamano` px (si no existe).
+    Lanza ErrorMiniatura si la original no se puede leer o procesar.
+    """
+    version = version_imagen(producto.imagen)
+    ruta = _ruta_miniatura(producto.id, tamano, version)
+    if default_storage.exists(ruta):
+        return
+    try:
+        contenido = generar_webp(_leer_original(producto.imagen), tamano)
+    except ErrorMiniatura:
+        cache.set(_clave_error(producto.id, tamano, version), True, MINIATURA_ERROR_TIMEOUT)
+        raise
+    # Otro hilo pudo generarla mientras tanto: no duplicar el archivo
+    if not default_storage.exists(ruta):
+        default_storage.save(ruta, ContentFile(contenido))
+        _eliminar_versiones_anteriores(producto.id, tamano, posixpath.basename(ruta))
+
+
+def _generar_en_hilo(clave, producto_id, tamano):
+    try:
+        producto = Producto.objects.filter(id=producto_id).only('id', 'imagen').first()
+        if producto and producto.imagen:
+            generar_miniatura(producto, tamano)
+    except ErrorMiniatura as e:
+        logger.warning(f"Miniatura de producto {producto_id} no disponible: {str(e)}")
+    finally:
+        with _lock:
+            _en_curso.discard(clave)
+
+
+def encolar_miniatura(producto, tamano):
+    """
+    Pedir la miniatura al pool de hilos de las imágenes. No hace nada sin
+    hilos, si ya está en curso o si la misma original falló hace poco.
+    """
+    if cantidad_workers('IMAGENES_WORKERS') <= 0:
+        return False
+    version = version_imagen(producto.imagen)
+    if cache.get(_clave_error(producto.id, tamano, version)):
+        return False
+    clave = (producto.id, tamano, version)
+    with _lock:
+        if clave in _en_curso:
+            return False
+        _en_curso.add(clave)
+    obtener_pool('subida-imagen', 'IMAGENES_WORKERS').submit(
+        ejecutar_en_hilo, f'miniatura {producto.id}/{tamano}', _generar_en_hilo, clave, producto.id, tamano
+    )
+    return True
@@ -1,4 +1,5 @@
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 
 
 class Marca(models.Model):
@@ -57,6 +58,8 @@ class Producto(models.Model):
     marca = models.ForeignKey(Marca, on_delete=models.SET_NULL, null=True, blank=True, db_column='id_marca')
     categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True, blank=True, db_column='id_categoria')
     proveedor = models.ForeignKey(Proveedor, on_delete=models.SET_NULL, null=True, blank=True, db_column='id_proveedor')
+    # tsvector (config 'spanish') de nombre + descripcion, mantenido por trigger en PostgreSQL
+    busqueda = SearchVectorField(null=True, blank=True, editable=False)
 
     class Meta:
         db_table = 'producto'
@@ -72,17 +75,66 @@ class Stock(models.Model):
     id_stock = models.AutoField(primary_key=True)
     cantidad = models.IntegerField(default=0)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
-    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, db_column='id_producto')
+    # Un registro por producto: se puede traer con select_related('stock')
+    producto = models.OneToOneField(Producto, on_delete=models.CASCADE, db_column='id_producto', related_name='stock')
+    # Por debajo de este valor el stock es bajo y se avisa a los administradores
+    stock_minimo = models.PositiveIntegerField(default=10)
+    # Última alerta de stock bajo enviada (evita repetirla dentro de la ventana)
+    alerta_stock_bajo = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = 'stock'
         verbose_name = 'Stock'
         verbose_name_plural = 'Stocks'
+        indexes = [
+            # Parcial: solo contiene los productos con stock bajo (pocas filas)
+            models.Index(
+                fields=['cantidad'], name='stock_bajo_idx',
+                condition=models.Q(cantidad__lt=models.F('stock_minimo')),
+            ),
+        ]
 
     def __str__(self):
         return f"Stock {self.producto.nombre}: {self.cantidad}"
 
 
+class MovimientoStock(models.Model):
+    """
+    Libro de movimientos de stock: solo se agregan filas. La suma de los
+    movimientos de un producto es igual a su Stock.cantidad (la proyección
+    que leen el catálogo y el checkout).
+    """
+    TIPOS_MOVIMIENTO = [
+        ('inicial', 'Stock inicial'),
+        ('venta', 'Venta'),
+        ('cancelacion', 'Cancelación'),
+        ('reposicion', 'Reposición'),
+        ('ajuste', 'Ajuste'),
+        ('importacion', 'Importación'),
+        ('compactacion', 'Saldo compactado'),
+    ]
+
+    id_movimiento = models.BigAutoField(primary_key=True)
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, db_column='id_producto', related_name='movimientos_stock')
+    tipo = models.CharField(max_length=20, choices=TIPOS_MOVIMIENTO)
+    cantidad = models.IntegerField()  # Positivo: entrada, negativo: salida
+    referencia = models.CharField(max_length=100, blank=True, null=True)  # p. ej. 'venta:123'
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'movimiento_stock'
+        verbose_name = 'Movimiento de Stock'
+        verbose_name_plural = 'Movimientos de Stock'
+        ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['producto', 'fecha'], name='mov_stock_producto_fecha_idx'),
+            models.Index(fields=['fecha'], name='mov_stock_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} {self.cantidad:+d} - Producto {self.producto_id}"
+
+
 class Medidas(models.Model):
     id = models.AutoField(primary_key=True)
     tipo_medida = models.CharField(max_length=50)  # peso, volumen, dimensiones, etc.
@@ -185,3 +237,36 @@ class CuponDescuento(models.Model):
         return (self.estado == 'activo' and 
                 self.fecha_inicio <= ahora <= self.fecha_fin and
                 self.usos_actuales < self.usos_maximos)
+
+
+class SubidaImagen(models.Model):
+    """Imagen recibida localmente y pendiente de subir al hosting (ImgBB)"""
+    ESTADOS_SUBIDA = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completada', 'Completada'),
+        ('fallida', 'Fallida'),
+    ]
+
+    id_subida = models.AutoField(primary_key=True)
+    archivo = models.CharField(max_length=500)  # Ruta relativa en el storage local
+    nombre_original = models.CharField(max_length=255, blank=True, null=True)
+    content_type = models.CharField(max_length=50)
+    estado = models.CharField(max_length=20, choices=ESTADOS_SUBIDA, default='pendiente')
+    intentos = models.IntegerField(default=0)
+    url = models.URLField(max_length=500, blank=True, null=True)  # URL final en el hosting
+    error = models.TextField(blank=True, null=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'subida_imagen'
+        verbose_name = 'Subida de Imagen'
+        verbose_name_plural = 'Subidas de Imágenes'
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_actualizacion'], name='subida_imagen_estado_idx'),
+        ]
+
+    def __str__(self):
+        return f"Subida #{self.id_subida} - {self.estado}"
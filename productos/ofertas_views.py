@@ -7,7 +7,8 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from datetime import datetime, timedelta
 from django.db.models import Q, Count, Sum, Avg
-from productos.models import Oferta, CuponDescuento, Producto, Categoria, Stock
+from productos.models import Oferta, CuponDescuento, Producto, Categoria
+from productos.inventario import stock_disponible
 from ventas_carrito.models import Venta, DetalleVenta
 from reportes_dinamicos.models import PrediccionVenta
 from autenticacion_usuarios.models import Notificacion, Usuario
@@ -207,27 +208,30 @@ class SugerirOfertasIAView(View):
                 total_vendido__lt=5  # Menos de 5 unidades vendidas
             ).order_by('total_vendido')[:10]
             
+            # Productos y stock en una sola consulta (JOIN)
+            productos_por_id = Producto.objects.select_related('stock').in_bulk(
+                [item['producto_id'] for item in productos_bajo_movimiento]
+            )
             for item in productos_bajo_movimiento:
-                try:
-                    producto = Producto.objects.get(id=item['producto_id'])
-                    stock = Stock.objects.filter(producto_id=producto.id).first()
-                    
-                    if stock and stock.cantidad > 0:
-                        sugerencias.append({
-                            'tipo': 'bajo_movimiento',
-                            'producto': {
-                                'id': producto.id,
-                                'nombre': producto.nombre,
-                                'precio': float(producto.precio),
-                                'imagen': producto.imagen,
-                                'stock': stock.cantidad
-                            },
-                            'razon': f'Producto con bajo movimiento de ventas ({item["total_vendido"]} unidades vendidas)',
-                            'descuento_sugerido': 15.0,  # 15% de descuento sugerido
-                            'prioridad': 'alta'
-                        })
-                except Producto.DoesNotExist:
+                producto = productos_por_id.get(item['producto_id'])
+                if producto is None:
                     continue
+                stock = stock_disponible(producto)
+                
+                if stock > 0:
+                    sugerencias.append({
+                        'tipo': 'bajo_movimiento',
+                        'producto': {
+                            'id': producto.id,
+                            'nombre': producto.nombre,
+                            'precio': float(producto.precio),
+                            'imagen': producto.imagen,
+                            'stock': stock
+                        },
+                        'razon': f'Producto con bajo movimiento de ventas ({item["total_vendido"]} unidades vendidas)',
+                        'descuento_sugerido': 15.0,  # 15% de descuento sugerido
+                        'prioridad': 'alta'
+                    })
             
             # 2. Productos con predicciones bajas de IA
             predicciones_bajas = PrediccionVenta.objects.filter(
@@ -240,11 +244,11 @@ class SugerirOfertasIAView(View):
                     categoria = pred.categoria
                     productos_categoria = Producto.objects.filter(
                         categoria=categoria
-                    )[:3]
+                    ).select_related('stock')[:3]
                     
                     for producto in productos_categoria:
-                        stock = Stock.objects.filter(producto_id=producto.id).first()
-                        if stock and stock.cantidad > 0:
+                        stock = stock_disponible(producto)
+                        if stock > 0:
                             sugerencias.append({
                                 'tipo': 'prediccion_baja',
                                 'producto': {
@@ -252,7 +256,7 @@ class SugerirOfertasIAView(View):
                                     'nombre': producto.nombre,
                                     'precio': float(producto.precio),
                                     'imagen': producto.imagen,
-                                    'stock': stock.cantidad
+                                    'stock': stock
                                 },
                                 'categoria': {
                                     'id': categoria.id_categoria,
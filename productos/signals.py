@@ -0,0 +1,25 @@
+"""
+Señales del catálogo: cualquier escritura de productos, categorías, marcas,
+proveedores o stock invalida las respuestas cacheadas del catálogo.
+Las actualizaciones masivas (QuerySet.update, bulk_create) no emiten señales
+y deben llamar a invalidar_catalogo() explícitamente.
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Producto, Categoria, Marca, Proveedor, Stock
+from .cache_catalogo import invalidar_catalogo
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_save, sender=Marca)
+@receiver(post_delete, sender=Marca)
+@receiver(post_save, sender=Proveedor)
+@receiver(post_delete, sender=Proveedor)
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def catalogo_modificado(sender, **kwargs):
+    invalidar_catalogo()
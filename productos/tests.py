@@ -1,3 +1,397 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, connections
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import Producto, Categoria, Marca, Proveedor, Stock, SubidaImagen, MovimientoStock
+from .cache_catalogo import version_catalogo
+from .catalogo import ORDENAMIENTOS_VALIDOS, CursorInvalido, codificar_cursor, decodificar_cursor
+from .importacion import ImportadorProductos, actualizar_en_bloque
+from .imagenes import SUBIDAS
+from .inventario import ajustar_stock, reservar_stock, conciliar_stock
+from .miniaturas import PIL_AVAILABLE, ErrorMiniatura, _leer_original, generar_miniatura, urls_miniaturas
+
+
+class CatalogoConsultasTest(TestCase):
+    """CU6/CU4: la página del catálogo cuesta las mismas consultas sea cual sea su tamaño"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Electrodomésticos')
+        marca = Marca.objects.create(nombre='Marca')
+        proveedor = Proveedor.objects.create(nombre='Proveedor')
+        productos = Producto.objects.bulk_create([
+            Producto(nombre=f'Producto {i:02d}', precio=10 + i, categoria=categoria, marca=marca, proveedor=proveedor)
+            for i in range(30)
+        ])
+        Stock.objects.bulk_create([Stock(producto=p, cantidad=i) for i, p in enumerate(productos)])
+
+    def setUp(self):
+        # ProductoListView cachea sus respuestas
+        cache.clear()
+
+    def _consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return len(consultas), respuesta.json()
+
+    def _verificar_constante(self, url):
+        chica, datos_chica = self._consultas(f'{url}?page_size=5')
+        grande, datos_grande = self._consultas(f'{url}?page_size=25')
+        self.assertEqual(len(datos_chica['items']), 5)
+        self.assertEqual(len(datos_grande['items']), 25)
+        self.assertEqual(chica, grande)
+        # Conteo total + página (con stock, categoría, marca y proveedor en la misma consulta)
+        self.assertLessEqual(grande, 2)
+
+    def test_listado_publico(self):
+        self._verificar_constante('/api/productos/')
+
+    def test_listado_admin(self):
+        self._verificar_constante('/api/productos/admin/')
+
+    def test_pagina_incluye_stock_y_relaciones(self):
+        _, datos = self._consultas('/api/productos/?page_size=1')
+        item = datos['items'][0]
+        self.assertEqual(item['stock'], 0)
+        self.assertEqual(item['categoria'], 'Electrodomésticos')
+        with self.assertNumQueries(2), CaptureQueriesContext(connection) as consultas:
+            self.client.get('/api/productos/admin/?page_size=30')
+        # El tsvector de búsqueda no viaja con las filas
+        self.assertNotIn('busqueda', consultas[-1]['sql'])
+
+
+class CatalogoCursorTest(TestCase):
+    """CU6: paginación por cursor estable con precios repetidos y cursores alterados"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Cinco precios distintos, cada uno repetido en cuatro productos
+        Producto.objects.bulk_create([Producto(nombre=f'Producto {i:02d}', precio=10 + i % 5) for i in range(20)])
+
+    def setUp(self):
+        cache.clear()
+
+    def _recorrer(self, order_by):
+        ids, cursor = [], ''
+        while cursor is not None:
+            respuesta = self.client.get('/api/productos/', {'order': order_by, 'page_size': 3, 'cursor': cursor})
+            self.assertEqual(respuesta.status_code, 200)
+            datos = respuesta.json()
+            ids += [item['id'] for item in datos['items']]
+            cursor = datos['next_cursor']
+        return ids
+
+    def test_codificar_y_decodificar(self):
+        producto = Producto.objects.order_by('id').first()
+        for order_by in ORDENAMIENTOS_VALIDOS:
+            cursor = codificar_cursor(producto, order_by)
+            valor = producto.nombre if order_by == 'nombre' else producto.precio
+            self.assertEqual(decodificar_cursor(cursor, order_by), (valor, producto.id))
+
+    def test_precios_repetidos_sin_saltos_ni_duplicados(self):
+        for order_by in ('precio', '-precio'):
+            esperados = list(Producto.objects.order_by(
+                order_by, '-id' if order_by.startswith('-') else 'id'
+            ).values_list('id', flat=True))
+            self.assertEqual(self._recorrer(order_by), esperados)
+
+    def test_cursor_alterado(self):
+        producto = Producto.objects.first()
+
+        def cursor(*contenido):
+            return base64.urlsafe_b64encode(json.dumps(contenido).encode()).decode()
+
+        alterados = [
+            'no-es-base64!', cursor('precio', '10'), cursor('precio', 'caro', producto.id),
+            cursor('precio', ['10'], producto.id), cursor('precio', 'NaN', producto.id),
+            cursor('precio', '10', 'x'), codificar_cursor(producto, 'nombre'),
+        ]
+        for alterado in alterados:
+            with self.subTest(cursor=alterado):
+                with self.assertRaises(CursorInvalido):
+                    decodificar_cursor(alterado, 'precio')
+                respuesta = self.client.get('/api/productos/', {'order': 'precio', 'cursor': alterado})
+                self.assertEqual(respuesta.status_code, 400)
+
+
+class CacheCatalogoTest(TestCase):
+    """CU6: cualquier escritura del catálogo invalida las respuestas cacheadas"""
+
+    def setUp(self):
+        cache.clear()
+        self.producto = Producto.objects.create(nombre='Horno', precio=120)
+        ajustar_stock(self.producto.id, 10, tipo='inicial')
+
+    def _stock_listado(self, cache_esperada):
+        respuesta = self.client.get('/api/productos/')
+        self.assertEqual(respuesta['X-Cache'], cache_esperada)
+        return respuesta.json()['items'][0]['stock']
+
+    def test_editar_stock_invalida_el_listado(self):
+        self.assertEqual(self._stock_listado('MISS'), 10)
+        self.assertEqual(self._stock_listado('HIT'), 10)
+
+        stock = Stock.objects.get(producto=self.producto)
+        stock.cantidad = 4
+        stock.save()
+        self.assertEqual(self._stock_listado('MISS'), 4)
+
+        # Descuento en bloque (sin señales): invalida al confirmar
+        with self.captureOnCommitCallbacks(execute=True):
+            reservar_stock([(self.producto.id, 1)])
+        self.assertEqual(self._stock_listado('MISS'), 3)
+
+    def test_guardar_y_eliminar_cambian_la_version(self):
+        instancias = [
+            Categoria(nombre='Cocina'), Marca(nombre='Marca'), Proveedor(nombre='Proveedor'),
+            Producto(nombre='Batidora', precio=20),
+        ]
+        for instancia in instancias + [Stock.objects.get(producto=self.producto)]:
+            with self.subTest(modelo=type(instancia).__name__):
+                version = version_catalogo()
+                instancia.save()
+                self.assertGreater(version_catalogo(), version)
+                version = version_catalogo()
+                instancia.delete()
+                self.assertGreater(version_catalogo(), version)
+
+
+class ImportadorProductosTest(TestCase):
+    """Importación masiva: precio opcional al actualizar y errores contados una sola vez"""
+
+    def test_actualizar_solo_stock(self):
+        producto = Producto.objects.create(nombre='Heladera', precio=100)
+        resumen = ImportadorProductos().importar([
+            {'nombre': 'Heladera', 'precio': '', 'stock': '7'},
+            {'nombre': 'Nuevo sin precio', 'stock': '3'},
+        ])
+        self.assertEqual(resumen['actualizados'], 1)
+        self.assertEqual(resumen['creados'], 0)
+        self.assertEqual([e['fila'] for e in resumen['errores']], [2])
+        producto.refresh_from_db()
+        self.assertEqual(producto.precio, 100)
+        self.assertEqual(producto.stock.cantidad, 7)
+
+    def test_lote_revertido_no_duplica_errores(self):
+        filas = [
+            {'id': '999999', 'nombre': 'No existe', 'precio': '1'},
+            {'nombre': 'Producto A', 'precio': '10', 'stock': '1'},
+        ]
+        importador = ImportadorProductos()
+        with mock.patch.object(ImportadorProductos, '_upsert_stock', side_effect=RuntimeError('falla')):
+            resumen = importador.importar(filas)
+        self.assertEqual(resumen['total_errores'], 2)
+        self.assertEqual(sorted(e['fila'] for e in resumen['errores']), [1, 2])
+        self.assertIn('no encontrado', resumen['errores'][0]['error'])
+        self.assertEqual(resumen['creados'], 0)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'requiere bloqueos de fila reales (PostgreSQL)')
+@override_settings(EVENTOS_WORKERS=0)
+class ImportacionConcurrenteTest(TransactionTestCase):
+    """CU4: una venta durante la importación no desincroniza el stock del libro"""
+
+    def test_venta_entre_lectura_y_escritura(self):
+        producto = Producto.objects.create(nombre='Ventilador', precio=60)
+        ajustar_stock(producto.id, 10, tipo='inicial')
+        venta = threading.Thread(target=lambda: (reservar_stock([(producto.id, 2)]), connections.close_all()))
+
+        def escribir_stock(modelo, *args, **kwargs):
+            if modelo is Stock and not venta.is_alive():
+                # El importador ya leyó el stock: la venta intenta descontar antes de la escritura
+                venta.start()
+                venta.join(0.5)
+            return actualizar_en_bloque(modelo, *args, **kwargs)
+
+        with mock.patch('productos.importacion.actualizar_en_bloque', side_effect=escribir_stock):
+            ImportadorProductos().importar([{'nombre': 'Ventilador', 'stock': '20'}])
+        venta.join()
+
+        self.assertEqual(Stock.objects.get(producto=producto).cantidad, 18)
+        self.assertEqual(conciliar_stock(), [])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGENES_WORKERS=0)
+class SubidaImagenTest(TestCase):
+    """Con IMAGENES_WORKERS=0 la subida queda pendiente para procesar_subidas_imagenes"""
+
+    def test_sin_hilos_no_encola(self):
+        imagen = SimpleUploadedFile('foto.png', b'\x89PNG\r\n', content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            respuesta = self.client.post('/api/productos/upload-image/', {'image': imagen})
+        self.assertEqual(respuesta.status_code, 202)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(SubidaImagen.objects.get().estado, 'pendiente')
+
+    def test_error_inesperado_cuenta_como_intento(self):
+        ruta = default_storage.save('subidas/foto.png', ContentFile(b'\x89PNG\r\n'))
+        subida = SubidaImagen.objects.create(archivo=ruta, nombre_original='foto.png', content_type='image/png')
+        respuesta = mock.Mock(status_code=200)
+        respuesta.json.return_value = {'success': True}  # sin 'data': KeyError
+        with mock.patch('productos.imagenes.obtener_session') as session:
+            session.return_value.post.return_value = respuesta
+            call_command('procesar_subidas_imagenes', max_intentos=1, stdout=io.StringIO())
+
+        subida.refresh_from_db()
+        self.assertEqual((subida.estado, subida.intentos), ('fallida', 1))
+        self.assertFalse(SUBIDAS.pendientes(max_intentos=1).exists())
+
+
+class LibroStockTest(TestCase):
+    """CU4: --conciliar solo lee el libro; compactar requiere --compactar"""
+
+    def _ejecutar(self, **opciones):
+        salida = io.StringIO()
+        call_command('compactar_movimientos_stock', stdout=salida, **opciones)
+        return salida.getvalue()
+
+    def test_conciliar_no_compacta(self):
+        producto = Producto.objects.create(nombre='Tostadora', precio=30)
+        ajustar_stock(producto.id, 10, tipo='inicial')
+        ajustar_stock(producto.id, 7)
+        MovimientoStock.objects.update(fecha=timezone.now() - timedelta(days=200))
+
+        self.assertIn('Productos con diferencias: 0', self._ejecutar(conciliar=True))
+        self.assertEqual(MovimientoStock.objects.count(), 2)
+
+        self._ejecutar(conciliar=True, compactar=True)
+        self.assertEqual(list(MovimientoStock.objects.values_list('tipo', 'cantidad')), [('compactacion', 7)])
+
+        Stock.objects.filter(producto=producto).update(cantidad=9)
+        self.assertIn('stock 9 / libro 7', self._ejecutar(conciliar=True))
+
+
+class ProductoAdminStockTest(TestCase):
+    """CU4: el stock del formulario de administración llega como número o como texto"""
+
+    def _enviar(self, metodo, datos):
+        return getattr(self.client, metodo)('/api/productos/admin/', json.dumps(datos), content_type='application/json')
+
+    def test_stock_como_texto(self):
+        respuesta = self._enviar('post', {'nombre': 'Licuadora', 'precio': '45', 'stock': '5', 'stock_minimo': '2'})
+        self.assertEqual(respuesta.status_code, 201)
+        stock = Stock.objects.get(producto_id=respuesta.json()['id'])
+        self.assertEqual((stock.cantidad, stock.stock_minimo), (5, 2))
+
+        respuesta = self._enviar('put', {'id': stock.producto_id, 'stock': '3'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(MovimientoStock.objects.filter(producto_id=stock.producto_id).count(), 2)
+        self.assertEqual(conciliar_stock(), [])
+
+    def test_stock_invalido(self):
+        respuesta = self._enviar('post', {'nombre': 'Licuadora', 'precio': '45', 'stock': 'cinco'})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(Producto.objects.exists())
+
+
+@override_settings(EVENTOS_WORKERS=0)
+class AlertaStockBajoTest(TestCase):
+    """CU11: la alerta sale por la bandeja de salida y la ventana se marca al entregarla"""
+
+    def setUp(self):
+        from autenticacion_usuarios.models import Rol, Usuario
+        rol = Rol.objects.create(nombre='Administrador')
+        Usuario.objects.create(nombre='Admin', contrasena='x', email='admin@ejemplo.test', id_rol=rol)
+        self.producto = Producto.objects.create(nombre='Cafetera', precio=80)
+        ajustar_stock(self.producto.id, 5, tipo='inicial', stock_minimo=3)
+
+    def _alerta(self):
+        return Stock.objects.get(producto=self.producto).alerta_stock_bajo
+
+    def test_fallo_de_entrega_no_silencia_la_alerta(self):
+        from autenticacion_usuarios.models import Notificacion
+        from ventas_carrito.eventos import EVENTOS
+        from ventas_carrito.models import EventoSalida
+
+        reservar_stock([(self.producto.id, 3)])
+        evento = EventoSalida.objects.get(tipo='stock_bajo')
+        self.assertEqual(evento.datos, {'producto_ids': [self.producto.id]})
+        self.assertIsNone(self._alerta())
+
+        with mock.patch('autenticacion_usuarios.notificaciones_views.Notificacion.objects.bulk_create',
+                        side_effect=RuntimeError('sin conexión')):
+            self.assertEqual(EVENTOS.procesar(evento.id_evento).estado, 'fallido')
+        self.assertIsNone(self._alerta())
+
+        self.assertEqual(EVENTOS.procesar(evento.id_evento).estado, 'completado')
+        self.assertIsNotNone(self._alerta())
+        self.assertEqual(Notificacion.objects.filter(tipo='stock').count(), 1)
+
+        # Vuelve a cruzar el mínimo dentro de la ventana: sin otra alerta
+        ajustar_stock(self.producto.id, 5)
+        reservar_stock([(self.producto.id, 3)])
+        self.assertEqual(EventoSalida.objects.filter(tipo='stock_bajo').count(), 1)
+
+    def test_importacion_que_baja_del_minimo(self):
+        from ventas_carrito.models import EventoSalida
+
+        ImportadorProductos().importar([{'nombre': 'Cafetera', 'stock': '4'}])
+        self.assertFalse(EventoSalida.objects.filter(tipo='stock_bajo').exists())
+
+        ImportadorProductos().importar([{'nombre': 'Cafetera', 'stock': '2'}])
+        evento = EventoSalida.objects.get(tipo='stock_bajo')
+        self.assertEqual(evento.datos, {'producto_ids': [self.producto.id]})
+
+
+@skipUnless(PIL_AVAILABLE, 'Pillow no está instalado')
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), MINIATURAS_HOSTS=['i.ibb.co'])
+class MiniaturaTest(TestCase):
+    """CU6: la miniatura se genera fuera del request y solo desde orígenes permitidos"""
+
+    def setUp(self):
+        cache.clear()
+
+    def _producto(self, imagen):
+        return Producto.objects.create(nombre='Licuadora', precio=50, imagen=imagen)
+
+    def _pedir(self, producto, tamano='200'):
+        return self.client.get(urls_miniaturas(producto)[tamano])
+
+    def test_primera_vez_redirige_y_encola(self):
+        from PIL import Image
+        salida = io.BytesIO()
+        Image.new('RGB', (800, 600), 'red').save(salida, format='PNG')
+        ruta = default_storage.save('subidas/original.png', ContentFile(salida.getvalue()))
+        producto = self._producto(f'/media/{ruta}')
+
+        with mock.patch('productos.views.encolar_miniatura') as encolar:
+            respuesta = self._pedir(producto)
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(respuesta['Location'], producto.imagen)
+        self.assertIn('no-cache', respuesta['Cache-Control'])
+        encolar.assert_called_once_with(mock.ANY, 200)
+
+        # Lo que hace el hilo de las imágenes
+        generar_miniatura(producto, 200)
+        respuesta = self._pedir(producto)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'image/webp')
+        self.assertIn('immutable', respuesta['Cache-Control'])
+
+    def test_ruta_fuera_del_storage(self):
+        producto = self._producto('/media/../backend_smart/settings.py')
+        self.assertEqual(self._pedir(producto).status_code, 404)
+
+    def test_host_no_permitido(self):
+        producto = self._producto('http://169.254.169.254/latest/meta-data.png')
+        with mock.patch('productos.views.encolar_miniatura') as encolar:
+            respuesta = self._pedir(producto)
+        self.assertEqual(respuesta.status_code, 302)
+        encolar.assert_not_called()
+        with self.assertRaises(ErrorMiniatura):
+            _leer_original(producto.imagen)
@@ -6,8 +6,16 @@ app_name = 'productos'
 
 urlpatterns = [
     path('', views.ProductoListView.as_view(), name='list_products'),
+    path('facetas/', views.ProductoFacetasView.as_view(), name='facetas_products'),
+    path('autocomplete/', views.ProductoAutocompleteView.as_view(), name='autocomplete_products'),
+    path('<int:producto_id>/miniatura/<int:tamano>/', views.ProductoMiniaturaView.as_view(), name='miniatura_producto'),
+    path('<int:producto_id>/movimientos-stock/', views.ProductoMovimientosStockView.as_view(), name='stock_movements'),
+    path('stock-bajo/', views.ProductoStockBajoView.as_view(), name='low_stock_products'),
     path('admin/', views.ProductoAdminView.as_view(), name='admin_products'),
+    path('importar/', views.ProductoImportView.as_view(), name='import_products'),
+    path('exportar/', views.ProductoExportView.as_view(), name='export_products'),
     path('upload-image/', views.UploadImageView.as_view(), name='upload_image'),
+    path('upload-image/<int:subida_id>/', views.UploadImageStatusView.as_view(), name='upload_image_status'),
     path('categorias/', views.CategoriaListView.as_view(), name='list_categorias'),
             # Ofertas y Cupones
             path('ofertas/', ofertas_views.OfertasView.as_view(), name='ofertas'),
@@ -1,16 +1,32 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils.cache import add_never_cache_headers, patch_cache_control
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.db.models import Q
 from django.views.decorators.http import require_http_methods
-from django.conf import settings
+from django.db.models import Count
 import json
-import requests
-import base64
+import io
 import logging
 
-from .models import Producto, Categoria, Marca, Proveedor, Stock
+from .models import Producto, Categoria, Marca, Proveedor, Stock, SubidaImagen
+from .catalogo import (
+    ORDENAMIENTOS_VALIDOS, CursorInvalido,
+    productos_con_stock, filtrar_catalogo, ordenar_catalogo,
+    obtener_paginacion, serializar_pagina, paginar_por_cursor, total_cacheado,
+    facetas_catalogo, categorias_con_conteos, expresion_stock_actual,
+)
+from .cache_catalogo import cache_catalogo
+from .importacion import ImportadorProductos, detectar_formato, leer_filas
+from .exportacion import FORMATOS_EXPORTACION, exportar_catalogo
+from .imagenes import validar_imagen, recibir_imagen, url_local
+from .inventario import ajustar_stock, historial_stock, productos_stock_bajo
+from .miniaturas import (
+    TAMANOS_MINIATURA, MINIATURA_MAX_AGE, PIL_AVAILABLE,
+    encolar_miniatura, miniatura_guardada, origen_permitido, urls_miniaturas, version_imagen,
+)
+from .busqueda import autocompletar_productos, AUTOCOMPLETADO_LIMITE_DEFAULT, AUTOCOMPLETADO_LIMITE_MAX
 
 logger = logging.getLogger(__name__)
 
@@ -18,136 +34,30 @@ logger = logging.getLogger(__name__)
 @method_decorator(csrf_exempt, name='dispatch')
 class ProductoListView(View):
     """CU6: Listado público de productos"""
+    @cache_catalogo('productos')
     def get(self, request):
         try:
-            productos = Producto.objects.all().select_related('categoria', 'marca', 'proveedor')
+            # Filtros CU7 y ordenamiento
+            productos = filtrar_catalogo(productos_con_stock(), request.GET)
+            # Con texto de búsqueda se ordena por relevancia salvo que se pida otro orden
+            order_by = request.GET.get('order') or ('relevancia' if request.GET.get('q') else 'nombre')
 
-            # Filtros CU7
-            query = request.GET.get('q')
-            categoria_nombre = request.GET.get('categoria')
-            min_precio = request.GET.get('min')
-            max_precio = request.GET.get('max')
-            order_by = request.GET.get('order', 'nombre') # Default order
+            # Paginación por cursor (opcional): ?cursor= para la primera página
+            if 'cursor' in request.GET:
+                if order_by not in ORDENAMIENTOS_VALIDOS:
+                    order_by = 'nombre'
+                return self._get_por_cursor(request, productos, order_by)
 
-            if query:
-                productos = productos.filter(Q(nombre__icontains=query) | Q(descripcion__icontains=query))
-            
-            if categoria_nombre and categoria_nombre != 'Todos':
-                productos = productos.filter(categoria__nombre__iexact=categoria_nombre)
-            
-            if min_precio:
-                try:
-                    productos = productos.filter(precio__gte=float(min_precio))
-                except ValueError:
-                    pass
-            
-            if max_precio:
-                try:
-                    productos = productos.filter(precio__lte=float(max_precio))
-                except ValueError:
-                    pass
-            
-            # Ordenamiento
-            if order_by in ['nombre', 'precio', '-precio']:
-                productos = productos.order_by(order_by)
-            else:
-                productos = productos.order_by('nombre') # Default fallback
+            productos = ordenar_catalogo(productos, order_by)
 
-            # Paginación (simple, se puede mejorar con Django Paginator)
-            try:
-                page = int(request.GET.get('page', 1))
-                page_size = int(request.GET.get('page_size', 100))  # Aumentado a 100 por defecto
-            except ValueError:
-                page = 1
-                page_size = 100
-            
+            # Paginación
+            page, page_size = obtener_paginacion(request.GET)
             start = (page - 1) * page_size
             end = start + page_size
 
             total_items = productos.count()
-            productos = productos[start:end]
+            data = serializar_pagina(productos[start:end])
 
-            data = []
-            productos_ids_procesados = set()
-            for p in productos:
-                try:
-                    # Evitar duplicados
-                    if p.id in productos_ids_procesados:
-                        continue
-                    productos_ids_procesados.add(p.id)
-                    
-                    # Obtener stock actual de forma segura
-                    stock_cantidad = 0
-                    try:
-                        stock_obj = Stock.objects.filter(producto_id=p.id).first()
-                        if stock_obj:
-                            stock_cantidad = stock_obj.cantidad
-                    except Exception as stock_error:
-                        logger.warning(f"Error obteniendo stock para producto {p.id}: {str(stock_error)}")
-                    
-                    # Acceso seguro a relaciones
-                    categoria_nombre = None
-                    try:
-                        if p.categoria_id:
-                            categoria_nombre = p.categoria.nombre if p.categoria else None
-                    except Exception as cat_error:
-                        logger.warning(f"Error obteniendo categoría para producto {p.id}: {str(cat_error)}")
-                    
-                    marca_nombre = None
-                    try:
-                        if p.marca_id:
-                            marca_nombre = p.marca.nombre if p.marca else None
-                    except Exception as marca_error:
-                        logger.warning(f"Error obteniendo marca para producto {p.id}: {str(marca_error)}")
-                    
-                    proveedor_nombre = None
-                    try:
-                        if p.proveedor_id:
-                            proveedor_nombre = p.proveedor.nombre if p.proveedor else None
-                    except Exception as prov_error:
-                        logger.warning(f"Error obteniendo proveedor para producto {p.id}: {str(prov_error)}")
-                    
-                    # Asegurar que el precio sea válido
-                    precio_valor = 0.0
-                    try:
-                        if p.precio is not None:
-                            precio_valor = float(p.precio)
-                    except (ValueError, TypeError):
-                        logger.warning(f"Precio inválido para producto {p.id}: {p.precio}")
-                    
-                    data.append({
-                        'id': p.id,
-                        'nombre': p.nombre or '',
-                        'descripcion': p.descripcion or '',
-                        'precio': precio_valor,
-                        'stock': stock_cantidad,
-                        'imagen': p.imagen or '',
-                        'categoria': categoria_nombre,
-                        'marca': marca_nombre,
-                        'proveedor': proveedor_nombre,
-                        'estado': True,
-                    })
-                except Exception as e:
-                    # Si hay error con un producto, loguear pero continuar con los demás
-                    logger.error(f"Error procesando producto {p.id} (nombre: {getattr(p, 'nombre', 'N/A')}): {str(e)}", exc_info=True)
-                    # Intentar agregar el producto de todas formas con datos mínimos
-                    try:
-                        data.append({
-                            'id': p.id,
-                            'nombre': getattr(p, 'nombre', 'Producto sin nombre') or 'Producto sin nombre',
-                            'descripcion': getattr(p, 'descripcion', '') or '',
-                            'precio': 0.0,
-                            'stock': 0,
-                            'imagen': getattr(p, 'imagen', '') or '',
-                            'categoria': None,
-                            'marca': None,
-                            'proveedor': None,
-                            'estado': True,
-                        })
-                    except:
-                        pass  # Si ni siquiera esto funciona, saltar el producto
-                    continue
-            
             return JsonResponse({
                 'success': True,
                 'items': data,
@@ -163,6 +73,129 @@ class ProductoListView(View):
                 'message': f'Error al obtener productos: {str(e)}'
             }, status=500)
 
+    def _get_por_cursor(self, request, productos, order_by):
+        """Paginación keyset: el costo no crece con la profundidad de la página"""
+        _, page_size = obtener_paginacion(request.GET)
+        try:
+            pagina, next_cursor = paginar_por_cursor(
+                productos, order_by, request.GET.get('cursor'), page_size
+            )
+        except CursorInvalido as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+        return JsonResponse({
+            'success': True,
+            'items': serializar_pagina(pagina),
+            'total': total_cacheado(productos, request.GET),
+            'total_aproximado': True,
+            'page_size': page_size,
+            'next_cursor': next_cursor,
+        }, status=200)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ProductoFacetasView(View):
+    """CU7: Conteos por categoría, marca y rango de precio para los filtros del catálogo"""
+
+    @cache_catalogo('facetas')
+    def get(self, request):
+        try:
+            facetas = facetas_catalogo(request.GET)
+            return JsonResponse({
+                'success': True,
+                **facetas,
+            }, status=200)
+
+        except Exception as e:
+            logger.error(f"Error en ProductoFacetasView: {str(e)}", exc_info=True)
+            return JsonResponse({
+                'success': False,
+                'message': f'Error al obtener facetas: {str(e)}'
+            }, status=500)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ProductoAutocompleteView(View):
+    """CU7: Sugerencias de nombres de productos mientras el usuario escribe"""
+
+    @cache_catalogo('autocompletado')
+    def get(self, request):
+        try:
+            texto = request.GET.get('q', '')
+            try:
+                limite = int(request.GET.get('limite', AUTOCOMPLETADO_LIMITE_DEFAULT))
+            except ValueError:
+                limite = AUTOCOMPLETADO_LIMITE_DEFAULT
+            limite = max(1, min(limite, AUTOCOMPLETADO_LIMITE_MAX))
+
+            sugerencias = [
+                {
+                    'id': p['id'],
+                    'nombre': p['nombre'] or '',
+                    'imagen': p['imagen'] or '',
+                }
+                for p in autocompletar_productos(texto, limite)
+            ]
+
+            return JsonResponse({
+                'success': True,
+                'sugerencias': sugerencias,
+            }, status=200)
+
+        except Exception as e:
+            logger.error(f"Error en ProductoAutocompleteView: {str(e)}", exc_info=True)
+            return JsonResponse({
+                'success': False,
+                'message': f'Error al obtener sugerencias: {str(e)}'
+            }, status=500)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ProductoMiniaturaView(View):
+    """
+    CU6: Miniatura WebP de la imagen de un producto.
+    Si todavía no existe, se pide al pool de hilos de las imágenes y se
+    redirige a la original (sin caché) hasta que esté lista.
+    """
+
+    def get(self, request, producto_id, tamano):
+        if tamano not in TAMANOS_MINIATURA:
+            return JsonResponse({'success': False, 'message': 'Tamaño de miniatura no soportado'}, status=404)
+
+        producto = Producto.objects.filter(id=producto_id).only('id', 'imagen').first()
+        if not producto or not producto.imagen:
+            return JsonResponse({'success': False, 'message': 'Producto sin imagen'}, status=404)
+
+        version = version_imagen(producto.imagen)
+        if request.GET.get('v') != version:
+            # URL vieja o sin versión: redirigir a la URL vigente (esa sí es cacheable)
+            return HttpResponseRedirect(urls_miniaturas(producto)[str(tamano)])
+
+        try:
+            permitido = origen_permitido(producto.imagen)
+        except SuspiciousFileOperation:
+            logger.warning(f"Imagen del producto {producto_id} fuera del storage: {producto.imagen}")
+            return JsonResponse({'success': False, 'message': 'Producto sin imagen'}, status=404)
+
+        etag = f'"{version}-{tamano}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponse(status=304)
+        else:
+            contenido = miniatura_guardada(producto, tamano) if PIL_AVAILABLE else None
+            if contenido is None:
+                if not PIL_AVAILABLE:
+                    logger.warning("Pillow no está instalado; se sirve la imagen original")
+                elif permitido:
+                    encolar_miniatura(producto, tamano)
+                response = HttpResponseRedirect(producto.imagen)
+                add_never_cache_headers(response)
+                return response
+            response = HttpResponse(contenido, content_type='image/webp')
+
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=MINIATURA_MAX_AGE, immutable=True)
+        return response
+
 
 @method_decorator(csrf_exempt, name='dispatch')
 class ProductoAdminView(View):
@@ -171,120 +204,18 @@ class ProductoAdminView(View):
     def get(self, request):
         """Listar todos los productos para administración"""
         try:
-            productos = Producto.objects.all().select_related('categoria', 'marca', 'proveedor')
-            
-            # Filtros administrativos
-            query = request.GET.get('q')
-            categoria_nombre = request.GET.get('categoria')
-            order_by = request.GET.get('order', 'nombre')
-
-            if query:
-                productos = productos.filter(Q(nombre__icontains=query) | Q(descripcion__icontains=query))
-            
-            if categoria_nombre and categoria_nombre != 'Todos':
-                productos = productos.filter(categoria__nombre__iexact=categoria_nombre)
-            
-            # Ordenamiento
-            if order_by in ['nombre', 'precio', '-precio']:
-                productos = productos.order_by(order_by)
-            else:
-                productos = productos.order_by('nombre')
+            # Filtros administrativos (sin rango de precios)
+            productos = filtrar_catalogo(productos_con_stock(), request.GET, filtrar_precio=False)
+            productos = ordenar_catalogo(productos, request.GET.get('order', 'nombre'))
 
             # Paginación
-            try:
-                page = int(request.GET.get('page', 1))
-                page_size = int(request.GET.get('page_size', 100))
-            except ValueError:
-                page = 1
-                page_size = 100
-            
+            page, page_size = obtener_paginacion(request.GET)
             start = (page - 1) * page_size
             end = start + page_size
 
             total_items = productos.count()
-            productos = productos[start:end]
+            data = serializar_pagina(productos[start:end])
 
-            data = []
-            productos_ids_procesados = set()
-            for p in productos:
-                try:
-                    # Evitar duplicados
-                    if p.id in productos_ids_procesados:
-                        continue
-                    productos_ids_procesados.add(p.id)
-                    
-                    # Obtener stock actual de forma segura
-                    stock_cantidad = 0
-                    try:
-                        stock_obj = Stock.objects.filter(producto_id=p.id).first()
-                        if stock_obj:
-                            stock_cantidad = stock_obj.cantidad
-                    except Exception as stock_error:
-                        logger.warning(f"Error obteniendo stock para producto {p.id}: {str(stock_error)}")
-                    
-                    # Acceso seguro a relaciones
-                    categoria_nombre = None
-                    try:
-                        if p.categoria_id:
-                            categoria_nombre = p.categoria.nombre if p.categoria else None
-                    except Exception as cat_error:
-                        logger.warning(f"Error obteniendo categoría para producto {p.id}: {str(cat_error)}")
-                    
-                    marca_nombre = None
-                    try:
-                        if p.marca_id:
-                            marca_nombre = p.marca.nombre if p.marca else None
-                    except Exception as marca_error:
-                        logger.warning(f"Error obteniendo marca para producto {p.id}: {str(marca_error)}")
-                    
-                    proveedor_nombre = None
-                    try:
-                        if p.proveedor_id:
-                            proveedor_nombre = p.proveedor.nombre if p.proveedor else None
-                    except Exception as prov_error:
-                        logger.warning(f"Error obteniendo proveedor para producto {p.id}: {str(prov_error)}")
-                    
-                    # Asegurar que el precio sea válido
-                    precio_valor = 0.0
-                    try:
-                        if p.precio is not None:
-                            precio_valor = float(p.precio)
-                    except (ValueError, TypeError):
-                        logger.warning(f"Precio inválido para producto {p.id}: {p.precio}")
-                    
-                    data.append({
-                        'id': p.id,
-                        'nombre': p.nombre or '',
-                        'descripcion': p.descripcion or '',
-                        'precio': precio_valor,
-                        'stock': stock_cantidad,
-                        'imagen': p.imagen or '',
-                        'categoria': categoria_nombre,
-                        'marca': marca_nombre,
-                        'proveedor': proveedor_nombre,
-                        'estado': True,
-                    })
-                except Exception as e:
-                    # Si hay error con un producto, loguear pero continuar con los demás
-                    logger.error(f"Error procesando producto {p.id} (nombre: {getattr(p, 'nombre', 'N/A')}): {str(e)}", exc_info=True)
-                    # Intentar agregar el producto de todas formas con datos mínimos
-                    try:
-                        data.append({
-                            'id': p.id,
-                            'nombre': getattr(p, 'nombre', 'Producto sin nombre') or 'Producto sin nombre',
-                            'descripcion': getattr(p, 'descripcion', '') or '',
-                            'precio': 0.0,
-                            'stock': 0,
-                            'imagen': getattr(p, 'imagen', '') or '',
-                            'categoria': None,
-                            'marca': None,
-                            'proveedor': None,
-                            'estado': True,
-                        })
-                    except:
-                        pass  # Si ni siquiera esto funciona, saltar el producto
-                    continue
-            
             return JsonResponse({
                 'success': True,
                 'items': data,
@@ -300,6 +231,12 @@ class ProductoAdminView(View):
                 'message': f'Error al obtener productos: {str(e)}'
             }, status=500)
 
+    def _leer_stock(self, data):
+        """Stock y stock mínimo del cuerpo como enteros (None si no vienen)"""
+        stock = int(data['stock']) if data.get('stock') is not None else None
+        stock_minimo = int(data['stock_minimo']) if data.get('stock_minimo') is not None else None
+        return stock, stock_minimo
+
     def post(self, request):
         """Crear nuevo producto"""
         try:
@@ -312,6 +249,11 @@ class ProductoAdminView(View):
             if not data.get('precio'):
                 return JsonResponse({'success': False, 'message': 'El precio es obligatorio'}, status=400)
 
+            try:
+                stock_cantidad, stock_minimo = self._leer_stock(data)
+            except (TypeError, ValueError):
+                return JsonResponse({'success': False, 'message': 'El stock debe ser un número entero'}, status=400)
+
             # Obtener o crear categoría
             categoria = None
             if data.get('categoria'):
@@ -339,12 +281,9 @@ class ProductoAdminView(View):
             )
 
             # Crear stock inicial
-            stock_cantidad = data.get('stock', 0)
-            if stock_cantidad > 0:
-                Stock.objects.create(
-                    producto=producto,
-                    cantidad=stock_cantidad
-                )
+            stock_cantidad = stock_cantidad or 0
+            if stock_cantidad > 0 or stock_minimo is not None:
+                ajustar_stock(producto.id, stock_cantidad, tipo='inicial', stock_minimo=stock_minimo)
 
             return JsonResponse({
                 'success': True,
@@ -371,6 +310,11 @@ class ProductoAdminView(View):
             except Producto.DoesNotExist:
                 return JsonResponse({'success': False, 'message': 'Producto no encontrado'}, status=404)
 
+            try:
+                stock_cantidad, stock_minimo = self._leer_stock(data)
+            except (TypeError, ValueError):
+                return JsonResponse({'success': False, 'message': 'El stock debe ser un número entero'}, status=400)
+
             # Actualizar campos
             if 'nombre' in data:
                 producto.nombre = data['nombre']
@@ -406,10 +350,10 @@ class ProductoAdminView(View):
             producto.save()
 
             # Actualizar stock
-            if 'stock' in data:
-                stock_obj, created = Stock.objects.get_or_create(producto=producto)
-                stock_obj.cantidad = data['stock']
-                stock_obj.save()
+            if stock_cantidad is not None:
+                ajustar_stock(producto.id, stock_cantidad, referencia='admin', stock_minimo=stock_minimo)
+            elif stock_minimo is not None:
+                Stock.objects.update_or_create(producto=producto, defaults={'stock_minimo': stock_minimo})
 
             return JsonResponse({
                 'success': True,
@@ -449,12 +393,118 @@ class ProductoAdminView(View):
             return JsonResponse({'success': False, 'message': str(e)}, status=500)
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class ProductoMovimientosStockView(View):
+    """CU4: Historial de movimientos de stock de un producto"""
+
+    def get(self, request, producto_id):
+        try:
+            limite = min(max(int(request.GET.get('limite', 50)), 1), 500)
+        except ValueError:
+            limite = 50
+
+        producto = Producto.objects.filter(id=producto_id).annotate(
+            stock_cantidad=expresion_stock_actual()
+        ).values('id', 'nombre', 'stock_cantidad').first()
+        if not producto:
+            return JsonResponse({'success': False, 'message': 'Producto no encontrado'}, status=404)
+
+        movimientos = [
+            {**m, 'fecha': m['fecha'].isoformat()}
+            for m in historial_stock(producto_id, limite)
+        ]
+        return JsonResponse({
+            'success': True,
+            'producto': {'id': producto['id'], 'nombre': producto['nombre'], 'stock': producto['stock_cantidad']},
+            'movimientos': movimientos,
+        }, status=200)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ProductoStockBajoView(View):
+    """CU4: Productos por debajo de su stock mínimo"""
+
+    def get(self, request):
+        items = [
+            {
+                'id': stock.producto_id,
+                'nombre': stock.producto.nombre,
+                'stock': stock.cantidad,
+                'stock_minimo': stock.stock_minimo,
+                'alerta_stock_bajo': stock.alerta_stock_bajo.isoformat() if stock.alerta_stock_bajo else None,
+            }
+            for stock in productos_stock_bajo()[:200]
+        ]
+        return JsonResponse({'success': True, 'items': items, 'total': len(items)}, status=200)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ProductoImportView(View):
+    """CU4: Importación masiva de productos y stock (CSV, JSON o NDJSON)"""
+
+    def post(self, request):
+        """
+        Acepta un archivo en el campo 'archivo' (multipart) o el cuerpo crudo.
+        El formato se toma de ?formato= o de la extensión del archivo.
+        """
+        try:
+            archivo = request.FILES.get('archivo')
+            formato = request.GET.get('formato') or request.POST.get('formato')
+
+            if archivo:
+                formato = detectar_formato(archivo.name, formato)
+                stream = io.TextIOWrapper(archivo.file, encoding='utf-8-sig', newline='')
+            elif request.body:
+                formato = detectar_formato(None, formato or 'json')
+                stream = io.StringIO(request.body.decode('utf-8-sig'), newline='')
+            else:
+                return JsonResponse({'success': False, 'message': 'No se envió archivo'}, status=400)
+
+            resumen = ImportadorProductos().importar(leer_filas(stream, formato))
+
+            return JsonResponse({
+                'success': True,
+                'message': f"Importación finalizada: {resumen['creados']} creados, {resumen['actualizados']} actualizados, {resumen['total_errores']} errores",
+                **resumen,
+            }, status=200)
+
+        except (ValueError, UnicodeDecodeError) as e:
+            return JsonResponse({'success': False, 'message': f'Archivo inválido: {str(e)}'}, status=400)
+        except Exception as e:
+            logger.error(f"Error en ProductoImportView: {str(e)}", exc_info=True)
+            return JsonResponse({'success': False, 'message': str(e)}, status=500)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ProductoExportView(View):
+    """CU6: Exportación del catálogo completo en streaming (NDJSON o CSV)"""
+
+    def get(self, request):
+        """?formato=ndjson (por defecto) o csv; acepta los filtros CU7 del listado"""
+        formato = (request.GET.get('formato') or 'ndjson').lower()
+        if formato == 'jsonl':
+            formato = 'ndjson'
+        if formato not in FORMATOS_EXPORTACION:
+            return JsonResponse({
+                'success': False,
+                'message': f'Formato no soportado: {formato}. Use ndjson o csv'
+            }, status=400)
+
+        response = StreamingHttpResponse(
+            exportar_catalogo(formato, request.GET),
+            content_type=FORMATOS_EXPORTACION[formato],
+        )
+        response['Content-Disposition'] = f'attachment; filename="productos.{formato}"'
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class UploadImageView(View):
-    """Nueva funcionalidad: Subir imágenes a ImgBB"""
+    """Nueva funcionalidad: Subir imágenes a ImgBB (en segundo plano)"""
     
     def post(self, request):
-        """Subir imagen a ImgBB y devolver URL"""
+        """Recibir la imagen y encolar su subida a ImgBB; responde 202 de inmediato"""
         try:
             # Obtener archivo del frontend
             file = request.FILES.get('image')
@@ -464,80 +514,73 @@ class UploadImageView(View):
                     'message': 'No se envió imagen'
                 }, status=400)
             
-            # Validar tipo de archivo
-            allowed_types = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
-            if file.content_type not in allowed_types:
+            # Validar tipo y tamaño
+            error = validar_imagen(file)
+            if error:
                 return JsonResponse({
                     'success': False, 
-                    'message': 'Tipo de archivo no válido. Solo se permiten: JPEG, PNG, GIF, WebP'
+                    'message': error
                 }, status=400)
             
-            # Validar tamaño (32MB máximo para ImgBB gratuito)
-            if file.size > 32 * 1024 * 1024:
-                return JsonResponse({
-                    'success': False, 
-                    'message': 'Archivo demasiado grande. Máximo 32MB'
-                }, status=400)
-            
-            # Convertir a base64
-            file_data = file.read()
-            base64_data = base64.b64encode(file_data).decode('utf-8')
-            
-            # Subir a ImgBB
-            url = 'https://api.imgbb.com/1/upload'
-            data = {
-                'key': settings.API_KEY_IMGBB,
-                'image': base64_data
-            }
-            
-            response = requests.post(url, data=data, timeout=30)
-            result = response.json()
+            subida = recibir_imagen(file)
             
-            if result.get('success'):
-                image_url = result['data']['url']
-                return JsonResponse({
-                    'success': True,
-                    'image_url': image_url,
-                    'message': 'Imagen subida exitosamente'
-                })
-            else:
-                return JsonResponse({
-                    'success': False,
-                    'message': 'Error al subir imagen a ImgBB'
-                }, status=400)
-                
-        except requests.exceptions.Timeout:
             return JsonResponse({
-                'success': False,
-                'message': 'Timeout al subir imagen'
-            }, status=500)
-        except requests.exceptions.RequestException as e:
-            return JsonResponse({
-                'success': False,
-                'message': f'Error de conexión: {str(e)}'
-            }, status=500)
+                'success': True,
+                'subida_id': subida.id_subida,
+                'estado': subida.estado,
+                'status_url': f'/api/productos/upload-image/{subida.id_subida}/',
+                'url_local': url_local(subida),
+                'message': 'Imagen recibida. La subida a ImgBB continúa en segundo plano'
+            }, status=202)
+                
         except Exception as e:
+            logger.error(f"Error en UploadImageView: {str(e)}", exc_info=True)
             return JsonResponse({
                 'success': False,
                 'message': f'Error interno: {str(e)}'
             }, status=500)
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class UploadImageStatusView(View):
+    """Estado de una subida de imagen encolada"""
+
+    def get(self, request, subida_id):
+        try:
+            subida = SubidaImagen.objects.get(id_subida=subida_id)
+        except SubidaImagen.DoesNotExist:
+            return JsonResponse({'success': False, 'message': 'Subida no encontrada'}, status=404)
+
+        return JsonResponse({
+            'success': True,
+            'subida_id': subida.id_subida,
+            'estado': subida.estado,
+            'intentos': subida.intentos,
+            'image_url': subida.url,
+            'url_local': url_local(subida),
+            'error': subida.error,
+        }, status=200)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class CategoriaListView(View):
     """Gestión completa de categorías (CRUD)"""
     
+    @cache_catalogo('categorias')
     def get(self, request):
         """Obtener lista de todas las categorías disponibles"""
         try:
-            categorias = Categoria.objects.all().order_by('nombre')
+            # Conteos de productos anotados en la misma consulta
+            categorias = categorias_con_conteos()
             data = []
             for cat in categorias:
                 try:
                     data.append({
                         'id': cat.id_categoria,
                         'nombre': cat.nombre or '',
-                        'descripcion': cat.descripcion or ''
+                        'descripcion': cat.descripcion or '',
+                        'productos_count': cat.productos_count,
+                        'productos_en_stock': cat.productos_en_stock,
                     })
                 except Exception as e:
                     # Si hay error con una categoría, continuar con las demás
@@ -628,12 +671,15 @@ class CategoriaListView(View):
                 return JsonResponse({'success': False, 'message': 'ID de categoría requerido'}, status=400)
             
             try:
-                categoria = Categoria.objects.get(id_categoria=categoria_id)
+                # El conteo de productos se trae junto con la categoría
+                categoria = Categoria.objects.annotate(
+                    productos_count=Count('producto')
+                ).get(id_categoria=categoria_id)
             except Categoria.DoesNotExist:
                 return JsonResponse({'success': False, 'message': 'Categoría no encontrada'}, status=404)
             
             # Verificar si hay productos usando esta categoría
-            productos_count = Producto.objects.filter(categoria=categoria).count()
+            productos_count = categoria.productos_count
             if productos_count > 0:
                 return JsonResponse({
                     'success': False, 
@@ -5,7 +5,10 @@ from django.http import JsonResponse, HttpResponse, FileResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
-from django.db.models import Q, Sum, Count, Avg, Max, Min
+from django.db.models import (
+    Q, F, Sum, Count, Avg, Max, Min, OuterRef, Subquery, Value, IntegerField, DecimalField, ExpressionWrapper,
+)
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.conf import settings
 from datetime import datetime, timedelta
@@ -23,11 +26,16 @@ from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from .models import Reporte, ModeloIA, PrediccionVenta
 from .interpreter import ReporteInterpreter
 from ventas_carrito.models import Venta, DetalleVenta
-from productos.models import Producto, Categoria
+from productos.models import Producto, Categoria, Stock
+from productos.catalogo import expresion_stock_actual
 from autenticacion_usuarios.models import Usuario, Cliente
 
 logger = logging.getLogger(__name__)
 
+# Reporte de inventario: días de ventas para la velocidad y filas mostradas
+DIAS_VELOCIDAD_INVENTARIO = 30
+LIMITE_REPORTE_INVENTARIO = 100
+
 
 @method_decorator(csrf_exempt, name='dispatch')
 class SolicitarReporteView(View):
@@ -646,7 +654,7 @@ class GeneradorReporte:
     
     def _generar_reporte_productos(self, parametros: dict, usuario: Usuario) -> dict:
         """Generar reporte de productos con información completa"""
-        query = Producto.objects.select_related('categoria', 'marca', 'proveedor')
+        query = Producto.objects.select_related('categoria', 'marca', 'proveedor', 'stock')
         
         # Aplicar filtros
         filtros = parametros.get('filtros', {})
@@ -665,8 +673,10 @@ class GeneradorReporte:
         productos_bajo_stock = 0
         
         for producto in productos:
-            from productos.models import Stock
-            stock = Stock.objects.filter(producto=producto).first()
+            try:
+                stock = producto.stock
+            except Stock.DoesNotExist:
+                stock = None
             stock_cantidad = stock.cantidad if stock else 0
             
             # Obtener estadísticas de ventas del producto
@@ -883,39 +893,136 @@ class GeneradorReporte:
         }
     
     def _generar_reporte_inventario(self, parametros: dict, usuario: Usuario) -> dict:
-        """Generar reporte de inventario"""
-        from productos.models import Stock
+        """
+        Generar reporte de inventario. Totales, valorización y conteos por
+        categoría se calculan con agregados en la BD; solo se traen las filas
+        que se muestran (con su velocidad de venta como subconsulta).
+        """
+        dias = DIAS_VELOCIDAD_INVENTARIO
+        desde = timezone.now() - timedelta(days=dias)
+        
+        stock = expresion_stock_actual()
+        sin_stock = Q(stock__isnull=True) | Q(stock__cantidad__lte=0)
+        bajo_stock = Q(stock__cantidad__gt=0, stock__cantidad__lt=F('stock__stock_minimo'))
+        
+        def valor(precio):
+            return Sum(ExpressionWrapper(stock * F(precio), output_field=DecimalField(max_digits=14, decimal_places=2)))
+        
+        agregados = {
+            'total_productos': Count('id'),
+            'unidades_en_stock': Sum(stock),
+            'valor_compra': valor('precio_compra'),
+            'valor_venta': valor('precio'),
+            'productos_sin_stock': Count('id', filter=sin_stock),
+            'productos_bajo_stock': Count('id', filter=bajo_stock),
+        }
+        
+        query = Producto.objects.all()
+        filtros = parametros.get('filtros', {})
+        if filtros.get('categoria'):
+            query = query.filter(categoria__nombre__icontains=filtros['categoria'])
+        if filtros.get('producto') or filtros.get('nombre'):
+            query = query.filter(nombre__icontains=filtros.get('producto') or filtros.get('nombre'))
         
-        query = Stock.objects.select_related('producto', 'producto__categoria')
+        # Unidades vendidas en el período, agrupadas por categoría (una consulta)
+        ventas_periodo = DetalleVenta.objects.filter(
+            venta__estado='completada', venta__fecha_venta__gte=desde, producto__in=query.values('id')
+        )
+        vendidas_por_categoria = dict(
+            ventas_periodo.values_list('producto__categoria__nombre').annotate(total=Sum('cantidad'))
+        )
+        
+        # Los totales generales se suman a partir de las filas por categoría
+        totales = dict.fromkeys(agregados, 0)
+        por_categoria = []
+        for fila in query.values('categoria__nombre').annotate(**agregados).order_by('categoria__nombre'):
+            categoria = fila.pop('categoria__nombre')
+            for campo in totales:
+                totales[campo] += fila[campo] or 0
+            vendidas = vendidas_por_categoria.get(categoria) or 0
+            por_categoria.append({
+                'categoria': categoria or 'Sin categoría',
+                **self._resumen_inventario(fila, vendidas, dias),
+            })
         
-        # Filtrar solo stocks con productos válidos y ordenar
-        stocks = query.filter(producto__isnull=False).order_by('producto__nombre')[:100]
+        # Filas a mostrar: según la consulta, solo sin stock o solo bajo stock
+        texto = parametros.get('texto_lower', '')
+        filas = query
+        if 'sin stock' in texto or 'agotado' in texto:
+            filas = filas.filter(sin_stock)
+        elif 'bajo' in texto or 'mínimo' in texto or 'minimo' in texto:
+            filas = filas.filter(bajo_stock)
+        
+        vendidas_producto = ventas_periodo.filter(producto=OuterRef('pk')).values('producto').annotate(
+            total=Sum('cantidad')
+        ).values('total')
+        filas = filas.annotate(
+            stock_cantidad=stock,
+            vendidas_periodo=Coalesce(Subquery(vendidas_producto, output_field=IntegerField()), Value(0)),
+        )
+        if 'stock' in parametros.get('agrupacion', []):
+            filas = filas.order_by('stock_cantidad', 'nombre')
+        else:
+            filas = filas.order_by('nombre')
         
         datos = []
-        for stock in stocks:
-            # Verificar que el producto no sea None
-            if stock.producto:
-                datos.append({
-                    'producto_id': stock.producto.id,
-                    'producto_nombre': stock.producto.nombre or 'Producto sin nombre',
-                    'categoria': stock.producto.categoria.nombre if stock.producto.categoria else 'Sin categoría',
-                    'cantidad': stock.cantidad,
-                    'fecha_actualizacion': stock.fecha_actualizacion.isoformat()
-                })
+        for fila in filas.values(
+            'id', 'nombre', 'categoria__nombre', 'precio_compra', 'stock_cantidad', 'vendidas_periodo',
+            'stock__stock_minimo', 'stock__fecha_actualizacion',
+        )[:LIMITE_REPORTE_INVENTARIO]:
+            cantidad = fila['stock_cantidad']
+            minimo = fila['stock__stock_minimo']
+            if cantidad <= 0:
+                estado = 'sin_stock'
+            elif minimo is not None and cantidad < minimo:
+                estado = 'bajo'
             else:
-                # Si el producto fue eliminado
-                datos.append({
-                    'producto_id': None,
-                    'producto_nombre': f'Producto eliminado (Stock ID: {stock.id})',
-                    'categoria': 'Sin categoría',
-                    'cantidad': stock.cantidad,
-                    'fecha_actualizacion': stock.fecha_actualizacion.isoformat()
-                })
+                estado = 'normal'
+            datos.append({
+                'producto_id': fila['id'],
+                'producto_nombre': fila['nombre'] or 'Producto sin nombre',
+                'categoria': fila['categoria__nombre'] or 'Sin categoría',
+                'cantidad': cantidad,
+                'stock_minimo': minimo,
+                'estado_stock': estado,
+                'precio_compra': float(fila['precio_compra'] or 0),
+                'valor_compra': round(float(fila['precio_compra'] or 0) * cantidad, 2),
+                'vendidas_periodo': fila['vendidas_periodo'],
+                'dias_cobertura': self._dias_cobertura(cantidad, fila['vendidas_periodo'], dias),
+                'fecha_actualizacion': fila['stock__fecha_actualizacion'].isoformat() if fila['stock__fecha_actualizacion'] else None
+            })
+        
+        resumen = self._resumen_inventario(totales, sum(v or 0 for v in vendidas_por_categoria.values()), dias)
+        resumen['dias_periodo_ventas'] = dias
+        resumen['productos_mostrados'] = len(datos)
         
         return {
             'tipo': 'inventario',
             'datos': datos,
-            'total_productos': query.count()
+            'resumen': resumen,
+            'por_categoria': por_categoria,
+            'total_productos': resumen['total_productos']
+        }
+    
+    @staticmethod
+    def _dias_cobertura(cantidad, vendidas, dias):
+        """Días que alcanza el stock al ritmo de venta del período (None si no hubo ventas)"""
+        if not vendidas:
+            return None
+        return round(max(cantidad, 0) / (vendidas / dias), 1)
+    
+    def _resumen_inventario(self, fila: dict, vendidas: int, dias: int) -> dict:
+        """Normalizar un resultado de `agregados` (totales o una categoría) para el JSON"""
+        unidades = fila['unidades_en_stock'] or 0
+        return {
+            'total_productos': fila['total_productos'],
+            'unidades_en_stock': unidades,
+            'valor_inventario_compra': round(float(fila['valor_compra'] or 0), 2),
+            'valor_inventario_venta': round(float(fila['valor_venta'] or 0), 2),
+            'productos_sin_stock': fila['productos_sin_stock'],
+            'productos_bajo_stock': fila['productos_bajo_stock'],
+            'unidades_vendidas_periodo': vendidas,
+            'dias_cobertura': self._dias_cobertura(unidades, vendidas, dias),
         }
     
     def _generar_reporte_financiero(self, parametros: dict, usuario: Usuario) -> dict:
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class VentasCarritoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ventas_carrito'
+
+    def ready(self):
+        # Registrar la señal que marca la última actividad de cada carrito
+        from . import signals  # noqa: F401
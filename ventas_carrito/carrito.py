@@ -0,0 +1,352 @@
+"""
+Modelo de lectura del carrito (CU8, CU9, CU10).
+Una sola consulta trae las líneas con los datos del producto, el stock
+disponible, el subtotal de cada línea y los totales del carrito (funciones
+de ventana sobre el mismo resultado). La usan la vista del carrito, los
+descuentos, el checkout y el pago con Stripe.
+
+Con Redis configurado, los carritos de visitantes (sin sesión iniciada)
+viven en la caché `carritos` (`CarritoAnonimo`) y solo se guardan en la BD
+al iniciar sesión o comprar, así las tablas carrito/item_carrito no
+acumulan carritos abandonados. La sesión del visitante se crea recién al
+agregar el primer producto (con cached_db, esa es su única escritura en la
+BD). Sin Redis los carritos van a la BD, y los abandonados los elimina
+eliminar_carritos_abandonados(), desde el comando limpiar_carritos_abandonados.
+"""
+import logging
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import F, Sum, Value, Window, DecimalField, ExpressionWrapper
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from productos.models import Producto, Stock
+from .models import Carrito, ItemCarrito
+
+logger = logging.getLogger(__name__)
+
+
+def expresion_subtotal():
+    """cantidad * precio_unitario de la línea, calculado en la BD"""
+    return ExpressionWrapper(
+        F('cantidad') * F('precio_unitario'), output_field=DecimalField(max_digits=12, decimal_places=2)
+    )
+
+
+def lineas_carrito(carrito_id):
+    """Líneas del carrito como diccionarios, con los totales del carrito repetidos en cada fila"""
+    return ItemCarrito.objects.filter(carrito_id=carrito_id).annotate(
+        producto_nombre=F('producto__nombre'),
+        producto_imagen=F('producto__imagen'),
+        producto_precio=F('producto__precio'),
+        stock_disponible=Coalesce(F('producto__stock__cantidad'), Value(0)),
+        subtotal=expresion_subtotal(),
+        total_items=Window(Sum('cantidad')),
+        total_precio=Window(Sum(expresion_subtotal())),
+    ).order_by('id_item').values(
+        'id_item', 'producto_id', 'producto_nombre', 'producto_imagen', 'producto_precio',
+        'cantidad', 'precio_unitario', 'subtotal', 'stock_disponible', 'total_items', 'total_precio',
+    )
+
+
+def resumen_carrito(carrito_id):
+    """
+    {'carrito_id', 'items', 'total_items', 'total_precio', 'faltantes'} en una consulta.
+    `faltantes` tiene el mismo formato que productos.inventario.verificar_stock.
+    """
+    items = list(lineas_carrito(carrito_id))
+    faltantes = [
+        {
+            'producto_id': item['producto_id'],
+            'producto': item['producto_nombre'],
+            'solicitado': item['cantidad'],
+            'disponible': item['stock_disponible'],
+        }
+        for item in items if item['cantidad'] > item['stock_disponible']
+    ]
+    return {
+        'carrito_id': carrito_id,
+        'items': items,
+        'total_items': items[0]['total_items'] if items else 0,
+        'total_precio': items[0]['total_precio'] if items else Decimal('0.00'),
+        'faltantes': faltantes,
+    }
+
+
+def totales_carrito(carrito_id):
+    """Solo los totales (respuesta de altas, cambios y bajas), en una consulta agregada"""
+    totales = ItemCarrito.objects.filter(carrito_id=carrito_id).aggregate(
+        total_items=Sum('cantidad'), total_precio=Sum(expresion_subtotal())
+    )
+    return {
+        'total_items': totales['total_items'] or 0,
+        'total_precio': totales['total_precio'] or Decimal('0.00'),
+    }
+
+
+def serializar_item(item):
+    """Línea del carrito para el JSON de CarritoView"""
+    return {
+        'id': item['id_item'],
+        'producto_id': item['producto_id'],
+        'producto_nombre': item['producto_nombre'],
+        'producto_imagen': item['producto_imagen'],
+        'cantidad': item['cantidad'],
+        'precio_unitario': float(item['precio_unitario']),
+        'subtotal': float(item['subtotal']),
+        'stock_disponible': item['stock_disponible'],
+        'hay_stock': item['cantidad'] <= item['stock_disponible'],
+    }
+
+
+# ==========================================================
+# CARRITOS ANÓNIMOS EN CACHÉ
+# ==========================================================
+
+def carritos_anonimos_en_cache():
+    return getattr(settings, 'CARRITO_ANONIMO_EN_CACHE', False)
+
+
+def _cache_carritos():
+    # Caché propia: las respuestas del catálogo no desplazan a los carritos
+    return caches['carritos']
+
+
+class CarritoAnonimo:
+    """
+    Carrito de un visitante guardado en la caché bajo su session_key.
+    Cada línea guarda cantidad, precio y los datos del producto vistos al
+    agregarlo, así leer el carrito no consulta la BD. En las respuestas, el
+    id de cada línea es el id del producto. Sin session_key el carrito está
+    vacío y no se guarda.
+    """
+
+    def __init__(self, session_key):
+        self.session_key = session_key
+        self.clave = f'carrito:anonimo:{session_key}'
+        self.lineas = (_cache_carritos().get(self.clave) or {}) if session_key else {}
+
+    def guardar(self):
+        if not self.session_key:
+            return
+        # Cada escritura renueva el plazo de expiración
+        _cache_carritos().set(self.clave, self.lineas, getattr(settings, 'CARRITO_ANONIMO_TIMEOUT', 60 * 60 * 24 * 7))
+
+    def vaciar(self):
+        self.lineas = {}
+        if self.session_key:
+            _cache_carritos().delete(self.clave)
+
+    def cantidad(self, producto_id):
+        linea = self.lineas.get(producto_id)
+        return linea['cantidad'] if linea else 0
+
+    def fijar(self, producto, cantidad, stock_disponible):
+        """Dejar `cantidad` unidades de `producto` (ya validadas contra el stock)"""
+        self.lineas[producto.id] = {
+            'cantidad': cantidad,
+            'precio_unitario': producto.precio,
+            'nombre': producto.nombre,
+            'imagen': producto.imagen,
+            'stock_disponible': stock_disponible,
+        }
+        self.guardar()
+
+    def quitar(self, producto_id):
+        """Eliminar la línea; devuelve sus datos o None si no estaba"""
+        linea = self.lineas.pop(producto_id, None)
+        if linea is not None:
+            self.guardar()
+        return linea
+
+    def resumen(self):
+        """Mismo formato que resumen_carrito(), sin consultar la BD"""
+        items = []
+        for producto_id, linea in self.lineas.items():
+            precio = Decimal(linea['precio_unitario'])
+            items.append({
+                'id_item': producto_id,
+                'producto_id': producto_id,
+                'producto_nombre': linea['nombre'],
+                'producto_imagen': linea['imagen'],
+                'producto_precio': precio,
+                'cantidad': linea['cantidad'],
+                'precio_unitario': precio,
+                'subtotal': precio * linea['cantidad'],
+                'stock_disponible': linea['stock_disponible'],
+            })
+        return {
+            'carrito_id': None,
+            'items': items,
+            'total_items': sum(item['cantidad'] for item in items),
+            'total_precio': sum((item['subtotal'] for item in items), Decimal('0.00')),
+            'faltantes': [],
+        }
+
+    def totales(self):
+        resumen = self.resumen()
+        return {'total_items': resumen['total_items'], 'total_precio': resumen['total_precio']}
+
+
+def carrito_anonimo(request, crear_sesion=False):
+    """
+    CarritoAnonimo de la sesión, o None si el carrito va en la BD (modo
+    desactivado o cliente con sesión iniciada). La sesión solo se crea con
+    `crear_sesion` (al agregar un producto): leer o vaciar un carrito que
+    no existe no escribe nada.
+    """
+    if not carritos_anonimos_en_cache() or request.session.get('is_authenticated'):
+        return None
+    if not request.session.session_key and crear_sesion:
+        request.session.create()
+    return CarritoAnonimo(request.session.session_key)
+
+
+def persistir_carrito_anonimo(session_key, cliente):
+    """
+    Pasar el carrito de visitante de la sesión al carrito del cliente en la
+    BD (al iniciar sesión o antes del checkout), con fusionar_lineas().
+    Devuelve las líneas insertadas o actualizadas.
+    """
+    if not session_key or not carritos_anonimos_en_cache():
+        return 0
+    anonimo = CarritoAnonimo(session_key)
+    if not anonimo.lineas:
+        return 0
+
+    with transaction.atomic():
+        carrito, _ = Carrito.objects.get_or_create(cliente=cliente, activo=True, defaults={'session_key': None})
+        movidas = fusionar_lineas(carrito.id_carrito, [
+            (producto_id, linea['cantidad'], linea['precio_unitario'])
+            for producto_id, linea in anonimo.lineas.items()
+        ])
+
+    anonimo.vaciar()
+    logger.info(f"Carrito de visitante pasado a la BD: {movidas} líneas (cliente {cliente.pk})")
+    return movidas
+
+
+# ==========================================================
+# FUSIÓN DE CARRITOS
+# ==========================================================
+
+# Inserta las líneas de `origen` (id_producto, cantidad, precio_unitario) en
+# el carrito destino. La cantidad se limita al stock; si el producto ya estaba
+# se suman, sin pasar del stock ni bajar lo que el carrito ya tenía.
+# Los productos sin stock (o eliminados) se omiten por el JOIN con stock.
+SQL_FUSION = """
+    INSERT INTO item_carrito (id_carrito, id_producto, cantidad, precio_unitario, fecha_agregado)
+    SELECT %s, origen.id_producto, LEAST(origen.cantidad, stock.cantidad), origen.precio_unitario, %s
+    FROM ({origen}) AS origen (id_producto, cantidad, precio_unitario)
+    JOIN stock ON stock.id_producto = origen.id_producto
+    WHERE stock.cantidad > 0 AND origen.cantidad > 0
+    ON CONFLICT (id_carrito, id_producto) DO UPDATE SET cantidad = GREATEST(
+        item_carrito.cantidad,
+        LEAST(item_carrito.cantidad + EXCLUDED.cantidad,
+              (SELECT s.cantidad FROM stock s WHERE s.id_producto = EXCLUDED.id_producto))
+    )
+"""
+
+
+def fusionar_lineas(carrito_id, lineas):
+    """
+    Sumar líneas [(producto_id, cantidad, precio_unitario)] al carrito con un
+    solo INSERT ... ON CONFLICT (ver SQL_FUSION). Llamar dentro de una transacción.
+    Devuelve la cantidad de líneas insertadas o actualizadas.
+    """
+    if not lineas:
+        return 0
+    if connection.vendor != 'postgresql':
+        return _fusionar_orm(carrito_id, lineas)
+
+    valores = 'VALUES ' + ', '.join(['(%s::integer, %s::integer, %s::numeric)'] * len(lineas))
+    params = [carrito_id, timezone.now()]
+    for producto_id, cantidad, precio in lineas:
+        params += [producto_id, cantidad, precio]
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_FUSION.format(origen=valores), params)
+        return cursor.rowcount
+
+
+def fusionar_carritos(origen_id, destino_id):
+    """
+    Mover todas las líneas del carrito `origen_id` al `destino_id` y eliminar
+    el origen, en una transacción. Devuelve las líneas insertadas o actualizadas.
+    """
+    with transaction.atomic():
+        if connection.vendor != 'postgresql':
+            movidas = _fusionar_orm(destino_id, list(
+                ItemCarrito.objects.filter(carrito_id=origen_id).values_list('producto_id', 'cantidad', 'precio_unitario')
+            ))
+        else:
+            origen = 'SELECT id_producto, cantidad, precio_unitario FROM item_carrito WHERE id_carrito = %s'
+            with connection.cursor() as cursor:
+                cursor.execute(SQL_FUSION.format(origen=origen), [destino_id, timezone.now(), origen_id])
+                movidas = cursor.rowcount
+        Carrito.objects.filter(id_carrito=origen_id).delete()
+    return movidas
+
+
+def _fusionar_orm(carrito_id, lineas):
+    """Misma regla que SQL_FUSION para otros motores de BD"""
+    stock = dict(Stock.objects.filter(producto_id__in=[l[0] for l in lineas]).values_list('producto_id', 'cantidad'))
+    existentes = {
+        item.producto_id: item
+        for item in ItemCarrito.objects.select_for_update().filter(carrito_id=carrito_id, producto_id__in=stock)
+    }
+    actualizar, nuevos = [], []
+    for producto_id, cantidad, precio in lineas:
+        disponible = stock.get(producto_id, 0)
+        if disponible <= 0 or cantidad <= 0:
+            continue
+        item = existentes.get(producto_id)
+        if item:
+            item.cantidad = max(item.cantidad, min(item.cantidad + min(cantidad, disponible), disponible))
+            actualizar.append(item)
+        else:
+            nuevos.append(ItemCarrito(
+                carrito_id=carrito_id, producto_id=producto_id,
+                cantidad=min(cantidad, disponible), precio_unitario=precio,
+            ))
+    ItemCarrito.objects.bulk_update(actualizar, ['cantidad'])
+    ItemCarrito.objects.bulk_create(nuevos)
+    return len(actualizar) + len(nuevos)
+
+
+# ==========================================================
+# CARRITOS ABANDONADOS
+# ==========================================================
+
+def eliminar_carritos_abandonados(antes_de, lote=500, pausa=0):
+    """
+    Eliminar los carritos de visitante (session_key) sin actividad desde
+    `antes_de`, en lotes de `lote` ids: cada lote es una transacción corta
+    con dos DELETE ... WHERE id_carrito IN (...) (líneas y carritos), así no
+    se mantienen bloqueos largos. `pausa` son segundos de espera entre lotes.
+    Devuelve (carritos eliminados, líneas eliminadas).
+    """
+    carritos = lineas = 0
+    while True:
+        with transaction.atomic():
+            abandonados = Carrito.objects.filter(session_key__isnull=False, fecha_actualizacion__lt=antes_de)
+            if connection.vendor == 'postgresql':
+                # Saltar carritos que otra transacción está modificando
+                abandonados = abandonados.select_for_update(skip_locked=True)
+            ids = list(abandonados.order_by('id_carrito').values_list('id_carrito', flat=True)[:lote])
+            if not ids:
+                break
+            marcadores = ', '.join(['%s'] * len(ids))
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM item_carrito WHERE id_carrito IN ({marcadores})', ids)
+                lineas += cursor.rowcount
+                cursor.execute(f'DELETE FROM carrito WHERE id_carrito IN ({marcadores})', ids)
+                carritos += cursor.rowcount
+        if len(ids) < lote:
+            break
+        if pausa:
+            time.sleep(pausa)
+    return carritos, lineas
@@ -2,9 +2,16 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
+from django.db import transaction
 import json
+import logging
 
-from .models import Carrito, ItemCarrito, Venta, DetalleVenta
+from .models import Carrito, Venta, DetalleVenta
+from productos.inventario import reservar_stock, StockInsuficiente, mensaje_stock_insuficiente
+from .carrito import resumen_carrito, persistir_carrito_anonimo
+from .eventos import registrar_eventos_venta
+
+logger = logging.getLogger(__name__)
 
 
 # ==========================================================
@@ -68,6 +75,9 @@ class CheckoutView(View):
                     'message': 'Cliente no encontrado'
                 }, status=404)
             
+            # Si quedó un carrito de visitante en la caché, pasarlo a la BD
+            persistir_carrito_anonimo(request.session.session_key, cliente)
+            
             # Obtener carrito del cliente
             try:
                 carrito = Carrito.objects.get(cliente=cliente, activo=True)
@@ -77,120 +87,78 @@ class CheckoutView(View):
                     'message': 'No hay productos en el carrito'
                 }, status=400)
             
-            # Verificar que el carrito tenga items
-            items_carrito = ItemCarrito.objects.filter(carrito=carrito)
-            if not items_carrito.exists():
+            # Líneas y total del carrito en una sola consulta
+            resumen = resumen_carrito(carrito.id_carrito)
+            items_carrito = resumen['items']
+            if not items_carrito:
                 return JsonResponse({
                     'success': False,
                     'message': 'El carrito está vacío'
                 }, status=400)
             
-            # Calcular total
-            total = sum(item.get_subtotal() for item in items_carrito)
-            
-            # Crear venta
-            venta = Venta.objects.create(
-                cliente=cliente,
-                total=total,
-                estado='pendiente',
-                metodo_pago=metodo_pago,
-                direccion_entrega=direccion_entrega,
-                notas=notas
-            )
-            
-            # Notificar a administradores sobre nueva venta
-            try:
-                from autenticacion_usuarios.notificaciones_views import notificar_nueva_venta
-                notificar_nueva_venta(venta)
-            except Exception as e:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Error notificando nueva venta: {str(e)}")
+            total = resumen['total_precio']
             
-            # Crear detalles de venta y actualizar stock
-            from productos.models import Stock
-            import logging
-            logger = logging.getLogger(__name__)
-            
-            detalles_creados = []
-            productos_sin_stock = []
-            
-            # Primero verificar todo el stock disponible
-            for item in items_carrito.select_related('producto'):
-                stock_obj = Stock.objects.filter(producto=item.producto).first()
-                stock_disponible = stock_obj.cantidad if stock_obj else 0
-                
-                if stock_disponible < item.cantidad:
-                    productos_sin_stock.append({
-                        'producto': item.producto.nombre,
-                        'solicitado': item.cantidad,
-                        'disponible': stock_disponible
-                    })
-            
-            # Si hay productos sin stock, cancelar la venta
-            if productos_sin_stock:
-                venta.delete()
-                mensaje = 'Stock insuficiente para los siguientes productos: '
-                mensaje += ', '.join([f"{p['producto']} (solicitado: {p['solicitado']}, disponible: {p['disponible']})" 
-                                    for p in productos_sin_stock])
+            # Validar stock con los datos ya leídos, antes de escribir nada
+            if resumen['faltantes']:
                 return JsonResponse({
                     'success': False,
-                    'message': mensaje
+                    'message': mensaje_stock_insuficiente(resumen['faltantes']),
+                    'productos_sin_stock': resumen['faltantes']
                 }, status=400)
             
-            # Si todo está bien, crear detalles y actualizar stock
-            for item in items_carrito.select_related('producto'):
-                # Crear detalle de venta
-                detalle = DetalleVenta.objects.create(
-                    venta=venta,
-                    producto=item.producto,
-                    cantidad=item.cantidad,
-                    precio_unitario=item.precio_unitario
-                )
-                detalles_creados.append(detalle)
-                
-                # Actualizar stock del producto
-                stock_obj = Stock.objects.filter(producto=item.producto).first()
-                if stock_obj:
-                    stock_obj.cantidad -= item.cantidad
-                    if stock_obj.cantidad < 0:
-                        stock_obj.cantidad = 0
-                    stock_obj.save()
-                else:
-                    logger.warning(f"Producto {item.producto.id} no tiene registro de stock")
-            
-            # Marcar venta como completada
-            venta.estado = 'completada'
-            venta.save()
-            
-            # CU12: Generar comprobante automáticamente
-            comprobante_data = None
+            # Venta, stock, detalles, carrito y bitácora en una sola transacción,
+            # con la misma cantidad de consultas sea cual sea el tamaño del carrito
             try:
-                from .comprobantes_views import ComprobanteView
-                comprobante_view = ComprobanteView()
-                comprobante = comprobante_view._generar_comprobante(venta, 'factura')
-                comprobante_data = {
-                    'id': comprobante.id_comprobante,
-                    'numero': comprobante.nro,
-                    'pdf_url': f'/api/ventas/comprobantes/{venta.id_venta}/pdf/'
-                }
-            except Exception as e:
-                logger.warning(f"Error al generar comprobante automático: {str(e)}")
-                # No fallar la venta si el comprobante falla
-            
-            # Limpiar carrito
-            items_carrito.delete()
-            carrito.delete()
-            
-            # Registrar en bitácora
-            from autenticacion_usuarios.models import Bitacora
-            Bitacora.objects.create(
-                id_usuario=usuario,
-                accion='COMPRA_REALIZADA',
-                modulo='VENTAS',
-                descripcion=f'Cliente {usuario.nombre} realizó compra por ${total}',
-                ip=self.get_client_ip(request)
-            )
+                with transaction.atomic():
+                    venta = Venta.objects.create(
+                        cliente=cliente,
+                        total=total,
+                        estado='completada',
+                        metodo_pago=metodo_pago,
+                        direccion_entrega=direccion_entrega,
+                        notas=notas
+                    )
+                    
+                    # Si otro comprador se llevó el stock entretanto, se revierte todo
+                    reservar_stock(
+                        [(item['producto_id'], item['cantidad']) for item in items_carrito],
+                        referencia=f'venta:{venta.id_venta}'
+                    )
+                    
+                    # bulk_create no llama a save(): el subtotal ya viene de la consulta del carrito
+                    detalles_creados = DetalleVenta.objects.bulk_create([
+                        DetalleVenta(
+                            venta=venta,
+                            producto_id=item['producto_id'],
+                            cantidad=item['cantidad'],
+                            precio_unitario=item['precio_unitario'],
+                            subtotal=item['subtotal']
+                        )
+                        for item in items_carrito
+                    ])
+                    
+                    # Limpiar carrito (las líneas se borran en cascada, en bloque)
+                    carrito.delete()
+                    
+                    # Registrar en bitácora
+                    from autenticacion_usuarios.models import Bitacora
+                    Bitacora.objects.create(
+                        id_usuario=usuario,
+                        accion='COMPRA_REALIZADA',
+                        modulo='VENTAS',
+                        descripcion=f'Cliente {usuario.nombre} realizó compra por ${total}',
+                        ip=self.get_client_ip(request)
+                    )
+                    
+                    # Notificación a administradores y comprobante (CU12): se
+                    # ejecutan fuera de la compra, desde la bandeja de salida
+                    registrar_eventos_venta(venta)
+            except StockInsuficiente as e:
+                return JsonResponse({
+                    'success': False,
+                    'message': str(e),
+                    'productos_sin_stock': e.faltantes
+                }, status=400)
             
             # Respuesta exitosa
             response_data = {
@@ -207,8 +175,11 @@ class CheckoutView(View):
                 }
             }
             
-            if comprobante_data:
-                response_data['comprobante'] = comprobante_data
+            # El comprobante se genera en segundo plano; el PDF queda en esta URL
+            response_data['comprobante'] = {
+                'estado': 'pendiente',
+                'pdf_url': f'/api/ventas/comprobantes/{venta.id_venta}/pdf/'
+            }
             
             return JsonResponse(response_data, status=201)
             
@@ -218,8 +189,6 @@ class CheckoutView(View):
                 'message': 'Formato de datos inválido'
             }, status=400)
         except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
             logger.error(f"Error en CheckoutView.post: {str(e)}", exc_info=True)
             return JsonResponse({
                 'success': False,
@@ -0,0 +1,115 @@
+"""
+Motor de descuentos del carrito (cupones y porcentaje directo).
+Los precios se calculan en una sola pasada sobre las líneas (precio de
+lista del producto, traído con la misma consulta), se escriben con un
+bulk_update y el uso del cupón se descuenta con un UPDATE condicional
+(`usos_actuales = usos_actuales + 1 WHERE usos_actuales < usos_maximos`):
+dos compradores simultáneos no pueden pasar del límite de usos.
+"""
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from productos.models import CuponDescuento
+from .models import ItemCarrito
+
+logger = logging.getLogger(__name__)
+
+CENTAVO = Decimal('0.01')
+
+
+class CuponNoAplicable(Exception):
+    """El cupón no existe o no se puede usar; `status` es el código HTTP de la respuesta"""
+
+    def __init__(self, mensaje, status=400):
+        self.status = status
+        super().__init__(mensaje)
+
+
+def _redondear(valor):
+    return max(valor, Decimal('0')).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+
+def precios_por_porcentaje(items, porcentaje):
+    """{id_item: precio unitario} con `porcentaje` de descuento sobre el precio de lista"""
+    factor = 1 - Decimal(porcentaje) / 100
+    return {item.id_item: _redondear(item.producto.precio * factor) for item in items}
+
+
+def precios_por_monto(items, monto):
+    """
+    {id_item: precio unitario} repartiendo `monto` entre las líneas en
+    proporción a su subtotal de lista. Devuelve también el descuento
+    realmente aplicado (no más que el total).
+    """
+    total = sum((item.producto.precio * item.cantidad for item in items), Decimal('0'))
+    descuento = min(Decimal(monto), total)
+    precios = {}
+    for item in items:
+        proporcion = item.producto.precio * item.cantidad / total if total > 0 else 0
+        precios[item.id_item] = _redondear(item.producto.precio - descuento * proporcion / item.cantidad)
+    return precios, descuento
+
+
+def _escribir_precios(items, precios):
+    for item in items:
+        item.precio_unitario = precios[item.id_item]
+    ItemCarrito.objects.bulk_update(items, ['precio_unitario'])
+
+
+def _lineas(carrito_id):
+    return list(ItemCarrito.objects.filter(carrito_id=carrito_id).select_related('producto').only(
+        'id_item', 'cantidad', 'precio_unitario', 'producto__precio'
+    ))
+
+
+def aplicar_cupon(carrito_id, codigo):
+    """
+    Aplicar el cupón `codigo` a todas las líneas del carrito y registrar su uso,
+    todo o nada. Lanza CuponNoAplicable si no existe, no está vigente, no
+    alcanza el monto mínimo o ya no le quedan usos.
+    Devuelve {'cupon', 'descuento_aplicado', 'items_actualizados'}.
+    """
+    try:
+        cupon = CuponDescuento.objects.get(codigo=codigo.upper().strip())
+    except CuponDescuento.DoesNotExist:
+        raise CuponNoAplicable('Código de descuento no válido', status=404)
+
+    if cupon.estado != 'activo' or not cupon.fecha_inicio <= timezone.now() <= cupon.fecha_fin:
+        raise CuponNoAplicable('El cupón no está activo o ha expirado')
+    if cupon.usos_actuales >= cupon.usos_maximos:
+        raise CuponNoAplicable('El cupón ha alcanzado su límite de usos')
+
+    items = _lineas(carrito_id)
+    total = sum((item.producto.precio * item.cantidad for item in items), Decimal('0'))
+    if cupon.monto_minimo > 0 and total < cupon.monto_minimo:
+        raise CuponNoAplicable(f'El cupón requiere un monto mínimo de Bs. {cupon.monto_minimo:.2f}')
+
+    if cupon.tipo_descuento == 'porcentaje':
+        precios = precios_por_porcentaje(items, cupon.valor_descuento)
+        descuento = cupon.valor_descuento
+    else:
+        precios, descuento = precios_por_monto(items, cupon.valor_descuento)
+
+    with transaction.atomic():
+        _escribir_precios(items, precios)
+        # El uso se descuenta al final: la fila del cupón queda bloqueada solo hasta el commit
+        canjeado = CuponDescuento.objects.filter(
+            id_cupon=cupon.id_cupon, estado='activo', usos_actuales__lt=F('usos_maximos')
+        ).update(usos_actuales=F('usos_actuales') + 1)
+        if not canjeado:
+            # Otro comprador usó el último canje: se revierten también los precios
+            raise CuponNoAplicable('El cupón ha alcanzado su límite de usos')
+
+    logger.info(f"Cupón {cupon.codigo} aplicado al carrito {carrito_id} ({len(items)} líneas)")
+    return {'cupon': cupon, 'descuento_aplicado': descuento, 'items_actualizados': len(items)}
+
+
+def aplicar_porcentaje(carrito_id, porcentaje):
+    """Descuento directo de `porcentaje` sobre el precio de lista; devuelve las líneas actualizadas"""
+    items = _lineas(carrito_id)
+    _escribir_precios(items, precios_por_porcentaje(items, porcentaje))
+    return len(items)
@@ -0,0 +1,110 @@
+"""
+Bandeja de salida (outbox) de los efectos posteriores a una venta.
+El checkout solo registra los eventos (`EventoSalida`) en su transacción;
+la notificación a los administradores y el comprobante PDF se ejecutan
+después, así no suman latencia a la compra ni pueden hacerla fallar.
+El webhook de Stripe usa la misma bandeja para confirmar los pagos, y el
+servicio de inventario para las alertas de stock bajo.
+
+Los eventos confirmados se envían a un pool de hilos (EVENTOS_WORKERS;
+0 = ninguno; cola `EVENTOS` de backend_smart.trabajos) y el comando
+`procesar_eventos` toma los pendientes, los fallidos y los que quedaron a
+medias (por ejemplo, tras reiniciar el servidor).
+"""
+import logging
+
+from django.db import transaction
+
+from backend_smart.trabajos import ColaTrabajos
+from .models import EventoSalida, Venta, Comprobante, PagoOnline
+
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# REGISTRO
+# ==========================================================
+
+def registrar_eventos_venta(venta):
+    """
+    Registrar los eventos de una venta nueva en un solo INSERT.
+    Llamar dentro de la transacción de la venta: si se revierte, no queda ningún evento.
+    """
+    return _registrar([
+        EventoSalida(tipo=tipo, datos={'venta_id': venta.id_venta})
+        for tipo in ('venta_notificar', 'venta_comprobante')
+    ])
+
+
+def registrar_evento(tipo, **datos):
+    """Registrar un solo evento (en la transacción del llamador)"""
+    return _registrar([EventoSalida(tipo=tipo, datos=datos)])[0]
+
+
+def _registrar(eventos):
+    eventos = EventoSalida.objects.bulk_create(eventos)
+    # Encolar cuando los eventos ya sean visibles para el hilo de trabajo
+    EVENTOS.encolar_al_confirmar([evento.id_evento for evento in eventos if evento.id_evento])
+    return eventos
+
+
+# ==========================================================
+# PROCESAMIENTO
+# ==========================================================
+
+def _notificar_venta(venta_id):
+    from autenticacion_usuarios.notificaciones_views import notificar_nueva_venta
+    notificar_nueva_venta(Venta.objects.select_related('cliente__id').get(id_venta=venta_id))
+
+
+def _generar_comprobante(venta_id):
+    from .comprobantes_views import ComprobanteView
+    # Un comprobante por venta: si un intento anterior lo creó, no repetirlo
+    if Comprobante.objects.filter(venta_id=venta_id).exists():
+        return
+    venta = Venta.objects.select_related('cliente__id').prefetch_related('detalles__producto').get(id_venta=venta_id)
+    # Si el PDF falla, no dejar un comprobante sin archivo
+    with transaction.atomic():
+        ComprobanteView()._generar_comprobante(venta, 'factura')
+
+
+def _confirmar_pago_stripe(payment_intent_id):
+    from .stripe_views import confirmar_pago_stripe
+    # Si el webhook llega antes de que exista el PagoOnline, falla y se reintenta
+    pago_online = PagoOnline.objects.select_related('venta').get(stripe_payment_intent_id=payment_intent_id)
+    # Sin stock lanza StockInsuficiente: el evento queda 'fallido' con el motivo
+    # (los administradores reciben 'pago_sin_stock') y un reintento completa la
+    # venta si el stock se repuso
+    confirmar_pago_stripe(pago_online)
+
+
+def _rechazar_pago_stripe(payment_intent_id):
+    # Igual que la confirmación: si el PagoOnline todavía no existe, se reintenta
+    pago_online = PagoOnline.objects.get(stripe_payment_intent_id=payment_intent_id)
+    PagoOnline.objects.filter(id_pago=pago_online.id_pago).exclude(estado='exitoso').update(estado='fallido')
+
+
+def _notificar_pago_sin_stock(venta_id, motivo):
+    from autenticacion_usuarios.notificaciones_views import notificar_pago_sin_stock
+    notificar_pago_sin_stock(venta_id, motivo)
+
+
+def _alertar_stock_bajo(producto_ids):
+    from productos.inventario import enviar_alerta_stock_bajo
+    enviar_alerta_stock_bajo(producto_ids)
+
+
+MANEJADORES = {
+    'venta_notificar': _notificar_venta,
+    'venta_comprobante': _generar_comprobante,
+    'pago_stripe': _confirmar_pago_stripe,
+    'pago_stripe_fallido': _rechazar_pago_stripe,
+    'pago_sin_stock': _notificar_pago_sin_stock,
+    'stock_bajo': _alertar_stock_bajo,
+}
+
+
+def _ejecutar(evento):
+    MANEJADORES[evento.tipo](**evento.datos)
+
+
+EVENTOS = ColaTrabajos(EventoSalida, _ejecutar, nombre='evento-salida', ajuste_workers='EVENTOS_WORKERS')
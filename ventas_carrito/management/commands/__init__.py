@@ -0,0 +1 @@
+# Commands package for ventas_carrito
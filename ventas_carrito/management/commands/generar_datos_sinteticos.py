@@ -0,0 +1,463 @@
+"""
+Dataset sintético de gran volumen para pruebas de carga y de rendimiento.
+
+Genera catálogo (categorías, marcas, proveedores, productos, stock), clientes,
+ventas con sus detalles, notificaciones y bitácora con distribuciones
+parecidas a las reales:
+- popularidad de productos y de categorías con forma de Zipf (pocos productos
+  concentran muchas ventas),
+- precios log-normales y actividad de clientes con cola larga,
+- fechas con tendencia creciente, menos ventas el fin de semana y picos
+  al mediodía y a la noche.
+
+Con la misma semilla, la misma base vacía y la misma fecha de referencia
+(--hasta) se obtienen exactamente los mismos datos. En PostgreSQL las filas
+se cargan con COPY; en otros motores, con INSERT por lotes.
+"""
+import csv
+import io
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from autenticacion_usuarios.models import Rol, Usuario, Cliente, Notificacion, Bitacora
+from productos.models import Categoria, Marca, Proveedor, Producto, Stock, MovimientoStock
+from productos.cache_catalogo import invalidar_catalogo
+from ventas_carrito.models import Venta, DetalleVenta
+
+VOLUMENES = {
+    'productos': 100_000,
+    'clientes': 50_000,
+    'ventas': 1_000_000,
+    'detalles': 5_000_000,
+    'notificaciones': 200_000,
+    'bitacora': 500_000,
+}
+TAMANO_LOTE = 20_000
+
+ADJETIVOS = ['Pro', 'Max', 'Ultra', 'Lite', 'Plus', 'Mini', 'Eco', 'Smart', 'Classic', 'Sport']
+SUSTANTIVOS = [
+    'Laptop', 'Teléfono', 'Auriculares', 'Monitor', 'Teclado', 'Mouse', 'Cafetera', 'Licuadora',
+    'Zapatillas', 'Mochila', 'Reloj', 'Cámara', 'Parlante', 'Tablet', 'Impresora', 'Silla',
+    'Lámpara', 'Ventilador', 'Bicicleta', 'Pelota', 'Termo', 'Sartén', 'Colchón', 'Cargador',
+]
+DESCRIPCIONES = [
+    'Ideal para uso diario', 'Garantía de un año', 'Diseño compacto y liviano',
+    'Alta durabilidad', 'Bajo consumo de energía', 'Incluye accesorios', 'Edición limitada',
+]
+NOMBRES = ['Ana', 'Luis', 'María', 'José', 'Carla', 'Jorge', 'Lucía', 'Pedro', 'Sofía', 'Diego', 'Valeria', 'Miguel']
+APELLIDOS = ['Mendieta', 'Rojas', 'Flores', 'Gutiérrez', 'Vargas', 'Mamani', 'Quispe', 'Fernández', 'López', 'Suárez']
+CIUDADES = [('Santa Cruz', 35), ('La Paz', 25), ('Cochabamba', 20), ('El Alto', 8), ('Sucre', 5), ('Tarija', 4), ('Oruro', 3)]
+ESTADOS_VENTA = [('completada', 82), ('pendiente', 10), ('cancelada', 8)]
+METODOS_PAGO = [('tarjeta', 55), ('efectivo', 25), ('transferencia', 20)]
+CANTIDADES = [(1, 70), (2, 18), (3, 7), (4, 3), (5, 2)]
+HORAS = [1, 1, 1, 1, 1, 2, 3, 5, 7, 8, 9, 10, 12, 12, 9, 8, 8, 9, 11, 13, 14, 12, 7, 3]
+NOTIFICACIONES = [
+    ('venta', 'Compra confirmada', 'Tu compra fue registrada correctamente', 'normal', 45),
+    ('info', 'Novedades en el catálogo', 'Llegaron nuevos productos a tu categoría favorita', 'baja', 30),
+    ('stock', 'Producto disponible', 'Un producto de tu lista volvió a tener stock', 'normal', 15),
+    ('sistema', 'Actualiza tus datos', 'Revisa tu dirección de entrega', 'alta', 10),
+]
+ACCIONES_BITACORA = [
+    ('INICIO_SESION', 'AUTENTICACION', 'Inicio de sesión exitoso', 45),
+    ('COMPRA_REALIZADA', 'VENTAS', 'Compra realizada desde el carrito', 20),
+    ('PAGO_ONLINE', 'VENTAS', 'Pago en línea registrado', 15),
+    ('CIERRE_SESION', 'AUTENTICACION', 'Cierre de sesión', 15),
+    ('ACTUALIZAR_CLIENTE', 'GESTION_CLIENTES', 'Datos de cliente actualizados', 5),
+]
+
+
+def _pesos_acumulados(pesos):
+    acumulado, total = [], 0
+    for peso in pesos:
+        total += peso
+        acumulado.append(total)
+    return acumulado
+
+
+def _zipf(n, s=1.1):
+    return _pesos_acumulados([1 / (i ** s) for i in range(1, n + 1)])
+
+
+class Distribucion:
+    """Elección ponderada reutilizable (pesos acumulados calculados una vez)"""
+
+    def __init__(self, rng, opciones):
+        self.rng = rng
+        self.valores = [o[0] for o in opciones]
+        self.acumulados = _pesos_acumulados([o[-1] for o in opciones])
+
+    def elegir(self, k=1):
+        return self.rng.choices(self.valores, cum_weights=self.acumulados, k=k)
+
+    def una(self):
+        return self.elegir()[0]
+
+
+class EscritorTabla:
+    """Inserta tuplas en la tabla de un modelo: COPY en PostgreSQL, INSERT en lote en otros motores"""
+
+    def __init__(self, modelo, campos):
+        opts = modelo._meta
+        self.tabla = opts.db_table
+        self.campos = [opts.get_field(c) for c in campos]
+        columnas = ', '.join(connection.ops.quote_name(f.column) for f in self.campos)
+        self.sql_copy = f'COPY {connection.ops.quote_name(self.tabla)} ({columnas}) FROM STDIN WITH (FORMAT csv)'
+        marcadores = ', '.join(['%s'] * len(self.campos))
+        self.sql_insert = f'INSERT INTO {connection.ops.quote_name(self.tabla)} ({columnas}) VALUES ({marcadores})'
+        self.usar_copy = connection.vendor == 'postgresql'
+        self.filas_escritas = 0
+
+    def escribir(self, filas):
+        if not filas:
+            return
+        # Un lote por transacción (sin ella SQLite confirma fila por fila)
+        with transaction.atomic(), connection.cursor() as cursor:
+            crudo = cursor.cursor
+            if self.usar_copy and hasattr(crudo, 'copy_expert'):
+                buffer = io.StringIO()
+                # En CSV, un campo vacío sin comillas es NULL
+                csv.writer(buffer).writerows(filas)
+                buffer.seek(0)
+                crudo.copy_expert(self.sql_copy, buffer)
+            else:
+                cursor.executemany(self.sql_insert, [self._adaptar(f) for f in filas])
+        self.filas_escritas += len(filas)
+
+    def _adaptar(self, fila):
+        return [
+            connection.ops.adapt_datetimefield_value(v) if isinstance(v, datetime) else v
+            for v in fila
+        ]
+
+
+def _siguiente_id(modelo):
+    campo = modelo._meta.pk.name
+    return (modelo.objects.aggregate(m=Max(campo))['m'] or 0) + 1
+
+
+def _reiniciar_secuencia(modelo):
+    """Después de insertar ids explícitos, la secuencia debe continuar desde el máximo"""
+    if connection.vendor != 'postgresql':
+        return
+    tabla = modelo._meta.db_table
+    columna = modelo._meta.pk.column
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX({columna}), 1)) FROM {tabla}",
+            [tabla, columna],
+        )
+
+
+class Command(BaseCommand):
+    help = 'Genera un dataset sintético de gran volumen y determinístico para pruebas de rendimiento'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla del generador aleatorio')
+        parser.add_argument('--escala', type=float, default=1.0,
+                            help='Multiplica todos los volúmenes (por ejemplo 0.01 para una prueba rápida)')
+        for nombre, volumen in VOLUMENES.items():
+            parser.add_argument(f'--{nombre}', type=int, default=None,
+                                help=f'Cantidad de {nombre} (por defecto {volumen:,} x escala)')
+        parser.add_argument('--dias', type=int, default=365, help='Días de historia de ventas')
+        parser.add_argument('--hasta', default='2025-12-31',
+                            help='Fecha de referencia YYYY-MM-DD (fija para que el dataset sea reproducible)')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Filas por lote de inserción')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['semilla'])
+        self.semilla = options['semilla']
+        self.lote = options['lote']
+        self.volumenes = {
+            nombre: options[nombre] if options[nombre] is not None else int(volumen * options['escala'])
+            for nombre, volumen in VOLUMENES.items()
+        }
+        try:
+            hasta = datetime.strptime(options['hasta'], '%Y-%m-%d')
+        except ValueError:
+            raise CommandError('--hasta debe tener el formato YYYY-MM-DD')
+        self.fin = timezone.make_aware(hasta + timedelta(days=1))
+        self.inicio = self.fin - timedelta(days=options['dias'])
+
+        prefijo_email = f'sintetico{self.semilla}.'
+        if Usuario.objects.filter(email__startswith=prefijo_email).exists():
+            raise CommandError(
+                f'Ya existe un dataset con la semilla {self.semilla}; use otra semilla o una base vacía'
+            )
+
+        inicio = time.monotonic()
+        productos = self._generar_catalogo()
+        clientes = self._generar_clientes(prefijo_email)
+        self._generar_ventas(productos, clientes)
+        self._generar_notificaciones(clientes)
+        self._generar_bitacora(clientes)
+
+        if connection.vendor == 'postgresql':
+            # Estadísticas al día para que los planes de consulta sean los de producción
+            with connection.cursor() as cursor:
+                for modelo in (Producto, Stock, Usuario, Cliente, Venta, DetalleVenta, Notificacion, Bitacora):
+                    cursor.execute(f'ANALYZE {modelo._meta.db_table}')
+        invalidar_catalogo()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Dataset sintético (semilla {self.semilla}) generado en {time.monotonic() - inicio:.1f}s'
+        ))
+
+    # ------------------------------------------------------------------
+    # Utilidades
+    # ------------------------------------------------------------------
+
+    def _informar(self, nombre, cantidad, desde):
+        self.stdout.write(f'  {nombre}: {cantidad:,} filas ({time.monotonic() - desde:.1f}s)')
+
+    def _fecha(self):
+        """Más ventas recientes (tendencia), menos fin de semana, picos por hora"""
+        span = (self.fin - self.inicio).total_seconds()
+        while True:
+            dia = self.inicio + timedelta(seconds=span * (self.rng.random() ** 0.8))
+            if dia.weekday() < 5 or self.rng.random() < 0.7:
+                break
+        hora = self.rng.choices(range(24), weights=HORAS)[0]
+        return dia.replace(hour=hora, minute=self.rng.randrange(60), second=self.rng.randrange(60), microsecond=0)
+
+    def _referencias(self, modelo, nombres, extra=None):
+        """Ids de filas de referencia por nombre, creando las que falten"""
+        existentes = dict(modelo.objects.filter(nombre__in=nombres).values_list('nombre', 'pk'))
+        faltantes = [modelo(nombre=n, **(extra or {})) for n in nombres if n not in existentes]
+        modelo.objects.bulk_create(faltantes)
+        existentes = dict(modelo.objects.filter(nombre__in=nombres).values_list('nombre', 'pk'))
+        return [existentes[n] for n in nombres]
+
+    # ------------------------------------------------------------------
+    # Catálogo
+    # ------------------------------------------------------------------
+
+    def _generar_catalogo(self):
+        """
+        Crea productos, stock y el movimiento 'inicial' del libro de cada uno
+        (así conciliar_stock no los marca); devuelve [(id, precio)] ordenado por popularidad
+        """
+        desde = time.monotonic()
+        rng = self.rng
+        categorias = self._referencias(Categoria, [f'Categoría {i:02d}' for i in range(1, 41)])
+        marcas = self._referencias(Marca, [f'Marca {i:03d}' for i in range(1, 151)])
+        proveedores = self._referencias(Proveedor, [f'Proveedor {i:02d}' for i in range(1, 41)])
+        zipf_categorias = _zipf(len(categorias))
+        zipf_marcas = _zipf(len(marcas))
+
+        escritor_productos = EscritorTabla(Producto, [
+            'id', 'nombre', 'descripcion', 'precio', 'precio_compra', 'marca', 'categoria', 'proveedor',
+        ])
+        escritor_stock = EscritorTabla(Stock, ['id_stock', 'cantidad', 'stock_minimo', 'fecha_actualizacion', 'producto'])
+        escritor_movimientos = EscritorTabla(MovimientoStock, ['producto', 'tipo', 'cantidad', 'referencia', 'fecha'])
+        stock_minimo = Stock._meta.get_field('stock_minimo').default
+
+        primer_producto = _siguiente_id(Producto)
+        primer_stock = _siguiente_id(Stock)
+        productos = []
+        filas_productos, filas_stock, filas_movimientos = [], [], []
+        for i in range(self.volumenes['productos']):
+            producto_id = primer_producto + i
+            precio = Decimal(str(round(min(max(math.exp(rng.gauss(5.0, 1.0)), 5), 50_000), 2)))
+            precio_compra = (precio * Decimal(str(round(rng.uniform(0.55, 0.8), 2)))).quantize(Decimal('0.01'))
+            nombre = f'{rng.choice(SUSTANTIVOS)} {rng.choice(ADJETIVOS)} {rng.randrange(100, 9999)}'
+            filas_productos.append((
+                producto_id, nombre, rng.choice(DESCRIPCIONES), precio, precio_compra,
+                rng.choices(marcas, cum_weights=zipf_marcas)[0],
+                rng.choices(categorias, cum_weights=zipf_categorias)[0],
+                rng.choice(proveedores),
+            ))
+            cantidad = 0 if rng.random() < 0.08 else min(int(math.exp(rng.gauss(3.0, 1.0))), 2000)
+            fecha = self._fecha()
+            filas_stock.append((primer_stock + i, cantidad, stock_minimo, fecha, producto_id))
+            if cantidad:
+                filas_movimientos.append((producto_id, 'inicial', cantidad, 'sintetico', fecha))
+            productos.append((producto_id, precio))
+
+            if len(filas_productos) >= self.lote:
+                escritor_productos.escribir(filas_productos)
+                escritor_stock.escribir(filas_stock)
+                escritor_movimientos.escribir(filas_movimientos)
+                filas_productos, filas_stock, filas_movimientos = [], [], []
+        escritor_productos.escribir(filas_productos)
+        escritor_stock.escribir(filas_stock)
+        escritor_movimientos.escribir(filas_movimientos)
+        _reiniciar_secuencia(Producto)
+        _reiniciar_secuencia(Stock)
+        self._informar('productos', escritor_productos.filas_escritas, desde)
+
+        # La popularidad no depende del id: se baraja el orden antes de aplicar Zipf
+        rng.shuffle(productos)
+        return productos
+
+    # ------------------------------------------------------------------
+    # Clientes
+    # ------------------------------------------------------------------
+
+    def _generar_clientes(self, prefijo_email):
+        """Crea usuarios con rol Cliente; devuelve [(id, direccion)]"""
+        desde = time.monotonic()
+        rng = self.rng
+        rol, _ = Rol.objects.get_or_create(nombre='Cliente')
+        # Un solo hash para todos: make_password es deliberadamente lento
+        contrasena = make_password('sintetico123')
+        ciudades = Distribucion(rng, CIUDADES)
+
+        escritor_usuarios = EscritorTabla(Usuario, [
+            'id', 'nombre', 'contrasena', 'estado', 'apellido', 'email', 'telefono', 'id_rol',
+        ])
+        escritor_clientes = EscritorTabla(Cliente, ['id', 'direccion', 'ciudad'])
+
+        primer_usuario = _siguiente_id(Usuario)
+        clientes = []
+        filas_usuarios, filas_clientes = [], []
+        for i in range(self.volumenes['clientes']):
+            usuario_id = primer_usuario + i
+            direccion = f'Calle {rng.randrange(1, 400)} #{rng.randrange(1, 3000)}'
+            filas_usuarios.append((
+                usuario_id, rng.choice(NOMBRES), contrasena, rng.random() > 0.03, rng.choice(APELLIDOS),
+                f'{prefijo_email}{i}@ejemplo.test', f'7{rng.randrange(1_000_000, 9_999_999)}', rol.id_rol,
+            ))
+            filas_clientes.append((usuario_id, direccion, ciudades.una()))
+            clientes.append((usuario_id, direccion))
+
+            if len(filas_usuarios) >= self.lote:
+                escritor_usuarios.escribir(filas_usuarios)
+                escritor_clientes.escribir(filas_clientes)
+                filas_usuarios, filas_clientes = [], []
+        escritor_usuarios.escribir(filas_usuarios)
+        escritor_clientes.escribir(filas_clientes)
+        _reiniciar_secuencia(Usuario)
+        self._informar('clientes', escritor_clientes.filas_escritas, desde)
+        return clientes
+
+    # ------------------------------------------------------------------
+    # Ventas
+    # ------------------------------------------------------------------
+
+    def _generar_ventas(self, productos, clientes):
+        if not productos or not clientes:
+            return
+        desde = time.monotonic()
+        rng = self.rng
+        estados = Distribucion(rng, ESTADOS_VENTA)
+        metodos = Distribucion(rng, METODOS_PAGO)
+        cantidades = Distribucion(rng, CANTIDADES)
+        # Actividad de clientes con cola larga; popularidad de productos tipo Zipf
+        pesos_clientes = _pesos_acumulados([math.exp(rng.gauss(0, 1.2)) for _ in clientes])
+        pesos_productos = _zipf(len(productos))
+
+        # Ítems por venta: 1 + geométrica, con media detalles/ventas
+        media_items = max(self.volumenes['detalles'] / max(self.volumenes['ventas'], 1), 1)
+        p_geometrica = 1 / media_items
+
+        escritor_ventas = EscritorTabla(Venta, [
+            'id_venta', 'cliente', 'fecha_venta', 'total', 'estado', 'metodo_pago', 'direccion_entrega',
+        ])
+        escritor_detalles = EscritorTabla(DetalleVenta, [
+            'id_detalle', 'venta', 'producto', 'cantidad', 'precio_unitario', 'subtotal',
+        ])
+
+        venta_id = _siguiente_id(Venta)
+        detalle_id = _siguiente_id(DetalleVenta)
+        filas_ventas, filas_detalles = [], []
+        for _ in range(self.volumenes['ventas']):
+            cliente_id, direccion = rng.choices(clientes, cum_weights=pesos_clientes)[0]
+            items = 1
+            if p_geometrica < 1:
+                items += int(math.log(1 - rng.random()) / math.log(1 - p_geometrica))
+            # Productos distintos dentro de la venta (los populares se repetirían)
+            elegidos = {}
+            for _ in range(items * 3):
+                producto_id, precio = rng.choices(productos, cum_weights=pesos_productos)[0]
+                elegidos[producto_id] = precio
+                if len(elegidos) >= items:
+                    break
+
+            total = Decimal('0.00')
+            for producto_id, precio in elegidos.items():
+                cantidad = cantidades.una()
+                subtotal = precio * cantidad
+                total += subtotal
+                filas_detalles.append((detalle_id, venta_id, producto_id, cantidad, precio, subtotal))
+                detalle_id += 1
+
+            filas_ventas.append((
+                venta_id, cliente_id, self._fecha(), total, estados.una(), metodos.una(),
+                direccion if rng.random() < 0.6 else None,
+            ))
+            venta_id += 1
+
+            if len(filas_ventas) >= self.lote:
+                # Las ventas primero: los detalles las referencian
+                escritor_ventas.escribir(filas_ventas)
+                escritor_detalles.escribir(filas_detalles)
+                filas_ventas, filas_detalles = [], []
+        escritor_ventas.escribir(filas_ventas)
+        escritor_detalles.escribir(filas_detalles)
+        _reiniciar_secuencia(Venta)
+        _reiniciar_secuencia(DetalleVenta)
+        self._informar('ventas', escritor_ventas.filas_escritas, desde)
+        self._informar('detalles de venta', escritor_detalles.filas_escritas, desde)
+
+    # ------------------------------------------------------------------
+    # Notificaciones y bitácora
+    # ------------------------------------------------------------------
+
+    def _generar_notificaciones(self, clientes):
+        if not clientes:
+            return
+        desde = time.monotonic()
+        rng = self.rng
+        tipos = Distribucion(rng, [(n[:4], n[4]) for n in NOTIFICACIONES])
+        escritor = EscritorTabla(Notificacion, [
+            'id_notificacion', 'titulo', 'mensaje', 'tipo', 'prioridad', 'fecha_envio', 'leido', 'id_usuario',
+        ])
+        notificacion_id = _siguiente_id(Notificacion)
+        filas = []
+        for _ in range(self.volumenes['notificaciones']):
+            tipo, titulo, mensaje, prioridad = tipos.una()
+            filas.append((
+                notificacion_id, titulo, mensaje, tipo, prioridad, self._fecha(),
+                rng.random() < 0.6, rng.choice(clientes)[0],
+            ))
+            notificacion_id += 1
+            if len(filas) >= self.lote:
+                escritor.escribir(filas)
+                filas = []
+        escritor.escribir(filas)
+        _reiniciar_secuencia(Notificacion)
+        self._informar('notificaciones', escritor.filas_escritas, desde)
+
+    def _generar_bitacora(self, clientes):
+        if not clientes:
+            return
+        desde = time.monotonic()
+        rng = self.rng
+        acciones = Distribucion(rng, [(a[:3], a[3]) for a in ACCIONES_BITACORA])
+        escritor = EscritorTabla(Bitacora, [
+            'id_bitacora', 'fecha', 'ip', 'accion', 'modulo', 'descripcion', 'id_usuario',
+        ])
+        bitacora_id = _siguiente_id(Bitacora)
+        filas = []
+        for _ in range(self.volumenes['bitacora']):
+            accion, modulo, descripcion = acciones.una()
+            ip = f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}'
+            filas.append((
+                bitacora_id, self._fecha(), ip, accion, modulo, descripcion, rng.choice(clientes)[0],
+            ))
+            bitacora_id += 1
+            if len(filas) >= self.lote:
+                escritor.escribir(filas)
+                filas = []
+        escritor.escribir(filas)
+        _reiniciar_secuencia(Bitacora)
+        self._informar('bitácora', escritor.filas_escritas, desde)
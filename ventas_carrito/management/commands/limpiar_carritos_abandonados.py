@@ -0,0 +1,38 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ventas_carrito.carrito import eliminar_carritos_abandonados
+
+
+class Command(BaseCommand):
+    help = 'Elimina en lotes los carritos de visitantes sin actividad (úsese desde cron o en bucle con --intervalo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None,
+                            help='Días sin actividad (por defecto CARRITO_ABANDONADO_DIAS)')
+        parser.add_argument('--lote', type=int, default=500, help='Carritos eliminados por transacción')
+        parser.add_argument('--pausa', type=float, default=0, help='Segundos de espera entre lotes')
+        parser.add_argument('--intervalo', type=int, default=0, help='Segundos entre pasadas; 0 = una sola pasada')
+
+    def handle(self, *args, **options):
+        dias = options['dias'] if options['dias'] is not None else getattr(settings, 'CARRITO_ABANDONADO_DIAS', 30)
+        if dias < 1:
+            raise CommandError('--dias debe ser mayor a 0')
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor a 0')
+
+        while True:
+            corte = timezone.now() - timedelta(days=dias)
+            inicio = time.monotonic()
+            carritos, lineas = eliminar_carritos_abandonados(corte, options['lote'], options['pausa'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Carritos eliminados: {carritos} | Líneas: {lineas} | '
+                f'Tiempo: {time.monotonic() - inicio:.2f}s | Corte: {corte:%Y-%m-%d %H:%M}'
+            ))
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
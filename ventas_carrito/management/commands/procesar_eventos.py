@@ -0,0 +1,11 @@
+from backend_smart.trabajos import ComandoCola
+from ventas_carrito.eventos import EVENTOS
+
+
+class Command(ComandoCola):
+    help = 'Ejecuta los eventos pendientes o fallidos de la bandeja de salida (úsese desde cron o en bucle con --intervalo)'
+    cola = EVENTOS
+    resumen = 'Eventos completados: {completados} | Fallidos: {fallidos}'
+
+    def describir(self, evento):
+        return f'Evento #{evento.id_evento} ({evento.tipo})'
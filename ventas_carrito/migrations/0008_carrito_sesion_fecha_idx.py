@@ -0,0 +1,18 @@
+# Índice parcial para encontrar los carritos de visitantes abandonados
+# (limpiar_carritos_abandonados) sin recorrer los carritos de clientes.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas_carrito', '0007_add_stripe_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carrito',
+            index=models.Index(condition=models.Q(('session_key__isnull', False)), fields=['fecha_actualizacion'], name='carrito_sesion_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Bandeja de salida de eventos posteriores a la venta (notificaciones y comprobantes)
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas_carrito', '0008_carrito_sesion_fecha_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoSalida',
+            fields=[
+                ('id_evento', models.AutoField(primary_key=True, serialize=False)),
+                ('tipo', models.CharField(choices=[('venta_notificar', 'Notificar nueva venta'), ('venta_comprobante', 'Generar comprobante')], max_length=30)),
+                ('datos', models.JSONField(default=dict)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('fallido', 'Fallido')], default='pendiente', max_length=20)),
+                ('intentos', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Evento de Salida',
+                'verbose_name_plural': 'Eventos de Salida',
+                'db_table': 'evento_salida',
+                'ordering': ['fecha_creacion'],
+                'indexes': [models.Index(fields=['estado', 'fecha_actualizacion'], name='evento_salida_estado_idx')],
+            },
+        ),
+    ]
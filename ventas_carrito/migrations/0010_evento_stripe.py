@@ -0,0 +1,37 @@
+# Webhook de Stripe: registro de eventos recibidos (una sola vez por evento),
+# tipo de evento de salida para confirmar pagos e índice por PaymentIntent
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas_carrito', '0009_eventosalida'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoStripe',
+            fields=[
+                ('id_evento_stripe', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('tipo', models.CharField(max_length=100)),
+                ('fecha_recepcion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Evento de Stripe',
+                'verbose_name_plural': 'Eventos de Stripe',
+                'db_table': 'evento_stripe',
+            },
+        ),
+        migrations.AlterField(
+            model_name='eventosalida',
+            name='tipo',
+            field=models.CharField(choices=[('venta_notificar', 'Notificar nueva venta'), ('venta_comprobante', 'Generar comprobante'), ('pago_stripe', 'Confirmar pago Stripe')], max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='pagoonline',
+            name='stripe_payment_intent_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Alertas de stock bajo a través de la bandeja de salida
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas_carrito', '0010_evento_stripe'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eventosalida',
+            name='tipo',
+            field=models.CharField(choices=[('venta_notificar', 'Notificar nueva venta'), ('venta_comprobante', 'Generar comprobante'), ('pago_stripe', 'Confirmar pago Stripe'), ('stock_bajo', 'Alerta de stock bajo')], max_length=30),
+        ),
+    ]
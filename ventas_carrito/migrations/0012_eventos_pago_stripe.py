@@ -0,0 +1,19 @@
+# Pagos de Stripe fallidos o cancelados y pagos cobrados sin stock a través
+# de la bandeja de salida
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas_carrito', '0011_evento_stock_bajo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eventosalida',
+            name='tipo',
+            field=models.CharField(choices=[('venta_notificar', 'Notificar nueva venta'), ('venta_comprobante', 'Generar comprobante'), ('pago_stripe', 'Confirmar pago Stripe'), ('pago_stripe_fallido', 'Registrar pago Stripe fallido'), ('pago_sin_stock', 'Avisar pago sin stock'), ('stock_bajo', 'Alerta de stock bajo')], max_length=30),
+        ),
+    ]
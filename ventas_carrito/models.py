@@ -15,6 +15,13 @@ class Carrito(models.Model):
         db_table = 'carrito'
         verbose_name = 'Carrito de Compras'
         verbose_name_plural = 'Carritos de Compras'
+        indexes = [
+            # Parcial: solo carritos de visitantes, para buscar los abandonados
+            models.Index(
+                fields=['fecha_actualizacion'], name='carrito_sesion_fecha_idx',
+                condition=models.Q(session_key__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         if self.cliente:
@@ -22,11 +29,12 @@ class Carrito(models.Model):
         return f"Carrito (sesión: {self.session_key[:5]}...)"
 
     def get_total_items(self):
-        return self.items.aggregate(total_cantidad=models.Sum('cantidad'))['total_cantidad'] or 0
+        from .carrito import totales_carrito
+        return totales_carrito(self.id_carrito)['total_items']
 
     def get_total_precio(self):
-        total = sum(item.get_subtotal() for item in self.items.all())
-        return total
+        from .carrito import totales_carrito
+        return totales_carrito(self.id_carrito)['total_precio']
 
 class ItemCarrito(models.Model):
     id_item = models.AutoField(primary_key=True)
@@ -122,7 +130,7 @@ class PagoOnline(models.Model):
     datos_tarjeta_hash = models.CharField(max_length=255, blank=True, null=True)  # Hash de últimos 4 dígitos (seguridad)
     # Campos para Stripe
     stripe_session_id = models.CharField(max_length=255, blank=True, null=True, unique=True)  # ID de sesión de Stripe
-    stripe_payment_intent_id = models.CharField(max_length=255, blank=True, null=True)  # ID de PaymentIntent de Stripe
+    stripe_payment_intent_id = models.CharField(max_length=255, blank=True, null=True, db_index=True)  # ID de PaymentIntent de Stripe
     
     class Meta:
         db_table = 'pago_online'
@@ -187,4 +195,61 @@ class VentaHistorico(models.Model):
     
     def __str__(self):
         cat = self.categoria.nombre if self.categoria else "General"
-        return f"Historial {self.fecha} - {cat} - {self.ventas_count} ventas - ${self.monto_total}"
\ No newline at end of file
+        return f"Historial {self.fecha} - {cat} - {self.ventas_count} ventas - ${self.monto_total}"
+
+class EventoSalida(models.Model):
+    """
+    Bandeja de salida: efecto secundario de una venta (notificación, comprobante,
+    alerta de stock) registrado en la misma transacción y ejecutado después por un worker
+    """
+    TIPOS_EVENTO = [
+        ('venta_notificar', 'Notificar nueva venta'),
+        ('venta_comprobante', 'Generar comprobante'),
+        ('pago_stripe', 'Confirmar pago Stripe'),
+        ('pago_stripe_fallido', 'Registrar pago Stripe fallido'),
+        ('pago_sin_stock', 'Avisar pago sin stock'),
+        ('stock_bajo', 'Alerta de stock bajo'),
+    ]
+
+    ESTADOS_EVENTO = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completado', 'Completado'),
+        ('fallido', 'Fallido'),
+    ]
+
+    id_evento = models.AutoField(primary_key=True)
+    tipo = models.CharField(max_length=30, choices=TIPOS_EVENTO)
+    datos = models.JSONField(default=dict)  # Por ejemplo {'venta_id': 15}
+    estado = models.CharField(max_length=20, choices=ESTADOS_EVENTO, default='pendiente')
+    intentos = models.IntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'evento_salida'
+        verbose_name = 'Evento de Salida'
+        verbose_name_plural = 'Eventos de Salida'
+        ordering = ['fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_actualizacion'], name='evento_salida_estado_idx'),
+        ]
+
+    def __str__(self):
+        return f"Evento #{self.id_evento} - {self.tipo} - {self.estado}"
+
+
+class EventoStripe(models.Model):
+    """Evento de webhook de Stripe ya recibido: evita procesar dos veces la misma entrega"""
+    id_evento_stripe = models.CharField(max_length=255, primary_key=True)  # evt_... de Stripe
+    tipo = models.CharField(max_length=100)
+    fecha_recepcion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'evento_stripe'
+        verbose_name = 'Evento de Stripe'
+        verbose_name_plural = 'Eventos de Stripe'
+
+    def __str__(self):
+        return f"{self.id_evento_stripe} - {self.tipo}"
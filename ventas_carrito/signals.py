@@ -0,0 +1,19 @@
+"""
+Señales del carrito: agregar o cambiar una línea actualiza
+`Carrito.fecha_actualizacion`, la fecha que usa limpiar_carritos_abandonados
+para decidir qué carritos eliminar.
+Solo post_save: sin receptores de borrado, Django sigue eliminando las
+líneas de un carrito en bloque (cascada rápida, sin cargarlas).
+Las operaciones masivas (QuerySet.update, bulk_create, SQL directo) no
+emiten señales.
+"""
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Carrito, ItemCarrito
+
+
+@receiver(post_save, sender=ItemCarrito)
+def carrito_modificado(sender, instance, **kwargs):
+    Carrito.objects.filter(id_carrito=instance.carrito_id).update(fecha_actualizacion=timezone.now())
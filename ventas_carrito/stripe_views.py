@@ -1,6 +1,11 @@
 """
 Vistas para integración con Stripe Payment Intents (pago en la misma página)
 Permite crear Payment Intents y confirmar pagos desde el frontend usando Stripe Elements
+
+El pago se confirma con el webhook firmado de Stripe (StripeWebhookView): cada
+evento se registra una sola vez y la confirmación (venta, stock, carrito) se
+ejecuta desde la bandeja de salida. VerifyPaymentIntentView solo consulta a
+Stripe si el webhook todavía no confirmó el pago.
 """
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -21,16 +26,18 @@ except ImportError:
     stripe = None
     STRIPE_AVAILABLE = False
 
-from .models import Venta, PagoOnline, MetodoPago, Carrito, ItemCarrito, DetalleVenta, Comprobante
+from .models import Venta, PagoOnline, MetodoPago, Carrito, DetalleVenta, Comprobante, EventoStripe
 from autenticacion_usuarios.models import Usuario, Cliente, Bitacora
-from productos.models import Stock
-from .comprobantes_views import ComprobanteView
+from productos.inventario import reservar_stock, mensaje_stock_insuficiente, StockInsuficiente
+from .carrito import resumen_carrito, persistir_carrito_anonimo
+from .eventos import registrar_evento
 
 logger = logging.getLogger(__name__)
 
 # Configurar Stripe con la clave secreta desde variables de entorno
 if STRIPE_AVAILABLE:
     stripe.api_key = getattr(settings, 'STRIPE_SECRET_KEY', '')
+    stripe.api_base = getattr(settings, 'STRIPE_API_BASE', stripe.api_base)
 else:
     logger.warning("Stripe no está instalado. Las funcionalidades de pago con Stripe no estarán disponibles.")
 
@@ -45,6 +52,57 @@ def _get_client_ip(request):
     return ip
 
 
+def confirmar_pago_stripe(pago_online, ip=None):
+    """
+    Pago exitoso en Stripe: marcar el PagoOnline, completar la venta, descontar
+    el stock, limpiar el carrito y registrar la bitácora en una transacción.
+    La venta se completa una sola vez (UPDATE condicional sobre su estado), así
+    que repetir la confirmación (webhook reenviado, verificación del cliente)
+    no vuelve a descontar nada. Devuelve True si esta llamada la completó.
+    Lanza StockInsuficiente si no hay stock: el pago queda exitoso, la venta
+    pendiente de revisión/reembolso y, la primera vez, se registra el evento
+    'pago_sin_stock' que avisa a los administradores.
+    """
+    venta = pago_online.venta
+    try:
+        with transaction.atomic():
+            PagoOnline.objects.filter(id_pago=pago_online.id_pago).update(estado='exitoso')
+            completada = Venta.objects.filter(
+                id_venta=venta.id_venta
+            ).exclude(estado='completada').update(estado='completada', metodo_pago='stripe')
+            
+            if completada:
+                reservar_stock(
+                    list(venta.detalles.values_list('producto_id', 'cantidad')),
+                    referencia=f'venta:{venta.id_venta}'
+                )
+                
+                # Limpiar carrito (las líneas se borran en cascada)
+                Carrito.objects.filter(cliente_id=venta.cliente_id, activo=True).delete()
+                
+                Bitacora.objects.create(
+                    id_usuario_id=venta.cliente_id,
+                    accion='STRIPE_PAYMENT_SUCCEEDED',
+                    modulo='VENTAS',
+                    descripcion=f'Pago Stripe exitoso para venta #{venta.id_venta}',
+                    ip=ip
+                )
+                
+                # CU12: el comprobante se genera desde la bandeja de salida
+                registrar_evento('venta_comprobante', venta_id=venta.id_venta)
+    except StockInsuficiente as e:
+        with transaction.atomic():
+            # Solo al detectarlo por primera vez: una nueva confirmación no repite el aviso
+            if PagoOnline.objects.filter(id_pago=pago_online.id_pago).exclude(estado='exitoso').update(estado='exitoso'):
+                registrar_evento('pago_sin_stock', venta_id=venta.id_venta, motivo=str(e))
+        logger.error(f"Pago {pago_online.stripe_payment_intent_id} cobrado sin stock suficiente para venta #{venta.id_venta}: {str(e)}")
+        raise
+    
+    if completada:
+        logger.info(f"✅ PagoOnline #{pago_online.id_pago} y Venta #{venta.id_venta} confirmados exitosamente")
+    return bool(completada)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class GetStripePublishableKeyView(View):
     """
@@ -121,12 +179,17 @@ class CreatePaymentIntentView(View):
                     'message': 'Cliente no encontrado'
                 }, status=404)
             
+            # Si quedó un carrito de visitante en la caché, pasarlo a la BD
+            persistir_carrito_anonimo(request.session.session_key, cliente)
+            
             # Obtener carrito del cliente
             try:
                 carrito = Carrito.objects.get(cliente=cliente, activo=True)
-                items_carrito = ItemCarrito.objects.filter(carrito=carrito)
+                # Líneas, stock y total del carrito en una sola consulta
+                resumen = resumen_carrito(carrito.id_carrito)
+                items_carrito = resumen['items']
                 
-                if not items_carrito.exists():
+                if not items_carrito:
                     return JsonResponse({
                         'success': False,
                         'message': 'El carrito está vacío'
@@ -137,8 +200,7 @@ class CreatePaymentIntentView(View):
                     'message': 'No hay productos en el carrito'
                 }, status=400)
             
-            # Calcular total
-            total = sum(item.get_subtotal() for item in items_carrito)
+            total = resumen['total_precio']
             
             if total <= 0:
                 return JsonResponse({
@@ -146,26 +208,14 @@ class CreatePaymentIntentView(View):
                     'message': 'El total debe ser mayor a 0'
                 }, status=400)
             
-            # Verificar stock antes de crear la venta
-            productos_sin_stock = []
-            for item in items_carrito.select_related('producto'):
-                stock_obj = Stock.objects.filter(producto=item.producto).first()
-                stock_disponible = stock_obj.cantidad if stock_obj else 0
-                
-                if stock_disponible < item.cantidad:
-                    productos_sin_stock.append({
-                        'producto': item.producto.nombre,
-                        'solicitado': item.cantidad,
-                        'disponible': stock_disponible
-                    })
+            # Verificar stock antes de crear la venta (se descuenta al confirmar el pago)
+            productos_sin_stock = resumen['faltantes']
             
             if productos_sin_stock:
-                mensaje = 'Stock insuficiente para los siguientes productos: '
-                mensaje += ', '.join([f"{p['producto']} (solicitado: {p['solicitado']}, disponible: {p['disponible']})" 
-                                    for p in productos_sin_stock])
                 return JsonResponse({
                     'success': False,
-                    'message': mensaje
+                    'message': mensaje_stock_insuficiente(productos_sin_stock),
+                    'productos_sin_stock': productos_sin_stock
                 }, status=400)
             
             # Crear venta y detalles en una transacción
@@ -179,21 +229,17 @@ class CreatePaymentIntentView(View):
                     notas=notas
                 )
                 
-                # Crear detalles de venta
-                for item in items_carrito.select_related('producto'):
-                    DetalleVenta.objects.create(
+                # Crear detalles de venta (bulk_create no llama a save(): el subtotal ya viene de la consulta del carrito)
+                DetalleVenta.objects.bulk_create([
+                    DetalleVenta(
                         venta=venta,
-                        producto=item.producto,
-                        cantidad=item.cantidad,
-                        precio_unitario=item.precio_unitario
+                        producto_id=item['producto_id'],
+                        cantidad=item['cantidad'],
+                        precio_unitario=item['precio_unitario'],
+                        subtotal=item['subtotal']
                     )
-            
-            # Notificar a administradores sobre nueva venta
-            try:
-                from autenticacion_usuarios.notificaciones_views import notificar_nueva_venta
-                notificar_nueva_venta(venta)
-            except Exception as e:
-                logger.warning(f"Error notificando nueva venta: {str(e)}")
+                    for item in items_carrito
+                ])
             
             # Obtener o crear método de pago Stripe
             metodo_pago, _ = MetodoPago.objects.get_or_create(nombre='Stripe')
@@ -224,14 +270,19 @@ class CreatePaymentIntentView(View):
                 }, status=400)
             
             # Crear registro de PagoOnline
-            pago_online = PagoOnline.objects.create(
-                venta=venta,
-                monto=total,
-                estado='pendiente',
-                metodo_pago=metodo_pago,
-                stripe_payment_intent_id=payment_intent.id,
-                referencia=f"STRIPE-{timezone.now().strftime('%Y%m%d')}-{payment_intent.id[:8]}"
-            )
+            with transaction.atomic():
+                pago_online = PagoOnline.objects.create(
+                    venta=venta,
+                    monto=total,
+                    estado='pendiente',
+                    metodo_pago=metodo_pago,
+                    stripe_payment_intent_id=payment_intent.id,
+                    referencia=f"STRIPE-{timezone.now().strftime('%Y%m%d')}-{payment_intent.id[:8]}"
+                )
+                
+                # Notificar a administradores desde la bandeja de salida (solo si la venta sigue en pie:
+                # si Stripe falla arriba, la venta se elimina); el comprobante se genera al confirmar el pago
+                registrar_evento('venta_notificar', venta_id=venta.id_venta)
             
             # Registrar en bitácora
             try:
@@ -275,6 +326,8 @@ class VerifyPaymentIntentView(View):
     Verifica el estado de un PaymentIntent y actualiza el registro de PagoOnline.
     POST /api/ventas/stripe/verify-payment-intent/
     
+    Si el webhook ya confirmó el pago responde desde la BD, sin llamar a Stripe.
+    
     Requiere:
     - payment_intent_id: ID del PaymentIntent de Stripe
     
@@ -301,23 +354,11 @@ class VerifyPaymentIntentView(View):
                     'message': 'payment_intent_id es requerido'
                 }, status=400)
             
-            # Recuperar Payment Intent de Stripe
-            try:
-                payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
-            except stripe.error.StripeError as e:
-                logger.error(f"Error de Stripe al recuperar Payment Intent: {str(e)}")
-                return JsonResponse({
-                    'success': False,
-                    'message': f'Error al verificar pago: {str(e)}'
-                }, status=400)
-            
-            status_pi = payment_intent.status
-            logger.info(f"🔍 Verificando Payment Intent: {payment_intent_id}, Estado: {status_pi}")
-            
             # Buscar el pago por Payment Intent ID
-            try:
-                pago_online = PagoOnline.objects.get(stripe_payment_intent_id=payment_intent_id)
-            except PagoOnline.DoesNotExist:
+            pago_online = PagoOnline.objects.select_related('venta').filter(
+                stripe_payment_intent_id=payment_intent_id
+            ).first()
+            if pago_online is None:
                 logger.error(f"❌ No se encontró el PagoOnline con Payment Intent: {payment_intent_id}")
                 return JsonResponse({
                     'success': False,
@@ -327,81 +368,35 @@ class VerifyPaymentIntentView(View):
             
             venta = pago_online.venta
             
+            if pago_online.estado == 'exitoso' and venta.estado == 'completada':
+                # Ya confirmado por el webhook
+                status_pi = 'succeeded'
+            else:
+                # El webhook todavía no llegó: consultar a Stripe
+                try:
+                    payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+                except stripe.error.StripeError as e:
+                    logger.error(f"Error de Stripe al recuperar Payment Intent: {str(e)}")
+                    return JsonResponse({
+                        'success': False,
+                        'message': f'Error al verificar pago: {str(e)}'
+                    }, status=400)
+                status_pi = payment_intent.status
+                logger.info(f"🔍 Verificando Payment Intent: {payment_intent_id}, Estado: {status_pi}")
+            
             # Si el pago fue exitoso en Stripe, actualizar el registro
             if status_pi == 'succeeded':
-                comprobante_data = None
-                
-                with transaction.atomic():
-                    pago_online.estado = 'exitoso'
-                    pago_online.save(update_fields=['estado'])
-                    
-                    # Actualizar estado de la venta
-                    venta.estado = 'completada'
-                    venta.metodo_pago = 'stripe'
-                    venta.save(update_fields=['estado', 'metodo_pago'])
-                    
-                    # Actualizar stock
-                    for detalle in venta.detalles.all():
-                        stock_obj = Stock.objects.filter(producto=detalle.producto).first()
-                        if stock_obj:
-                            stock_obj.cantidad -= detalle.cantidad
-                            if stock_obj.cantidad < 0:
-                                stock_obj.cantidad = 0
-                            stock_obj.save()
-                    
-                    # Limpiar carrito
-                    try:
-                        carrito = Carrito.objects.get(cliente=venta.cliente, activo=True)
-                        carrito.items.all().delete()
-                        carrito.delete()
-                    except Carrito.DoesNotExist:
-                        pass
-                
-                # CU12: Generar comprobante automáticamente después de pago exitoso
-                try:
-                    comprobante_view = ComprobanteView()
-                    # Verificar si ya existe comprobante
-                    if hasattr(venta, 'comprobante'):
-                        comprobante = venta.comprobante
-                        # Regenerar PDF si ya existe
-                        try:
-                            pdf_path = comprobante_view._generar_pdf(comprobante, venta)
-                            comprobante.pdf_ruta = pdf_path
-                            comprobante.save()
-                        except Exception as e:
-                            logger.warning(f"Error al regenerar PDF del comprobante: {str(e)}")
-                    else:
-                        # Crear nuevo comprobante
-                        comprobante = comprobante_view._generar_comprobante(venta, 'factura')
-                    
-                    comprobante_data = {
-                        'id': comprobante.id_comprobante,
-                        'numero': comprobante.nro,
-                        'tipo': comprobante.tipo,
-                        'fecha': comprobante.fecha_emision.isoformat(),
-                        'pdf_url': f'/api/ventas/comprobantes/{venta.id_venta}/pdf/'
-                    }
-                    logger.info(f"✅ Comprobante #{comprobante.nro} generado automáticamente para venta #{venta.id_venta}")
-                except Exception as e:
-                    logger.error(f"Error al generar comprobante automático: {str(e)}", exc_info=True)
-                    # No fallar la venta si el comprobante falla, pero registrar el error
-                
-                # Registrar en bitácora
                 try:
-                    user_id = request.session.get('user_id')
-                    if user_id:
-                        usuario = Usuario.objects.get(id=user_id)
-                        Bitacora.objects.create(
-                            id_usuario=usuario,
-                            accion='STRIPE_PAYMENT_SUCCEEDED',
-                            modulo='VENTAS',
-                            descripcion=f'Pago Stripe exitoso para venta #{venta.id_venta}',
-                            ip=_get_client_ip(request)
-                        )
-                except Exception as e:
-                    logger.warning(f"Error al registrar en bitácora: {str(e)}")
-                
-                logger.info(f"✅ PagoOnline #{pago_online.id_pago} y Venta #{venta.id_venta} confirmados exitosamente")
+                    confirmar_pago_stripe(pago_online, ip=_get_client_ip(request))
+                except StockInsuficiente as e:
+                    return JsonResponse({
+                        'success': False,
+                        'status': status_pi,
+                        'pago_online_id': pago_online.id_pago,
+                        'venta_id': venta.id_venta,
+                        'message': f'Pago recibido, pero {str(e)}. La venta queda pendiente de revisión.',
+                        'productos_sin_stock': e.faltantes
+                    }, status=409)
                 
                 response_data = {
                     'success': True,
@@ -411,9 +406,21 @@ class VerifyPaymentIntentView(View):
                     'message': 'Pago confirmado exitosamente'
                 }
                 
-                # Agregar información del comprobante si se generó exitosamente
-                if comprobante_data:
-                    response_data['comprobante'] = comprobante_data
+                # CU12: el comprobante se genera en segundo plano; informar si ya está
+                comprobante = Comprobante.objects.filter(venta_id=venta.id_venta).first()
+                if comprobante:
+                    response_data['comprobante'] = {
+                        'id': comprobante.id_comprobante,
+                        'numero': comprobante.nro,
+                        'tipo': comprobante.tipo,
+                        'fecha': comprobante.fecha_emision.isoformat(),
+                        'pdf_url': f'/api/ventas/comprobantes/{venta.id_venta}/pdf/'
+                    }
+                else:
+                    response_data['comprobante'] = {
+                        'estado': 'pendiente',
+                        'pdf_url': f'/api/ventas/comprobantes/{venta.id_venta}/pdf/'
+                    }
                 
                 return JsonResponse(response_data, status=200)
             
@@ -454,3 +461,77 @@ class VerifyPaymentIntentView(View):
                 'success': False,
                 'message': f'Error interno: {str(e)}'
             }, status=500)
+
+
+# Eventos de Stripe que cambian el estado de un pago; el resto se ignora
+EVENTOS_WEBHOOK = ['payment_intent.succeeded', 'payment_intent.payment_failed', 'payment_intent.canceled']
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class StripeWebhookView(View):
+    """
+    Recibe los eventos de Stripe firmados con STRIPE_WEBHOOK_SECRET.
+    POST /api/ventas/stripe/webhook/
+    
+    Cada evento se registra una sola vez (EventoStripe); los pagos exitosos y
+    los fallidos o cancelados se aplican desde la bandeja de salida, así la
+    respuesta a Stripe es inmediata.
+    """
+    
+    def post(self, request):
+        if not STRIPE_AVAILABLE:
+            return JsonResponse({
+                'success': False,
+                'message': 'Stripe no está disponible. Por favor, instale el módulo stripe.'
+            }, status=503)
+        
+        secreto = getattr(settings, 'STRIPE_WEBHOOK_SECRET', '')
+        if not secreto:
+            return JsonResponse({
+                'success': False,
+                'message': 'Webhook de Stripe no configurado'
+            }, status=503)
+        
+        try:
+            evento = stripe.Webhook.construct_event(
+                request.body, request.META.get('HTTP_STRIPE_SIGNATURE', ''), secreto
+            )
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'message': 'Payload inválido'
+            }, status=400)
+        except stripe.error.SignatureVerificationError:
+            logger.warning("Webhook de Stripe con firma inválida")
+            return JsonResponse({
+                'success': False,
+                'message': 'Firma inválida'
+            }, status=400)
+        
+        try:
+            tipo = evento['type']
+            if tipo not in EVENTOS_WEBHOOK:
+                return JsonResponse({'success': True, 'message': f'Evento {tipo} ignorado'}, status=200)
+            
+            payment_intent_id = evento['data']['object']['id']
+            with transaction.atomic():
+                # La clave primaria es el id del evento: una entrega repetida no se procesa
+                _, nuevo = EventoStripe.objects.get_or_create(id_evento_stripe=evento['id'], defaults={'tipo': tipo})
+                if nuevo:
+                    # Si el PagoOnline todavía no existe, el evento falla y se reintenta
+                    if tipo == 'payment_intent.succeeded':
+                        registrar_evento('pago_stripe', payment_intent_id=payment_intent_id)
+                    else:
+                        registrar_evento('pago_stripe_fallido', payment_intent_id=payment_intent_id)
+            
+            if not nuevo:
+                logger.info(f"Evento de Stripe {evento['id']} ya recibido")
+            return JsonResponse({'success': True, 'duplicado': not nuevo}, status=200)
+            
+        except Exception as e:
+            # Stripe reintenta las entregas que no responden 2xx
+            logger.error(f"Error en StripeWebhookView: {str(e)}", exc_info=True)
+            return JsonResponse({
+                'success': False,
+                'message': f'Error interno: {str(e)}'
+            }, status=500)
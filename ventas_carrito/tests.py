@@ -1,3 +1,354 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from autenticacion_usuarios.models import Rol, Usuario, Cliente
+from productos.models import Producto, Stock, CuponDescuento
+from .models import Carrito, ItemCarrito, Venta, DetalleVenta, PagoOnline, EventoSalida
+from .descuentos import CuponNoAplicable, aplicar_cupon
+from .carrito import _fusionar_orm, eliminar_carritos_abandonados, fusionar_lineas
+from .eventos import EVENTOS
+
+
+class CarritoVisitanteTest(TestCase):
+    """CU8: carritos de visitantes en la caché `carritos` (solo con Redis) o en la BD"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producto = Producto.objects.create(nombre='Plancha', precio=25)
+        Stock.objects.create(producto=cls.producto, cantidad=10)
+
+    def setUp(self):
+        caches['carritos'].clear()
+
+    def _agregar(self):
+        return self.client.post('/api/ventas/carrito/', json.dumps({'producto_id': self.producto.id, 'cantidad': 1}),
+                                content_type='application/json')
+
+    def test_sin_redis_usa_la_bd(self):
+        self.assertIn(self._agregar().status_code, (200, 201))
+        self.assertTrue(Carrito.objects.filter(session_key__isnull=False).exists())
+
+    @override_settings(CARRITO_ANONIMO_EN_CACHE=True)
+    def test_leer_no_crea_sesion(self):
+        respuesta = self.client.get('/api/ventas/carrito/')
+        self.assertEqual(respuesta.json()['data']['total_items'], 0)
+        self.assertFalse(Session.objects.exists())
+
+    @override_settings(CARRITO_ANONIMO_EN_CACHE=True)
+    def test_catalogo_no_desplaza_el_carrito(self):
+        self.assertIn(self._agregar().status_code, (200, 201))
+        self.assertFalse(Carrito.objects.exists())
+        # Más entradas que MAX_ENTRIES (300) de la caché por defecto
+        for i in range(400):
+            cache.set(f'autocompletado:{i}', i)
+        datos = self.client.get('/api/ventas/carrito/').json()['data']
+        self.assertEqual(datos['total_items'], 1)
+
+
+class FusionCarritosTest(TestCase):
+    """CU8: la fusión suma hasta el stock sin bajar lo que ya había en el carrito"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = Producto.objects.bulk_create([Producto(nombre=f'Producto {i}', precio=10) for i in range(6)])
+        # El último no tiene registro de stock
+        Stock.objects.bulk_create([
+            Stock(producto=producto, cantidad=cantidad) for producto, cantidad in zip(cls.productos, [5, 5, 3, 0, 5])
+        ])
+
+    def _fusionar(self, funcion):
+        carrito = Carrito.objects.create(session_key='destino')
+        a, b, c, d, e, f = self.productos
+        # b quedó por encima del stock actual: la fusión no lo reduce
+        ItemCarrito.objects.bulk_create([
+            ItemCarrito(carrito=carrito, producto=a, cantidad=3, precio_unitario=10),
+            ItemCarrito(carrito=carrito, producto=b, cantidad=6, precio_unitario=10),
+        ])
+        movidas = funcion(carrito.id_carrito, [
+            (a.id, 4, 10), (b.id, 1, 10), (c.id, 10, 10), (d.id, 2, 10), (e.id, 0, 10), (f.id, 1, 10),
+        ])
+        self.assertEqual(movidas, 3)
+        self.assertEqual(
+            dict(ItemCarrito.objects.filter(carrito=carrito).values_list('producto_id', 'cantidad')),
+            {a.id: 5, b.id: 6, c.id: 3},
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'INSERT ... ON CONFLICT de PostgreSQL')
+    def test_fusion_en_una_consulta(self):
+        def en_una_consulta(carrito_id, lineas):
+            with self.assertNumQueries(1):
+                return fusionar_lineas(carrito_id, lineas)
+        self._fusionar(en_una_consulta)
+
+    def test_fusion_orm(self):
+        self._fusionar(_fusionar_orm)
+
+
+class CarritosAbandonadosTest(TestCase):
+    """CU8: solo se eliminan los carritos de visitante sin actividad"""
+
+    def test_elimina_solo_visitantes_inactivos(self):
+        producto = Producto.objects.create(nombre='Tostadora', precio=30)
+        usuario = Usuario.objects.create(nombre='Cliente', email='c@ejemplo.test', contrasena='x',
+                                         id_rol=Rol.objects.create(nombre='Cliente'))
+        viejos = [_carrito(f'vieja{i}', [producto]) for i in range(3)]
+        reciente = _carrito('reciente', [producto])
+        del_cliente = Carrito.objects.create(cliente=Cliente.objects.create(id=usuario))
+        ItemCarrito.objects.create(carrito=del_cliente, producto=producto, cantidad=1, precio_unitario=30)
+
+        hace_un_mes = timezone.now() - timedelta(days=30)
+        Carrito.objects.exclude(pk=reciente.pk).update(fecha_actualizacion=hace_un_mes)
+
+        # Lotes de 2: la última pasada encuentra menos que el lote y termina
+        resultado = eliminar_carritos_abandonados(timezone.now() - timedelta(days=7), lote=2)
+        self.assertEqual(resultado, (3, 3))
+        self.assertFalse(Carrito.objects.filter(pk__in=[c.pk for c in viejos]).exists())
+        self.assertEqual(set(Carrito.objects.values_list('pk', flat=True)), {reciente.pk, del_cliente.pk})
+        self.assertEqual(ItemCarrito.objects.count(), 2)
+
+
+def _cupon(**datos):
+    ahora = timezone.now()
+    return CuponDescuento.objects.create(
+        codigo=datos.pop('codigo', 'PROMO10'), valor_descuento=Decimal('10'),
+        fecha_inicio=ahora - timedelta(days=1), fecha_fin=ahora + timedelta(days=1), **datos
+    )
+
+
+def _carrito(clave, productos):
+    carrito = Carrito.objects.create(session_key=clave)
+    ItemCarrito.objects.bulk_create([
+        ItemCarrito(carrito=carrito, producto=producto, cantidad=2, precio_unitario=producto.precio)
+        for producto in productos
+    ])
+    return carrito
+
+
+class CuponTest(TestCase):
+    """CU10: el cupón se canjea una vez por uso y los precios se escriben en una pasada"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = Producto.objects.bulk_create([
+            Producto(nombre=f'Producto {i:02d}', precio=Decimal('100.00') + i) for i in range(20)
+        ])
+
+    def test_un_solo_canje(self):
+        cupon = _cupon(usos_maximos=1)
+        primero = _carrito('a', self.productos[:2])
+        segundo = _carrito('b', self.productos[:2])
+
+        aplicar_cupon(primero.id_carrito, 'promo10')
+        with self.assertRaises(CuponNoAplicable):
+            aplicar_cupon(segundo.id_carrito, 'PROMO10')
+
+        cupon.refresh_from_db()
+        self.assertEqual(cupon.usos_actuales, 1)
+        self.assertEqual(
+            sorted(ItemCarrito.objects.filter(carrito=primero).values_list('precio_unitario', flat=True)),
+            [Decimal('90.00'), Decimal('90.90')],
+        )
+        # El segundo carrito conserva los precios de lista
+        self.assertEqual(
+            sorted(ItemCarrito.objects.filter(carrito=segundo).values_list('precio_unitario', flat=True)),
+            [Decimal('100.00'), Decimal('101.00')],
+        )
+
+    def _consultas(self, clave, productos):
+        carrito = _carrito(clave, productos)
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = aplicar_cupon(carrito.id_carrito, 'PROMO10')
+        self.assertEqual(resultado['items_actualizados'], len(productos))
+        return len(consultas)
+
+    def test_precios_en_una_pasada(self):
+        _cupon(usos_maximos=10)
+        self.assertEqual(self._consultas('dos', self.productos[:2]), self._consultas('veinte', self.productos))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'requiere bloqueos de fila reales (PostgreSQL)')
+class CuponConcurrenteTest(TransactionTestCase):
+    """CU10: compradores simultáneos no pasan del límite de usos"""
+
+    def test_no_supera_usos_maximos(self):
+        producto = Producto.objects.create(nombre='Parlante', precio=Decimal('50.00'))
+        cupon = _cupon(usos_maximos=3)
+        carritos = [_carrito(f's{i}', [producto]) for i in range(10)]
+        canjes, barrera = [], threading.Barrier(len(carritos))
+
+        def canjear(carrito_id):
+            try:
+                barrera.wait()
+                aplicar_cupon(carrito_id, 'PROMO10')
+                canjes.append(carrito_id)
+            except CuponNoAplicable:
+                pass
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=canjear, args=(c.id_carrito,)) for c in carritos]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        cupon.refresh_from_db()
+        self.assertEqual(len(canjes), 3)
+        self.assertEqual(cupon.usos_actuales, 3)
+        # Solo los carritos que canjearon quedaron con descuento
+        self.assertEqual(
+            set(ItemCarrito.objects.filter(precio_unitario__lt=producto.precio).values_list('carrito_id', flat=True)),
+            set(canjes),
+        )
+
+
+@skipUnless(connection.vendor == 'postgresql', 'el descuento en bloque de reservar_stock es propio de PostgreSQL')
+@override_settings(EVENTOS_WORKERS=0)
+class CheckoutConsultasTest(TestCase):
+    """
+    CU10: el checkout cuesta las mismas consultas con 1 o con 40 líneas.
+    En otros motores reservar_stock descuenta línea por línea y el total crece.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rol = Rol.objects.create(nombre='Cliente')
+        cls.productos = Producto.objects.bulk_create([
+            Producto(nombre=f'Producto {i:02d}', precio=Decimal('3.50') + i) for i in range(40)
+        ])
+        Stock.objects.bulk_create([Stock(producto=p, cantidad=100) for p in cls.productos])
+
+    def _consultas(self, lineas):
+        usuario = Usuario.objects.create(nombre='Cliente', email=f'cliente{lineas}@ejemplo.test', contrasena='x', id_rol=self.rol)
+        carrito = Carrito.objects.create(cliente=Cliente.objects.create(id=usuario))
+        ItemCarrito.objects.bulk_create([
+            ItemCarrito(carrito=carrito, producto=p, cantidad=2, precio_unitario=p.precio)
+            for p in self.productos[:lineas]
+        ])
+        sesion = self.client.session
+        sesion.update({'is_authenticated': True, 'user_id': usuario.id})
+        sesion.save()
+
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post('/api/ventas/checkout/', {'direccion_entrega': 'Calle 1'},
+                                         content_type='application/json')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(Venta.objects.get(cliente_id=usuario.id).detalles.count(), lineas)
+        return len(consultas)
+
+    def test_consultas_constantes(self):
+        self.assertEqual(self._consultas(1), self._consultas(40))
+        self.assertEqual(Stock.objects.get(producto=self.productos[0]).cantidad, 96)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_prueba', EVENTOS_WORKERS=0)
+class StripeWebhookTest(TestCase):
+    """Pagos de Stripe aplicados desde la bandeja de salida"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rol = Rol.objects.create(nombre='Administrador')
+        cls.admin = Usuario.objects.create(nombre='Admin', email='admin@ejemplo.test', contrasena='x', id_rol=rol)
+        cliente = Cliente.objects.create(id=Usuario.objects.create(
+            nombre='Cliente', email='cliente@ejemplo.test', contrasena='x', id_rol=Rol.objects.create(nombre='Cliente')
+        ))
+        cls.producto = Producto.objects.create(nombre='Horno', precio=Decimal('300.00'))
+        Stock.objects.create(producto=cls.producto, cantidad=0)
+        cls.venta = Venta.objects.create(cliente=cliente, total=Decimal('300.00'), metodo_pago='stripe')
+        DetalleVenta.objects.create(venta=cls.venta, producto=cls.producto, cantidad=1,
+                                    precio_unitario=Decimal('300.00'), subtotal=Decimal('300.00'))
+
+    def _webhook(self, evento_id, tipo, payment_intent_id):
+        cuerpo = json.dumps({'id': evento_id, 'object': 'event', 'type': tipo,
+                             'data': {'object': {'id': payment_intent_id, 'object': 'payment_intent'}}})
+        marca = int(time.time())
+        firma = hmac.new(b'whsec_prueba', f'{marca}.{cuerpo}'.encode(), hashlib.sha256).hexdigest()
+        return self.client.post('/api/ventas/stripe/webhook/', cuerpo, content_type='application/json',
+                                HTTP_STRIPE_SIGNATURE=f't={marca},v1={firma}')
+
+    def _pago(self, payment_intent_id):
+        return PagoOnline.objects.create(venta=self.venta, monto=self.venta.total, stripe_payment_intent_id=payment_intent_id)
+
+    def test_pago_fallido_antes_de_crear_el_pago(self):
+        self.assertEqual(self._webhook('evt_1', 'payment_intent.payment_failed', 'pi_1').status_code, 200)
+        evento = EventoSalida.objects.get(tipo='pago_stripe_fallido')
+        self.assertEqual(EVENTOS.procesar(evento.id_evento).estado, 'fallido')
+
+        pago = self._pago('pi_1')
+        self.assertEqual(EVENTOS.procesar(evento.id_evento).estado, 'completado')
+        pago.refresh_from_db()
+        self.assertEqual(pago.estado, 'fallido')
+
+    def test_pago_sin_stock_avisa_una_vez(self):
+        from autenticacion_usuarios.models import Notificacion
+        pago = self._pago('pi_2')
+        self._webhook('evt_2', 'payment_intent.succeeded', 'pi_2')
+        evento = EventoSalida.objects.get(tipo='pago_stripe')
+
+        procesado = EVENTOS.procesar(evento.id_evento)
+        self.assertEqual(procesado.estado, 'fallido')
+        self.assertIn('Horno', procesado.error)
+        pago.refresh_from_db()
+        self.venta.refresh_from_db()
+        self.assertEqual((pago.estado, self.venta.estado), ('exitoso', 'pendiente'))
+
+        # El reintento no repite el aviso
+        self.assertEqual(EVENTOS.procesar(evento.id_evento).estado, 'fallido')
+        aviso = EventoSalida.objects.get(tipo='pago_sin_stock')
+        self.assertEqual(EVENTOS.procesar(aviso.id_evento).estado, 'completado')
+        self.assertEqual(Notificacion.objects.filter(id_usuario=self.admin, prioridad='alta').count(), 1)
+
+        # Con el stock repuesto, el reintento completa la venta
+        Stock.objects.filter(producto=self.producto).update(cantidad=2)
+        self.assertEqual(EVENTOS.procesar(evento.id_evento).estado, 'completado')
+        self.venta.refresh_from_db()
+        self.assertEqual(self.venta.estado, 'completada')
+
+
+@override_settings(EVENTOS_WORKERS=0)
+class CrearPaymentIntentTest(TestCase):
+    """El aviso de la venta se registra solo si el PaymentIntent y el PagoOnline existen"""
+
+    def setUp(self):
+        usuario = Usuario.objects.create(nombre='Cliente', email='pi@ejemplo.test', contrasena='x',
+                                         id_rol=Rol.objects.create(nombre='Cliente'))
+        carrito = Carrito.objects.create(cliente=Cliente.objects.create(id=usuario))
+        producto = Producto.objects.create(nombre='Batidora', precio=Decimal('40.00'))
+        Stock.objects.create(producto=producto, cantidad=5)
+        ItemCarrito.objects.create(carrito=carrito, producto=producto, cantidad=1, precio_unitario=producto.precio)
+        sesion = self.client.session
+        sesion.update({'is_authenticated': True, 'user_id': usuario.id})
+        sesion.save()
+
+    def _crear(self):
+        return self.client.post('/api/ventas/stripe/create-payment-intent/', {'direccion_entrega': 'Calle 1'},
+                                content_type='application/json')
+
+    def test_error_de_stripe_no_deja_eventos(self):
+        import stripe
+        with mock.patch('stripe.PaymentIntent.create', side_effect=stripe.error.StripeError('caído')):
+            self.assertEqual(self._crear().status_code, 400)
+        self.assertFalse(Venta.objects.exists())
+        self.assertFalse(EventoSalida.objects.exists())
+
+    def test_pago_creado_registra_el_aviso(self):
+        intent = mock.Mock(id='pi_nuevo123', client_secret='secreto')
+        with mock.patch('stripe.PaymentIntent.create', return_value=intent):
+            self.assertEqual(self._crear().status_code, 201)
+        venta = Venta.objects.get()
+        self.assertEqual(PagoOnline.objects.get().venta, venta)
+        self.assertEqual(list(EventoSalida.objects.values_list('tipo', 'datos')),
+                         [('venta_notificar', {'venta_id': venta.id_venta})])
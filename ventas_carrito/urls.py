@@ -19,6 +19,7 @@ urlpatterns = [
     path('stripe/publishable-key/', stripe_views.GetStripePublishableKeyView.as_view(), name='stripe_publishable_key'),
     path('stripe/create-payment-intent/', stripe_views.CreatePaymentIntentView.as_view(), name='stripe_create_payment_intent'),
     path('stripe/verify-payment-intent/', stripe_views.VerifyPaymentIntentView.as_view(), name='stripe_verify_payment_intent'),
+    path('stripe/webhook/', stripe_views.StripeWebhookView.as_view(), name='stripe_webhook'),
     # CU12: Comprobantes
     path('comprobantes/', comprobantes_views.ComprobanteView.as_view(), name='comprobantes'),
     path('comprobantes/generar/', comprobantes_views.ComprobanteView.as_view(), name='generar_comprobante'),
@@ -5,9 +5,13 @@ from django.utils.decorators import method_decorator
 from django.contrib.sessions.models import Session
 import json
 import logging
+from decimal import Decimal, InvalidOperation
 
 from .models import Carrito, ItemCarrito, Venta, DetalleVenta
 from productos.models import Producto
+from productos.inventario import stock_disponible
+from .carrito import resumen_carrito, totales_carrito, serializar_item, carrito_anonimo, fusionar_carritos
+from .descuentos import aplicar_cupon, aplicar_porcentaje, CuponNoAplicable
 
 logger = logging.getLogger(__name__)
 
@@ -19,28 +23,21 @@ class CarritoView(View):
     def get(self, request):
         """Obtener el carrito del usuario"""
         try:
-            carrito = self._get_or_create_carrito(request)
-            
-            items = ItemCarrito.objects.filter(carrito=carrito).select_related('producto')
-            
+            anonimo = carrito_anonimo(request)
+            if anonimo is not None:
+                # Visitante: el carrito se lee de la caché, sin consultar la BD
+                resumen = anonimo.resumen()
+            else:
+                carrito = self._get_or_create_carrito(request)
+                # Líneas, productos, stock y totales en una sola consulta
+                resumen = resumen_carrito(carrito.id_carrito)
             data = {
-                'carrito_id': carrito.id_carrito,
-                'total_items': carrito.get_total_items(),
-                'total_precio': float(carrito.get_total_precio()),
-                'items': []
+                'carrito_id': resumen['carrito_id'],
+                'total_items': resumen['total_items'],
+                'total_precio': float(resumen['total_precio']),
+                'items': [serializar_item(item) for item in resumen['items']]
             }
             
-            for item in items:
-                data['items'].append({
-                    'id': item.id_item,
-                    'producto_id': item.producto.id,
-                    'producto_nombre': item.producto.nombre,
-                    'producto_imagen': item.producto.imagen,
-                    'cantidad': item.cantidad,
-                    'precio_unitario': float(item.precio_unitario),
-                    'subtotal': float(item.get_subtotal()),
-                })
-            
             return JsonResponse({
                 'success': True,
                 'data': data
@@ -67,7 +64,7 @@ class CarritoView(View):
                 }, status=400)
             
             try:
-                producto = Producto.objects.get(id=producto_id)
+                producto = Producto.objects.select_related('stock').get(id=producto_id)
             except Producto.DoesNotExist:
                 return JsonResponse({
                     'success': False,
@@ -81,14 +78,32 @@ class CarritoView(View):
                     'message': 'La cantidad debe ser mayor a 0'
                 }, status=400)
             
+            # Validar stock disponible
+            disponible = stock_disponible(producto)
+            
+            anonimo = carrito_anonimo(request, crear_sesion=True)
+            if anonimo is not None:
+                # Visitante: la línea se guarda en la caché
+                cantidad_total = anonimo.cantidad(producto.id) + cantidad
+                if cantidad_total > disponible:
+                    return JsonResponse({
+                        'success': False,
+                        'message': f'Stock insuficiente. Disponible: {disponible}, solicitado: {cantidad_total}'
+                    }, status=400)
+                nuevo = cantidad_total == cantidad
+                anonimo.fijar(producto, cantidad_total, disponible)
+                totales = anonimo.totales()
+                return JsonResponse({
+                    'success': True,
+                    'message': f"{producto.nombre} agregado al carrito" if nuevo else f"Se agregaron {cantidad} unidades más de {producto.nombre}",
+                    'carrito_id': None,
+                    'total_items': totales['total_items'],
+                    'total_precio': float(totales['total_precio'])
+                }, status=200)
+            
             # Obtener o crear carrito
             carrito = self._get_or_create_carrito(request)
             
-            # Validar stock disponible
-            from productos.models import Stock
-            stock_obj = Stock.objects.filter(producto=producto).first()
-            stock_disponible = stock_obj.cantidad if stock_obj else 0
-            
             # Calcular cantidad total que se intenta agregar
             cantidad_actual = 0
             item_existente = ItemCarrito.objects.filter(
@@ -100,10 +115,10 @@ class CarritoView(View):
             
             cantidad_total = cantidad_actual + cantidad
             
-            if cantidad_total > stock_disponible:
+            if cantidad_total > disponible:
                 return JsonResponse({
                     'success': False,
-                    'message': f'Stock insuficiente. Disponible: {stock_disponible}, solicitado: {cantidad_total}'
+                    'message': f'Stock insuficiente. Disponible: {disponible}, solicitado: {cantidad_total}'
                 }, status=400)
             
             # Verificar si el producto ya está en el carrito
@@ -122,15 +137,14 @@ class CarritoView(View):
                 )
                 mensaje = f"{producto.nombre} agregado al carrito"
             
-            # Recargar carrito para obtener total actualizado
-            carrito.refresh_from_db()
+            totales = totales_carrito(carrito.id_carrito)
             
             return JsonResponse({
                 'success': True,
                 'message': mensaje,
                 'carrito_id': carrito.id_carrito,
-                'total_items': carrito.get_total_items(),
-                'total_precio': float(carrito.get_total_precio())
+                'total_items': totales['total_items'],
+                'total_precio': float(totales['total_precio'])
             }, status=200)
             
         except json.JSONDecodeError:
@@ -158,8 +172,12 @@ class CarritoView(View):
                     'message': 'ID de item y cantidad requeridos'
                 }, status=400)
             
+            anonimo = carrito_anonimo(request)
+            if anonimo is not None:
+                return self._put_anonimo(anonimo, int(item_id), cantidad)
+            
             try:
-                item = ItemCarrito.objects.select_related('producto').get(id_item=item_id)
+                item = ItemCarrito.objects.select_related('producto__stock').get(id_item=item_id)
             except ItemCarrito.DoesNotExist:
                 return JsonResponse({
                     'success': False,
@@ -173,29 +191,26 @@ class CarritoView(View):
                 mensaje = f"{producto_nombre} eliminado del carrito"
             else:
                 # Validar stock disponible
-                from productos.models import Stock
-                stock_obj = Stock.objects.filter(producto=item.producto).first()
-                stock_disponible = stock_obj.cantidad if stock_obj else 0
+                disponible = stock_disponible(item.producto)
                 
-                if cantidad > stock_disponible:
+                if cantidad > disponible:
                     return JsonResponse({
                         'success': False,
-                        'message': f'Stock insuficiente. Disponible: {stock_disponible}, solicitado: {cantidad}'
+                        'message': f'Stock insuficiente. Disponible: {disponible}, solicitado: {cantidad}'
                     }, status=400)
                 
                 item.cantidad = cantidad
                 item.save()
                 mensaje = f"Cantidad de {item.producto.nombre} actualizada"
             
-            # Obtener carrito actualizado
-            carrito = item.carrito
-            carrito.refresh_from_db()
+            # Totales actualizados del carrito
+            totales = totales_carrito(item.carrito_id)
             
             return JsonResponse({
                 'success': True,
                 'message': mensaje,
-                'total_items': carrito.get_total_items(),
-                'total_precio': float(carrito.get_total_precio())
+                'total_items': totales['total_items'],
+                'total_precio': float(totales['total_precio'])
             }, status=200)
             
         except json.JSONDecodeError:
@@ -221,20 +236,37 @@ class CarritoView(View):
                     'message': 'ID de item requerido'
                 }, status=400)
             
+            anonimo = carrito_anonimo(request)
+            if anonimo is not None:
+                # Visitante: el id de la línea es el id del producto
+                linea = anonimo.quitar(int(item_id))
+                if linea is None:
+                    return JsonResponse({
+                        'success': False,
+                        'message': 'Item no encontrado'
+                    }, status=404)
+                totales = anonimo.totales()
+                return JsonResponse({
+                    'success': True,
+                    'message': f"{linea['nombre']} eliminado del carrito",
+                    'total_items': totales['total_items'],
+                    'total_precio': float(totales['total_precio'])
+                }, status=200)
+            
             try:
-                item = ItemCarrito.objects.select_related('producto', 'carrito').get(id_item=item_id)
+                item = ItemCarrito.objects.select_related('producto').get(id_item=item_id)
                 producto_nombre = item.producto.nombre
-                carrito = item.carrito
+                carrito_id = item.carrito_id
                 item.delete()
                 
-                # Recargar carrito para obtener total actualizado
-                carrito.refresh_from_db()
+                # Totales actualizados del carrito
+                totales = totales_carrito(carrito_id)
                 
                 return JsonResponse({
                     'success': True,
                     'message': f"{producto_nombre} eliminado del carrito",
-                    'total_items': carrito.get_total_items(),
-                    'total_precio': float(carrito.get_total_precio())
+                    'total_items': totales['total_items'],
+                    'total_precio': float(totales['total_precio'])
                 }, status=200)
                 
             except ItemCarrito.DoesNotExist:
@@ -250,6 +282,45 @@ class CarritoView(View):
                 'message': f'Error al eliminar del carrito: {str(e)}'
             }, status=500)
 
+    def _put_anonimo(self, anonimo, producto_id, cantidad):
+        """Actualizar la cantidad de una línea del carrito de visitante (el id es el del producto)"""
+        if producto_id not in anonimo.lineas:
+            return JsonResponse({
+                'success': False,
+                'message': 'Item no encontrado'
+            }, status=404)
+        
+        if cantidad <= 0:
+            linea = anonimo.quitar(producto_id)
+            mensaje = f"{linea['nombre']} eliminado del carrito"
+        else:
+            try:
+                producto = Producto.objects.select_related('stock').get(id=producto_id)
+            except Producto.DoesNotExist:
+                anonimo.quitar(producto_id)
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Producto no encontrado'
+                }, status=404)
+            
+            disponible = stock_disponible(producto)
+            if cantidad > disponible:
+                return JsonResponse({
+                    'success': False,
+                    'message': f'Stock insuficiente. Disponible: {disponible}, solicitado: {cantidad}'
+                }, status=400)
+            
+            anonimo.fijar(producto, cantidad, disponible)
+            mensaje = f"Cantidad de {producto.nombre} actualizada"
+        
+        totales = anonimo.totales()
+        return JsonResponse({
+            'success': True,
+            'message': mensaje,
+            'total_items': totales['total_items'],
+            'total_precio': float(totales['total_precio'])
+        }, status=200)
+
     def _get_or_create_carrito(self, request):
         """Obtener o crear carrito para el usuario/sesión"""
         # Si el usuario está autenticado (usando sesión personalizada), usar su carrito
@@ -326,15 +397,18 @@ class CarritoManagementView(View):
 
     def _clear_carrito(self, request):
         """CU9: Limpiar completamente el carrito"""
-        carrito = self._get_or_create_carrito(request)
-        ItemCarrito.objects.filter(carrito=carrito).delete()
-        carrito.refresh_from_db()
+        anonimo = carrito_anonimo(request)
+        if anonimo is not None:
+            anonimo.vaciar()
+        else:
+            carrito = self._get_or_create_carrito(request)
+            ItemCarrito.objects.filter(carrito=carrito).delete()
         
         return JsonResponse({
             'success': True,
             'message': 'Carrito limpiado exitosamente',
-            'total_items': carrito.get_total_items(),
-            'total_precio': float(carrito.get_total_precio())
+            'total_items': 0,
+            'total_precio': 0.0
         }, status=200)
 
     def _merge_carritos(self, request, data):
@@ -347,37 +421,24 @@ class CarritoManagementView(View):
                 'message': 'ID de carrito origen requerido'
             }, status=400)
         
+        if carrito_anonimo(request) is not None:
+            # El carrito destino debe ser el del cliente (los de visitantes están en la caché)
+            return JsonResponse({
+                'success': False,
+                'message': 'Debe iniciar sesión para fusionar carritos'
+            }, status=401)
+        
         try:
             carrito_origen = Carrito.objects.get(id_carrito=carrito_origen_id)
             carrito_destino = self._get_or_create_carrito(request)
+            if carrito_origen.id_carrito == carrito_destino.id_carrito:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'El carrito origen y el destino son el mismo'
+                }, status=400)
             
-            # Mover items del carrito origen al destino
-            items_origen = ItemCarrito.objects.filter(carrito=carrito_origen)
-            items_movidos = 0
-            
-            for item in items_origen:
-                # Verificar si el producto ya existe en el carrito destino
-                item_existente = ItemCarrito.objects.filter(
-                    carrito=carrito_destino,
-                    producto=item.producto
-                ).first()
-                
-                if item_existente:
-                    # Sumar cantidades
-                    item_existente.cantidad += item.cantidad
-                    item_existente.save()
-                else:
-                    # Crear nuevo item
-                    ItemCarrito.objects.create(
-                        carrito=carrito_destino,
-                        producto=item.producto,
-                        cantidad=item.cantidad,
-                        precio_unitario=item.precio_unitario
-                    )
-                items_movidos += 1
-            
-            # Eliminar carrito origen
-            carrito_origen.delete()
+            # Un solo INSERT ... ON CONFLICT con las cantidades limitadas al stock
+            items_movidos = fusionar_carritos(carrito_origen.id_carrito, carrito_destino.id_carrito)
             
             return JsonResponse({
                 'success': True,
@@ -401,6 +462,19 @@ class CarritoManagementView(View):
                 'message': 'ID de item requerido'
             }, status=400)
         
+        anonimo = carrito_anonimo(request)
+        if anonimo is not None:
+            linea = anonimo.quitar(int(item_id))
+            if linea is None:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Item no encontrado'
+                }, status=404)
+            return JsonResponse({
+                'success': True,
+                'message': f"{linea['nombre']} guardado para más tarde"
+            }, status=200)
+        
         try:
             item = ItemCarrito.objects.get(id_item=item_id)
             # Por ahora solo eliminamos del carrito, en el futuro se podría guardar en una tabla de favoritos
@@ -429,92 +503,35 @@ class CarritoManagementView(View):
                 'message': 'Código de descuento o porcentaje requerido'
             }, status=400)
         
+        if carrito_anonimo(request) is not None:
+            # El cupón modifica precios y consume usos: requiere el carrito del cliente en la BD
+            return JsonResponse({
+                'success': False,
+                'message': 'Debe iniciar sesión para aplicar descuentos'
+            }, status=401)
+        
         carrito = self._get_or_create_carrito(request)
         
-        # Validar cupón desde la base de datos
+        # Validar y canjear el cupón (precios en una pasada, uso con UPDATE condicional)
         if codigo_descuento:
             try:
-                from productos.models import CuponDescuento
-                from django.utils import timezone
-                from decimal import Decimal
-                
-                cupon = CuponDescuento.objects.get(codigo=codigo_descuento.upper().strip())
-                ahora = timezone.now()
-                
-                # Validar que esté activo
-                if not cupon.esta_activo:
-                    return JsonResponse({
-                        'success': False,
-                        'message': 'El cupón no está activo o ha expirado'
-                    }, status=400)
-                
-                # Validar usos disponibles
-                if cupon.usos_actuales >= cupon.usos_maximos:
-                    return JsonResponse({
-                        'success': False,
-                        'message': 'El cupón ha alcanzado su límite de usos'
-                    }, status=400)
-                
-                # Calcular total del carrito
-                items = ItemCarrito.objects.filter(carrito=carrito)
-                total_carrito = sum(item.get_subtotal() for item in items)
-                
-                # Validar monto mínimo
-                if cupon.monto_minimo > 0 and total_carrito < float(cupon.monto_minimo):
-                    return JsonResponse({
-                        'success': False,
-                        'message': f'El cupón requiere un monto mínimo de Bs. {cupon.monto_minimo:.2f}'
-                    }, status=400)
-                
-                # Aplicar descuento según tipo
-                items_actualizados = 0
-                if cupon.tipo_descuento == 'porcentaje':
-                    porcentaje = float(cupon.valor_descuento)
-                    for item in items:
-                        precio_original = float(item.producto.precio)
-                        precio_descuento = precio_original * (1 - porcentaje / 100)
-                        item.precio_unitario = Decimal(str(precio_descuento))
-                        item.save()
-                        items_actualizados += 1
-                else:  # fijo (monto fijo)
-                    # Aplicar descuento fijo al total (distribuido proporcionalmente)
-                    descuento_total = float(cupon.valor_descuento)
-                    if descuento_total > total_carrito:
-                        descuento_total = total_carrito
-                    
-                    # Distribuir el descuento proporcionalmente
-                    for item in items:
-                        subtotal = float(item.get_subtotal())
-                        proporcion = subtotal / total_carrito if total_carrito > 0 else 0
-                        descuento_item = descuento_total * proporcion
-                        precio_original = float(item.producto.precio)
-                        precio_descuento = precio_original - (descuento_item / item.cantidad)
-                        if precio_descuento < 0:
-                            precio_descuento = 0
-                        item.precio_unitario = Decimal(str(precio_descuento))
-                        item.save()
-                        items_actualizados += 1
-                
-                # Incrementar usos del cupón
-                cupon.usos_actuales += 1
-                cupon.save()
+                resultado = aplicar_cupon(carrito.id_carrito, codigo_descuento)
+                cupon = resultado['cupon']
                 
                 return JsonResponse({
                     'success': True,
                     'message': f'Cupón "{cupon.codigo}" aplicado exitosamente',
-                    'descuento_aplicado': porcentaje if cupon.tipo_descuento == 'porcentaje' else descuento_total,
+                    'descuento_aplicado': float(resultado['descuento_aplicado']),
                     'tipo_descuento': cupon.tipo_descuento,
-                    'items_actualizados': items_actualizados
+                    'items_actualizados': resultado['items_actualizados']
                 }, status=200)
                 
-            except CuponDescuento.DoesNotExist:
+            except CuponNoAplicable as e:
                 return JsonResponse({
                     'success': False,
-                    'message': 'Código de descuento no válido'
-                }, status=404)
+                    'message': str(e)
+                }, status=e.status)
             except Exception as e:
-                import logging
-                logger = logging.getLogger(__name__)
                 logger.error(f"Error aplicando cupón: {str(e)}", exc_info=True)
                 return JsonResponse({
                     'success': False,
@@ -522,22 +539,23 @@ class CarritoManagementView(View):
                 }, status=500)
         
         # Si se proporciona porcentaje directo (sin código)
-        if porcentaje:
-            items = ItemCarrito.objects.filter(carrito=carrito)
-            items_actualizados = 0
-            
-            for item in items:
-                precio_original = float(item.producto.precio)
-                precio_descuento = precio_original * (1 - porcentaje / 100)
-                item.precio_unitario = Decimal(str(precio_descuento))
-                item.save()
-                items_actualizados += 1
-            
+        try:
+            porcentaje = Decimal(str(porcentaje))
+        except InvalidOperation:
+            porcentaje = None
+        if porcentaje is None or not 0 < porcentaje <= 100:
             return JsonResponse({
-                'success': True,
-                'message': f'Descuento del {porcentaje}% aplicado a {items_actualizados} items',
-                'descuento_aplicado': porcentaje
-            }, status=200)
+                'success': False,
+                'message': 'El porcentaje debe estar entre 0 y 100'
+            }, status=400)
+        
+        items_actualizados = aplicar_porcentaje(carrito.id_carrito, porcentaje)
+        
+        return JsonResponse({
+            'success': True,
+            'message': f'Descuento del {porcentaje}% aplicado a {items_actualizados} items',
+            'descuento_aplicado': float(porcentaje)
+        }, status=200)
 
     def _get_or_create_carrito(self, request):
         """Método auxiliar para obtener o crear carrito"""